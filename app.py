@@ -1,16 +1,35 @@
 import os
 from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_file
-from flask_mysqldb import MySQL
-import pandas as pd
+from db_pool import PooledMySQL
 from datetime import datetime, timedelta, date
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 import json
-import requests
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from flask import flash
 from werkzeug.utils import secure_filename
 import uuid
+import io
+import pickle
+from project_snapshot import load_project_snapshot
+from cost_engine import project_costs
+import cost_ledger
+from pagination import keyset_page
+from excel_export import write_project_workbook
+import jobs
+import bulk_import
+from report_cache import report_cache, project_version, bump_project_version
+from user_cache import get_cached_user, invalidate_user
+from weather import WeatherClient, WeatherError, GEO_URL, FORECAST_URL
+from weather_risk import weather_risks, upcoming_outdoor_tasks
+from task_tree import load_subtree, subtree_ids, add_to_closure, move_in_closure, delete_subtree
+from schedule import ScheduleError, compute_schedule, load_dependencies, project_schedule
+from worker_utilization import MAX_DAY_HOURS, overbookings, utilization, week_start, heat_level
+from resource_leveling import RESOURCE_TYPES, level_project
+from progress_rollup import apply_progress, rebuild_progress, progress_series
+from evm import project_evm
+from portfolio_summary import load_summary, mark_stale, refresh_summary, stale_projects, summary_evm
+from charts import CHARTS, chart_etag
 
 
 app = Flask(__name__)
@@ -28,8 +47,19 @@ app.config['MYSQL_USER'] = 'root'
 app.config['MYSQL_PASSWORD'] = 'root'
 app.config['MYSQL_DB'] = 'construction_project_management'
 app.config['MYSQL_CURSORCLASS'] = 'DictCursor'
+app.config['MYSQL_POOL_MIN'] = 2
+app.config['MYSQL_POOL_MAX'] = 10
+app.config['MYSQL_POOL_TIMEOUT'] = 5
+app.config['MYSQL_POOL_PING_INTERVAL'] = 30
 
-mysql = MySQL(app)
+mysql = PooledMySQL(app)
+
+# Weather service endpoints can be pointed at a local stub server
+app.config['WEATHER_GEO_URL'] = os.environ.get('WEATHER_GEO_URL', GEO_URL)
+app.config['WEATHER_FORECAST_URL'] = os.environ.get('WEATHER_FORECAST_URL', FORECAST_URL)
+weather_client = WeatherClient(WEATHER_API_KEY,
+                               geo_url=app.config['WEATHER_GEO_URL'],
+                               forecast_url=app.config['WEATHER_FORECAST_URL'])
 
 # User class for Flask-Login
 class User(UserMixin):
@@ -38,13 +68,17 @@ class User(UserMixin):
         self.username = username
         self.role = role
 
-# User loader callback
-@login_manager.user_loader
-def load_user(user_id):
+def fetch_user(user_id):
     cur = get_db_connection()
     cur.execute("SELECT user_id, username, role FROM users WHERE user_id = %s", (user_id,))
     user = cur.fetchone()
     cur.close()
+    return user
+
+# User loader callback
+@login_manager.user_loader
+def load_user(user_id):
+    user = get_cached_user(user_id, fetch_user)
     if user:
         return User(user['user_id'], user['username'], user['role'])
     return None
@@ -63,12 +97,24 @@ def login_required(f):
 
 def get_user_role():
     if 'user_id' in session:
-        cur = get_db_connection()
-        cur.execute("SELECT role FROM users WHERE user_id = %s", (session['user_id'],))
-        role = cur.fetchone()['role']
-        cur.close()
-        return role
+        # login() and register() already store the role in the session
+        if 'role' in session:
+            return session['role']
+        user = get_cached_user(session['user_id'], fetch_user)
+        return user['role'] if user else None
     return None
+
+def list_filters():
+    # Filter arguments of a paginated list, without the page cursor
+    return {k: v for k, v in request.args.items() if k != 'after' and v}
+
+def add_date_range(filters, params, column, args):
+    if args.get('date_from'):
+        filters.append(f"{column} >= %s")
+        params.append(args['date_from'])
+    if args.get('date_to'):
+        filters.append(f"{column} < %s + INTERVAL 1 DAY")
+        params.append(args['date_to'])
 @app.route('/expenditures/<int:expenditure_id>')
 @login_required
 def view_expenditure(expenditure_id):
@@ -117,25 +163,25 @@ def edit_expenditure(expenditure_id):
         category = request.form.get('category', 'Other')
         
         try:
+            # Get project_id for redirect and the old amount for the budget delta
+            cur.execute("SELECT project_id, amount FROM project_expenditures WHERE expenditure_id = %s", (expenditure_id,))
+            previous = cur.fetchone()
+            
+            if not previous:
+                flash('Expenditure not found', 'danger')
+                return redirect(url_for('projects'))
+            
+            project_id = previous['project_id']
+            
             cur.execute("""
                 UPDATE project_expenditures 
                 SET description = %s, amount = %s, expenditure_date = %s, category = %s
                 WHERE expenditure_id = %s
             """, (description, amount, expenditure_date, category, expenditure_id))
-            mysql.connection.commit()
-            
-            # Get project_id for redirect
-            cur.execute("SELECT project_id FROM project_expenditures WHERE expenditure_id = %s", (expenditure_id,))
-            project_id = cur.fetchone()['project_id']
             
             # Update project actual budget
-            cur.execute("""
-                UPDATE projects 
-                SET actual_budget = COALESCE((
-                    SELECT SUM(amount) FROM project_expenditures WHERE project_id = %s
-                ), 0)
-                WHERE project_id = %s
-            """, (project_id, project_id))
+            cost_ledger.apply_expenditure(cur, project_id, Decimal(amount) - previous['amount'])
+            bump_project_version(cur, project_id=project_id)
             mysql.connection.commit()
             
             flash('Expenditure updated successfully', 'success')
@@ -143,6 +189,7 @@ def edit_expenditure(expenditure_id):
         except Exception as e:
             mysql.connection.rollback()
             flash(f'Error updating expenditure: {str(e)}', 'danger')
+            return redirect(url_for('edit_expenditure', expenditure_id=expenditure_id))
         finally:
             cur.close()
     
@@ -169,7 +216,7 @@ def delete_expenditure(expenditure_id):
     
     try:
         # Get project_id before deletion for redirect
-        cur.execute("SELECT project_id FROM project_expenditures WHERE expenditure_id = %s", (expenditure_id,))
+        cur.execute("SELECT project_id, amount FROM project_expenditures WHERE expenditure_id = %s", (expenditure_id,))
         result = cur.fetchone()
         
         if not result:
@@ -180,16 +227,10 @@ def delete_expenditure(expenditure_id):
         
         # Delete expenditure
         cur.execute("DELETE FROM project_expenditures WHERE expenditure_id = %s", (expenditure_id,))
-        mysql.connection.commit()
         
         # Update project actual budget
-        cur.execute("""
-            UPDATE projects 
-            SET actual_budget = COALESCE((
-                SELECT SUM(amount) FROM project_expenditures WHERE project_id = %s
-            ), 0)
-            WHERE project_id = %s
-        """, (project_id, project_id))
+        cost_ledger.apply_expenditure(cur, project_id, -result['amount'])
+        bump_project_version(cur, project_id=project_id)
         mysql.connection.commit()
         
         flash('Expenditure deleted successfully', 'success')
@@ -256,7 +297,9 @@ def delete_task(task_id):
     
     try:
         # Get project_id before deletion for redirect
-        cur.execute("SELECT project_id FROM tasks WHERE task_id = %s", (task_id,))
+        cur.execute("""
+            SELECT project_id, planned_start_date, planned_end_date FROM tasks WHERE task_id = %s
+        """, (task_id,))
         result = cur.fetchone()
         
         if not result:
@@ -265,21 +308,15 @@ def delete_task(task_id):
         
         project_id = result['project_id']
         
-        # Delete task assignments
-        cur.execute("DELETE FROM task_assignments WHERE task_id = %s", (task_id,))
-        
-        # Delete task materials
-        cur.execute("DELETE FROM task_materials WHERE task_id = %s", (task_id,))
-        
-        # Delete daily progress
-        cur.execute("DELETE FROM daily_progress WHERE task_id = %s", (task_id,))
-        
-        # Delete subtasks first (if any)
-        cur.execute("DELETE FROM tasks WHERE parent_task_id = %s", (task_id,))
-        
-        # Delete the task itself
-        cur.execute("DELETE FROM tasks WHERE task_id = %s", (task_id,))
+        # Delete the task with every level of subtasks, and their assignments,
+        # materials, progress, ledger and closure rows
+        delete_subtree(cur, task_id)
+        rebuild_progress(cur, project_id)
         
+        bump_project_version(cur, project_id=project_id)
+        # Hand the freed workers and equipment to the tasks around it
+        level_project(cur, project_id, leveling_window(result['planned_start_date'],
+                                                       result['planned_end_date']))
         mysql.connection.commit()
         flash('Task deleted successfully', 'success')
     except Exception as e:
@@ -336,6 +373,7 @@ def register():
             """, (username, hashed_password, full_name, email, role))
             mysql.connection.commit()
             cur.close()
+            invalidate_user(cur.lastrowid)
             
             # Auto-login after registration
             session['user_id'] = cur.lastrowid
@@ -390,16 +428,9 @@ def add_expenditure(project_id):
                     VALUES (%s, %s)
                 """, (expenditure_id, document_id))
         
-        mysql.connection.commit()
-        
         # Update project actual budget
-        cur.execute("""
-            UPDATE projects 
-            SET actual_budget = COALESCE((
-                SELECT SUM(amount) FROM project_expenditures WHERE project_id = %s
-            ), 0)
-            WHERE project_id = %s
-        """, (project_id, project_id))
+        cost_ledger.apply_expenditure(cur, project_id, amount)
+        bump_project_version(cur, project_id=project_id)
         mysql.connection.commit()
         
         flash('Expenditure added successfully', 'success')
@@ -443,30 +474,20 @@ def dashboard():
     # Get project statistics
     cur = get_db_connection()
     
-    # Project counts by status
-    cur.execute("""
-        SELECT status, COUNT(*) as count 
-        FROM projects 
-        GROUP BY status
-    """)
-    project_status = cur.fetchall()
-    
-    # Task counts by status
-    cur.execute("""
-        SELECT status, COUNT(*) as count 
-        FROM tasks 
-        GROUP BY status
-    """)
-    task_status = cur.fetchall()
-    
-    # Recent projects
-    cur.execute("""
-        SELECT project_id, project_name, start_date, end_date, status 
-        FROM projects 
-        ORDER BY created_at DESC 
-        LIMIT 5
-    """)
-    recent_projects = cur.fetchall()
+    # Per-project costs, progress, risks and status counts all come from the
+    # materialized portfolio summary. portfolio_summary.py keeps it fresh in
+    # the background; rows it has not caught up with yet (task and cost writes
+    # since its last pass, the daily rebuild) are queued for the job pool
+    summary = load_summary(cur)
+    if stale_projects(cur) and not jobs.active_job('portfolio_summary', 0):
+        jobs.submit_job('portfolio_summary', 0)
+    status_counts = {}
+    for row in summary:
+        status_counts[row['status']] = status_counts.get(row['status'], 0) + 1
+    project_status = [{'status': status, 'count': count} for status, count in status_counts.items()]
+    task_status = [{'status': 'delayed', 'count': sum(row['delayed_tasks'] for row in summary)}]
+    recent_projects = sorted(summary, key=lambda row: row['created_at'], reverse=True)[:5]
+    refreshed_at = max((row['refreshed_at'] for row in summary), default=None)
     
     # Upcoming tasks
     cur.execute("""
@@ -485,21 +506,44 @@ def dashboard():
                          project_status=project_status,
                          task_status=task_status,
                          recent_projects=recent_projects,
-                         upcoming_tasks=upcoming_tasks)
+                         upcoming_tasks=upcoming_tasks,
+                         summary=summary,
+                         refreshed_at=refreshed_at)
+
+def projects_page(cur, args):
+    filters, params = [], []
+    if args.get('status'):
+        filters.append("p.status = %s")
+        params.append(args['status'])
+    add_date_range(filters, params, "p.start_date", args)
+    return keyset_page(cur, """
+        SELECT p.*, u.username as created_by_name 
+        FROM projects p
+        JOIN users u ON p.created_by = u.user_id
+    """, filters, params,
+        order=[('p.created_at', 'created_at'), ('p.project_id', 'project_id')],
+        after=args.get('after'))
 
 @app.route('/projects')
 @login_required
 def projects():
     cur = get_db_connection()
-    cur.execute("""
-        SELECT p.*, u.username as created_by_name 
-        FROM projects p
-        JOIN users u ON p.created_by = u.user_id
-        ORDER BY p.created_at DESC
-    """)
-    projects = cur.fetchall()
+    projects, next_cursor = projects_page(cur, request.args)
     cur.close()
-    return render_template('projects.html', projects=projects)
+    return render_template('projects.html', projects=projects,
+                           next_cursor=next_cursor, filters=list_filters())
+
+@app.route('/projects/data')
+@login_required
+def projects_data():
+    cur = get_db_connection()
+    projects, next_cursor = projects_page(cur, request.args)
+    cur.close()
+    return jsonify({
+        'items': projects,
+        'next_cursor': next_cursor,
+        'html': render_template('partials/projects_rows.html', projects=projects)
+    })
 
 @app.route('/projects/add', methods=['GET', 'POST'])
 @login_required
@@ -517,6 +561,11 @@ def add_project():
             INSERT INTO projects (project_name, description, start_date, end_date,location, estimated_budget, created_by)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
         """, (project_name, description, start_date, end_date,location, estimated_budget, session['user_id']))
+        project_id = cur.lastrowid
+        mysql.connection.commit()
+        
+        # Summary row (and its cached EVM) is built from committed data only
+        refresh_summary(cur, [project_id])
         mysql.connection.commit()
         cur.close()
         
@@ -529,141 +578,62 @@ def add_project():
 def project_details(project_id):
     cur = get_db_connection()
     
-    # Get project details
-    cur.execute("""
-        SELECT p.*, u.username as created_by_name 
-        FROM projects p
-        JOIN users u ON p.created_by = u.user_id
-        WHERE p.project_id = %s
-    """, (project_id,))
-    project = cur.fetchone()
-    
-    # Get tasks for this project (only main tasks with no parent)
-    cur.execute("""
-        SELECT t.*, 
-               (SELECT COUNT(*) FROM tasks WHERE parent_task_id = t.task_id) as subtask_count
-        FROM tasks t
-        WHERE t.project_id = %s AND t.parent_task_id IS NULL
-        ORDER BY t.planned_start_date
-    """, (project_id,))
-    main_tasks = cur.fetchall()
+    # Project, tasks, rollups, expenditures, documents, worker hours and
+    # subcontractors in a handful of set-based queries
+    snapshot = load_project_snapshot(cur, project_id)
     
     # Get all workers
     cur.execute("SELECT * FROM workers ORDER BY name")
     workers = cur.fetchall()
     
-    # Get project progress - ensure we handle NULL values
-    cur.execute("""
-        SELECT 
-            COUNT(*) as total_tasks,
-            SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed_tasks,
-            SUM(CASE WHEN status = 'in_progress' THEN 1 ELSE 0 END) as in_progress_tasks,
-            SUM(CASE WHEN status = 'not_started' THEN 1 ELSE 0 END) as not_started_tasks,
-            SUM(CASE WHEN status = 'delayed' THEN 1 ELSE 0 END) as delayed_tasks,
-            COALESCE(SUM(estimated_cost), 0) as estimated_cost,
-            COALESCE(SUM(actual_cost), 0) as actual_cost
-        FROM tasks
-        WHERE project_id = %s
-    """, (project_id,))
-    progress = cur.fetchone()
-    
-    # Get tasks for Gantt chart
-    cur.execute("""
-        SELECT 
-            task_id, 
-            task_name, 
-            planned_start_date as start_date,
-            planned_end_date as end_date,
-            status,
-            (SELECT COUNT(*) FROM tasks WHERE parent_task_id = t.task_id) as has_subtasks
-        FROM tasks t
-        WHERE project_id = %s
-        ORDER BY planned_start_date
-    """, (project_id,))
-    gantt_tasks = cur.fetchall()
-    
     # Get materials for dropdown
     cur.execute("SELECT * FROM materials ORDER BY material_name")
     materials_list = cur.fetchall()
     
-    # Get expenditures for this project
-    cur.execute("""
-        SELECT pe.*, u.username as created_by_name 
-        FROM project_expenditures pe
-        JOIN users u ON pe.created_by = u.user_id
-        WHERE pe.project_id = %s
-        ORDER BY pe.expenditure_date DESC
-    """, (project_id,))
-    expenditures = cur.fetchall()
-    
-    # Calculate total expenditures
-    total_expenditures = sum(e['amount'] for e in expenditures) if expenditures else 0
-    
-    # Get documents for this project
-    cur.execute("""
-        SELECT d.*, u.username as uploaded_by 
-        FROM documents d
-        JOIN users u ON d.uploaded_by = u.user_id
-        WHERE d.project_id = %s
-        ORDER BY d.upload_date DESC
-    """, (project_id,))
-    documents = cur.fetchall()
-    
-    # Get worker assignments for this project
-    cur.execute("""
-        SELECT 
-    ta.worker_id,
-    w.name as worker_name,
-    w.specialization,
-    SUM(ta.hours_worked) as hours_worked
-FROM task_assignments ta
-JOIN tasks t ON ta.task_id = t.task_id
-JOIN workers w ON ta.worker_id = w.worker_id
-WHERE t.project_id = %s
-GROUP BY ta.worker_id, w.name, w.specialization
-ORDER BY hours_worked DESC
-    """, (project_id,))
-    worker_assignments = cur.fetchall()
-    
-    # Get subcontractors for this project
-    cur.execute("""
-        SELECT s.* 
-        FROM subcontractors s
-        JOIN subcontractor_projects sp ON s.subcontractor_id = sp.subcontractor_id
-        WHERE sp.project_id = %s
-        ORDER BY s.company_name
-    """, (project_id,))
-    subcontractors = cur.fetchall()
-    
-    # Calculate labor and material costs
-    cur.execute("""
-        SELECT 
-            COALESCE(SUM(ta.hours_worked * (w.daily_wage / 8)), 0) as labor_cost,
-            COALESCE(SUM(tm.total_cost), 0) as material_cost
-        FROM tasks t
-        LEFT JOIN task_assignments ta ON t.task_id = ta.task_id
-        LEFT JOIN workers w ON ta.worker_id = w.worker_id
-        LEFT JOIN task_materials tm ON t.task_id = tm.task_id
-        WHERE t.project_id = %s
-    """, (project_id,))
-    cost_data = cur.fetchone()
-    labor_cost = cost_data['labor_cost'] or 0
-    material_cost = cost_data['material_cost'] or 0
+    # Flag outdoor tasks that overlap bad weather in the cached forecast
+    project = snapshot['project']
+    if project and project['location']:
+        outdoor_tasks = [dict(t, location=project['location']) for t in snapshot['tasks']
+                         if t['is_outdoor'] and t['status'] != 'completed']
+        risks = weather_risks(mysql.connection, outdoor_tasks)
+        for gantt_task in snapshot['gantt_tasks']:
+            risk = risks.get(gantt_task['task_id'])
+            gantt_task['weather_risk'] = risk['risk_level'] if risk and risk['at_risk'] else None
+            gantt_task['weather_risk_reason'] = risk['reason'] if risk else ''
+    
+    # Mark critical tasks and slack from the cached CPM schedule
+    try:
+        schedule = project_schedule(cur, project_id, snapshot['tasks'])
+    except ScheduleError as e:
+        schedule = None
+        flash(str(e), 'warning')
+    predecessors = {}
+    for predecessor_id, successor_id, _ in load_dependencies(cur, project_id):
+        predecessors.setdefault(successor_id, []).append(f"T{predecessor_id}")
+    for gantt_task in snapshot['gantt_tasks']:
+        planned = schedule['tasks'].get(gantt_task['task_id']) if schedule else None
+        gantt_task['critical'] = bool(planned and planned['critical'])
+        gantt_task['slack'] = planned['slack'] if planned else None
+        gantt_task['dependencies'] = ','.join(predecessors.get(gantt_task['task_id'], []))
+    
+    # Calculate labor and material costs, each pre-aggregated per task
+    labor_cost, material_cost = project_costs(cur, project_id)
     
     cur.close()
     
     return render_template('project_details.html', 
-                           project=project, 
-                           main_tasks=main_tasks,
+                           project=snapshot['project'], 
+                           main_tasks=snapshot['main_tasks'],
                            workers=workers,
-                           progress=progress,
+                           progress=snapshot['progress'],
                            materials_list=materials_list,
-                           gantt_tasks=gantt_tasks,
-                           expenditures=expenditures,
-                           total_expenditures=total_expenditures,
-                           documents=documents,
-                           worker_assignments=worker_assignments,
-                           subcontractors=subcontractors,
+                           gantt_tasks=snapshot['gantt_tasks'],
+                           schedule=schedule,
+                           expenditures=snapshot['expenditures'],
+                           total_expenditures=snapshot['total_expenditures'],
+                           documents=snapshot['documents'],
+                           worker_assignments=snapshot['worker_assignments'],
+                           subcontractors=snapshot['subcontractors'],
                            labor_cost=labor_cost,
                            material_cost=material_cost)
 
@@ -675,22 +645,36 @@ def add_task():
     task_name = request.form['task_name']
     description = request.form.get('description', '')
     task_type = request.form['task_type']
-    parent_task_id = request.form.get('parent_task_id', None)
+    parent_task_id = request.form.get('parent_task_id') or None
     planned_start_date = request.form['planned_start_date']
     planned_end_date = request.form['planned_end_date']
     estimated_days = request.form['estimated_days']
     estimated_cost = request.form['estimated_cost']
+    is_outdoor = 1 if request.form.get('is_outdoor') else 0
     
     cur = get_db_connection()
+    
+    # A subtask must sit under a task of the same project
+    if parent_task_id is not None:
+        cur.execute("SELECT project_id FROM tasks WHERE task_id = %s", (parent_task_id,))
+        parent = cur.fetchone()
+        if not parent or parent['project_id'] != int(project_id):
+            cur.close()
+            flash('The parent task must belong to the same project', 'danger')
+            return redirect(url_for('project_details', project_id=project_id))
+    
     cur.execute("""
         INSERT INTO tasks (
             project_id, task_name, description, task_type, parent_task_id,
-            planned_start_date, planned_end_date, estimated_days, estimated_cost
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            planned_start_date, planned_end_date, estimated_days, estimated_cost, is_outdoor
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
     """, (
         project_id, task_name, description, task_type, parent_task_id,
-        planned_start_date, planned_end_date, estimated_days, estimated_cost
+        planned_start_date, planned_end_date, estimated_days, estimated_cost, is_outdoor
     ))
+    add_to_closure(cur, cur.lastrowid, parent_task_id)
+    bump_project_version(cur, project_id=project_id)
+    level_project(cur, int(project_id), leveling_window(planned_start_date, planned_end_date))
     mysql.connection.commit()
     cur.close()
     
@@ -710,13 +694,14 @@ def task_details(task_id):
     """, (task_id,))
     task = cur.fetchone()
     
-    # Get subtasks
-    cur.execute("""
-        SELECT * FROM tasks 
-        WHERE parent_task_id = %s
-        ORDER BY planned_start_date
-    """, (task_id,))
-    subtasks = cur.fetchall()
+    # Get all levels of subtasks and the subtree rollup via the closure table
+    subtasks = []
+    subtree = None
+    if task:
+        tree = load_subtree(cur, task_id)
+        for subtask_id, depth in tree.descendants(task_id):
+            subtasks.append(dict(tree.tasks[subtask_id], depth=depth))
+        subtree = tree.rollup(task_id)
     
     # Get assigned workers
     cur.execute("""
@@ -756,6 +741,26 @@ def task_details(task_id):
     """, (task_id,))
     progress = cur.fetchall()
     
+    # Get predecessors and the tasks that could become one
+    dependencies = []
+    dependency_options = []
+    if task:
+        cur.execute("""
+            SELECT d.predecessor_id, d.lag_days, t.task_name, t.planned_end_date
+            FROM task_dependencies d
+            JOIN tasks t ON t.task_id = d.predecessor_id
+            WHERE d.successor_id = %s
+            ORDER BY t.planned_end_date
+        """, (task_id,))
+        dependencies = cur.fetchall()
+        cur.execute("""
+            SELECT task_id, task_name
+            FROM tasks
+            WHERE project_id = %s AND task_id != %s
+            ORDER BY planned_start_date, task_id
+        """, (task['project_id'], task_id))
+        dependency_options = cur.fetchall()
+    
     # Calculate total costs
     labor_cost = sum(a['hours_worked'] * (a['daily_wage'] / 8) for a in assignments) if assignments else 0
     material_cost = sum(m['total_cost'] or 0 for m in materials) if materials else 0
@@ -773,7 +778,10 @@ def task_details(task_id):
                          progress=progress,
                          labor_cost=labor_cost,
                          material_cost=material_cost,
-                         total_cost=total_cost)
+                         total_cost=total_cost,
+                         subtree=subtree,
+                         dependencies=dependencies,
+                         dependency_options=dependency_options)
 @app.route('/assign_worker', methods=['POST'])
 @login_required
 def assign_worker():
@@ -783,11 +791,36 @@ def assign_worker():
     hours_worked = request.form['hours_worked']
     notes = request.form.get('notes', '')
     
+    try:
+        worker_id = int(worker_id)
+        assignment_date = datetime.strptime(assignment_date, '%Y-%m-%d').date()
+        hours_worked = Decimal(hours_worked)
+        if not 0 < hours_worked <= 24:
+            raise ValueError
+    except (ValueError, ArithmeticError):
+        flash('Choose a worker, a date and between 0 and 24 hours', 'danger')
+        return redirect(url_for('task_details', task_id=task_id))
+    
     cur = get_db_connection()
+    
+    # Refuse to book a worker past the daily limit across all projects; the
+    # worker stays locked until this booking commits
+    over = overbookings(cur, [(worker_id, assignment_date, hours_worked)], lock=True)
+    if over:
+        mysql.connection.rollback()
+        cur.close()
+        flash(f'Worker would be booked for {over[0][2]} hours on {assignment_date} '
+              f'(limit {MAX_DAY_HOURS})', 'danger')
+        return redirect(url_for('task_details', task_id=task_id))
+    
     cur.execute("""
         INSERT INTO task_assignments (task_id, worker_id, assignment_date, hours_worked, notes)
         VALUES (%s, %s, %s, %s, %s)
     """, (task_id, worker_id, assignment_date, hours_worked, notes))
+    
+    # Add the assignment's labor cost to the task cost ledger
+    cost_ledger.apply_assignment(cur, task_id, worker_id, hours_worked)
+    bump_project_version(cur, task_id=task_id)
     mysql.connection.commit()
     
     # Update task status to in_progress if not already
@@ -802,6 +835,131 @@ def assign_worker():
     
     return redirect(url_for('task_details', task_id=task_id))
 
+def parse_timesheet(payload_rows, task_ids, worker_ids):
+    """Validate timesheet rows; returns (rows, errors)."""
+    rows, errors = [], []
+    for number, entry in enumerate(payload_rows, start=1):
+        if not isinstance(entry, dict):
+            errors.append(f'Row {number}: task, worker and hours are required')
+            continue
+        if not entry.get('worker_id') and not entry.get('task_id') and not entry.get('hours_worked'):
+            continue
+        try:
+            task_id = int(entry['task_id'])
+            worker_id = int(entry['worker_id'])
+            hours_worked = Decimal(str(entry['hours_worked']))
+        except (KeyError, TypeError, ValueError, ArithmeticError):
+            errors.append(f'Row {number}: task, worker and hours are required')
+            continue
+        if task_id not in task_ids:
+            errors.append(f'Row {number}: task {task_id} is not in this project')
+        elif worker_id not in worker_ids:
+            errors.append(f'Row {number}: unknown worker {worker_id}')
+        elif not 0 < hours_worked <= 24:
+            errors.append(f'Row {number}: hours must be between 0 and 24')
+        else:
+            rows.append((task_id, worker_id, hours_worked, entry.get('notes') or ''))
+    return rows, errors
+
+@app.route('/projects/<int:project_id>/timesheet', methods=['GET', 'POST'])
+@login_required
+def crew_timesheet(project_id):
+    cur = get_db_connection()
+    cur.execute("SELECT project_id, project_name FROM projects WHERE project_id = %s", (project_id,))
+    project = cur.fetchone()
+    if not project:
+        cur.close()
+        flash("Project not found", "danger")
+        return redirect(url_for('projects'))
+    
+    # Get open tasks and all workers for the entry rows
+    cur.execute("""
+        SELECT task_id, task_name, status
+        FROM tasks
+        WHERE project_id = %s AND status != 'completed'
+        ORDER BY planned_start_date, task_id
+    """, (project_id,))
+    tasks = cur.fetchall()
+    cur.execute("SELECT worker_id, name, specialization FROM workers ORDER BY name")
+    workers = cur.fetchall()
+    
+    if request.method == 'GET':
+        cur.close()
+        return render_template('timesheet.html', project=project, tasks=tasks, workers=workers,
+                               today=date.today().isoformat())
+    
+    # A whole day's crew in one request, as JSON or as parallel form lists
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get('entries', []), list):
+            cur.close()
+            return jsonify({'errors': ['Send an object with assignment_date and a list of entries']}), 400
+        assignment_date = payload.get('assignment_date')
+        payload_rows = payload.get('entries', [])
+    else:
+        assignment_date = request.form.get('assignment_date')
+        payload_rows = [
+            {'task_id': t, 'worker_id': w, 'hours_worked': h, 'notes': n}
+            for t, w, h, n in zip(request.form.getlist('task_id'), request.form.getlist('worker_id'),
+                                  request.form.getlist('hours_worked'), request.form.getlist('notes'))
+        ]
+    
+    rows, errors = parse_timesheet(payload_rows, {t['task_id'] for t in tasks},
+                                   {w['worker_id'] for w in workers})
+    try:
+        assignment_date = datetime.strptime(str(assignment_date or ''), '%Y-%m-%d').date()
+    except ValueError:
+        errors.insert(0, 'Assignment date is required (YYYY-MM-DD)')
+    if not rows and not errors:
+        errors.append('No timesheet rows entered')
+    if not errors:
+        names = {w['worker_id']: w['name'] for w in workers}
+        for worker_id, _, total in overbookings(cur, [(w, assignment_date, h) for _, w, h, _ in rows],
+                                                lock=True):
+            errors.append(f'{names[worker_id]} would be booked for {total} hours (limit {MAX_DAY_HOURS})')
+    if errors:
+        mysql.connection.rollback()
+        cur.close()
+        if request.is_json:
+            return jsonify({'errors': errors}), 400
+        for error in errors:
+            flash(error, 'danger')
+        return redirect(url_for('crew_timesheet', project_id=project_id))
+    
+    try:
+        # One multi-row insert, then set-wise cost and status updates
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))
+        params = []
+        for task_id, worker_id, hours_worked, notes in rows:
+            params.extend([task_id, worker_id, assignment_date, hours_worked, notes])
+        cur.execute(f"""
+            INSERT INTO task_assignments (task_id, worker_id, assignment_date, hours_worked, notes)
+            VALUES {placeholders}
+        """, params)
+        cost_ledger.apply_assignments(cur, project_id, [(t, w, h) for t, w, h, _ in rows])
+        
+        task_ids = sorted({row[0] for row in rows})
+        cur.execute(f"""
+            UPDATE tasks
+            SET status = 'in_progress'
+            WHERE task_id IN ({', '.join(['%s'] * len(task_ids))}) AND status = 'not_started'
+        """, task_ids)
+        bump_project_version(cur, project_id=project_id)
+        mysql.connection.commit()
+    except Exception as e:
+        mysql.connection.rollback()
+        if request.is_json:
+            return jsonify({'errors': [str(e)]}), 500
+        flash(f'Error saving timesheet: {str(e)}', 'danger')
+        return redirect(url_for('crew_timesheet', project_id=project_id))
+    finally:
+        cur.close()
+    
+    if request.is_json:
+        return jsonify({'inserted': len(rows)})
+    flash(f'Recorded {len(rows)} assignments for {assignment_date}', 'success')
+    return redirect(url_for('project_details', project_id=project_id))
+
 @app.route('/add_material', methods=['POST'])
 @login_required
 def add_material():
@@ -812,27 +970,17 @@ def add_material():
     notes = request.form.get('notes', '')
     
     cur = get_db_connection()
+    # Priced at the material's unit cost, the same way bulk imports are
     cur.execute("""
-        INSERT INTO task_materials (task_id, material_id, quantity, date_used, notes)
-        VALUES (%s, %s, %s, %s, %s)
-    """, (task_id, material_id, quantity, date_used, notes))
-    mysql.connection.commit()
-    
-    # Update task actual cost
-    cur.execute("""
-        UPDATE tasks t
-        SET t.actual_cost = (
-            SELECT IFNULL(SUM(tm.total_cost), 0)
-            FROM task_materials tm
-            WHERE tm.task_id = %s
-        ) + (
-            SELECT IFNULL(SUM(ta.hours_worked * (w.daily_wage / 8)), 0)
-            FROM task_assignments ta
-            JOIN workers w ON ta.worker_id = w.worker_id
-            WHERE ta.task_id = %s
-        )
-        WHERE t.task_id = %s
-    """, (task_id, task_id, task_id))
+        INSERT INTO task_materials (task_id, material_id, quantity, total_cost, date_used, notes)
+        SELECT %s, material_id, %s, %s * unit_cost, %s, %s
+        FROM materials
+        WHERE material_id = %s
+    """, (task_id, quantity, quantity, date_used, notes, material_id))
+    
+    # Update task actual cost by the new row's cost
+    cost_ledger.apply_material(cur, cur.lastrowid)
+    bump_project_version(cur, task_id=task_id)
     mysql.connection.commit()
     
     cur.close()
@@ -848,10 +996,12 @@ def record_progress():
     notes = request.form.get('notes', '')
     
     cur = get_db_connection()
+    apply_progress(cur, task_id, progress_date, percentage_completed)
     cur.execute("""
         INSERT INTO daily_progress (task_id, progress_date, percentage_completed, notes, created_by)
         VALUES (%s, %s, %s, %s, %s)
     """, (task_id, progress_date, percentage_completed, notes, session['user_id']))
+    bump_project_version(cur, task_id=task_id)
     mysql.connection.commit()
     
     # Update task status if completed
@@ -870,11 +1020,17 @@ def record_progress():
 @app.route('/workers')
 @login_required
 def workers():
+    weeks = min(max(request.args.get('weeks', 8, type=int), 1), 26)
+    end = week_start(date.today()) + timedelta(days=6)
+    start = end - timedelta(days=weeks * 7 - 1)
+    
     cur = get_db_connection()
     cur.execute("SELECT * FROM workers ORDER BY name")
     workers = cur.fetchall()
+    calendar = utilization(cur, start, end, workers)
     cur.close()
-    return render_template('workers.html', workers=workers)
+    return render_template('workers.html', workers=workers, calendar=calendar,
+                           weeks=weeks, heat_level=heat_level)
 
 # Update Project Route
 @app.route('/projects/<int:project_id>/edit', methods=['GET', 'POST'])
@@ -896,6 +1052,11 @@ def edit_project(project_id):
                 end_date = %s, estimated_budget = %s, status = %s
             WHERE project_id = %s
         """, (project_name, description, start_date, end_date, estimated_budget, status, project_id))
+        bump_project_version(cur, project_id=project_id)
+        mysql.connection.commit()
+        
+        # Summary row (and its cached EVM) is built from committed data only
+        refresh_summary(cur, [project_id])
         mysql.connection.commit()
         cur.close()
         
@@ -923,15 +1084,57 @@ def edit_task(task_id):
         estimated_days = request.form['estimated_days']
         estimated_cost = request.form['estimated_cost']
         status = request.form['status']
+        is_outdoor = 1 if request.form.get('is_outdoor') else 0
+        parent_task_id = request.form.get('parent_task_id') or None
+        if parent_task_id is not None:
+            parent_task_id = int(parent_task_id)
+        
+        cur.execute("""
+            SELECT project_id, parent_task_id, estimated_cost, estimated_days,
+                   planned_start_date, planned_end_date
+            FROM tasks WHERE task_id = %s
+        """, (task_id,))
+        old = cur.fetchone()
+        if not old:
+            cur.close()
+            flash('Task not found', 'danger')
+            return redirect(url_for('projects'))
+        
+        # A task cannot move under itself or one of its own subtasks
+        if parent_task_id in subtree_ids(cur, task_id):
+            cur.close()
+            flash('A task cannot be moved under one of its own subtasks', 'danger')
+            return redirect(url_for('edit_task', task_id=task_id))
+        
+        # ...nor under a task of another project
+        if parent_task_id is not None:
+            cur.execute("SELECT project_id FROM tasks WHERE task_id = %s", (parent_task_id,))
+            parent = cur.fetchone()
+            if not parent or parent['project_id'] != old['project_id']:
+                cur.close()
+                flash('The parent task must belong to the same project', 'danger')
+                return redirect(url_for('edit_task', task_id=task_id))
         
         cur.execute("""
             UPDATE tasks 
             SET task_name = %s, description = %s, task_type = %s,
                 planned_start_date = %s, planned_end_date = %s,
-                estimated_days = %s, estimated_cost = %s, status = %s
+                estimated_days = %s, estimated_cost = %s, status = %s, is_outdoor = %s,
+                parent_task_id = %s
             WHERE task_id = %s
         """, (task_name, description, task_type, planned_start_date, 
-              planned_end_date, estimated_days, estimated_cost, status, task_id))
+              planned_end_date, estimated_days, estimated_cost, status, is_outdoor,
+              parent_task_id, task_id))
+        if parent_task_id != old['parent_task_id']:
+            move_in_closure(cur, task_id, parent_task_id)
+        # Progress weights come from the estimates, so re-weight the series
+        if (float(estimated_cost or 0) != float(old['estimated_cost'] or 0)
+                or int(estimated_days or 0) != int(old['estimated_days'] or 0)):
+            rebuild_progress(cur, old['project_id'])
+        bump_project_version(cur, task_id=task_id)
+        # Re-level only around the task's old and new dates
+        level_project(cur, old['project_id'], leveling_window(
+            old['planned_start_date'], old['planned_end_date'], planned_start_date, planned_end_date))
         mysql.connection.commit()
         cur.close()
         
@@ -940,9 +1143,225 @@ def edit_task(task_id):
     # GET request - show edit form
     cur.execute("SELECT * FROM tasks WHERE task_id = %s", (task_id,))
     task = cur.fetchone()
+    
+    # Get the tasks it may be moved under (anything outside its own subtree)
+    parent_options = []
+    if task:
+        cur.execute("""
+            SELECT t.task_id, t.task_name
+            FROM tasks t
+            LEFT JOIN task_closure c
+                ON c.ancestor_id = %s AND c.descendant_id = t.task_id
+            WHERE t.project_id = %s AND c.descendant_id IS NULL
+            ORDER BY t.planned_start_date, t.task_id
+        """, (task_id, task['project_id']))
+        parent_options = cur.fetchall()
     cur.close()
     
-    return render_template('edit_task.html', task=task)
+    return render_template('edit_task.html', task=task, parent_options=parent_options)
+
+@app.route('/tasks/<int:task_id>/dependencies/add', methods=['POST'])
+@login_required
+def add_dependency(task_id):
+    predecessor_id = int(request.form['predecessor_id'])
+    lag_days = int(request.form.get('lag_days') or 0)
+    cur = get_db_connection()
+    
+    try:
+        cur.execute("""
+            SELECT task_id, project_id FROM tasks WHERE task_id IN (%s, %s)
+        """, (task_id, predecessor_id))
+        projects = {row['task_id']: row['project_id'] for row in cur.fetchall()}
+        if predecessor_id == task_id or len(projects) != 2 or len(set(projects.values())) != 1:
+            flash('A task can only depend on another task of the same project', 'danger')
+            return redirect(url_for('task_details', task_id=task_id))
+        project_id = projects[task_id]
+        
+        # Reject the link if it would close a cycle in the task graph
+        cur.execute("""
+            SELECT task_id, planned_start_date, planned_end_date, estimated_days
+            FROM tasks
+            WHERE project_id = %s
+        """, (project_id,))
+        tasks = cur.fetchall()
+        dependencies = load_dependencies(cur, project_id) + [(predecessor_id, task_id, lag_days)]
+        compute_schedule(tasks, dependencies)
+        
+        cur.execute("""
+            INSERT INTO task_dependencies (predecessor_id, successor_id, lag_days)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE lag_days = VALUES(lag_days)
+        """, (predecessor_id, task_id, lag_days))
+        bump_project_version(cur, project_id=project_id)
+        mysql.connection.commit()
+        flash('Dependency added', 'success')
+    except ScheduleError as e:
+        flash(str(e), 'danger')
+    finally:
+        cur.close()
+    
+    return redirect(url_for('task_details', task_id=task_id))
+
+@app.route('/tasks/<int:task_id>/dependencies/<int:predecessor_id>/delete', methods=['POST'])
+@login_required
+def delete_dependency(task_id, predecessor_id):
+    cur = get_db_connection()
+    cur.execute("""
+        DELETE FROM task_dependencies WHERE predecessor_id = %s AND successor_id = %s
+    """, (predecessor_id, task_id))
+    bump_project_version(cur, task_id=task_id)
+    mysql.connection.commit()
+    cur.close()
+    
+    flash('Dependency removed', 'success')
+    return redirect(url_for('task_details', task_id=task_id))
+
+def leveling_window(*dates):
+    """The (start, end) span of the given dates or ISO date strings."""
+    days = [d if isinstance(d, date) else datetime.strptime(d, '%Y-%m-%d').date() for d in dates]
+    return min(days), max(days)
+
+@app.route('/projects/<int:project_id>/resources')
+@login_required
+def project_resources(project_id):
+    cur = get_db_connection()
+    cur.execute("SELECT project_id, project_name FROM projects WHERE project_id = %s", (project_id,))
+    project = cur.fetchone()
+    if not project:
+        cur.close()
+        flash("Project not found", "danger")
+        return redirect(url_for('projects'))
+    
+    # Get each task's needs and how many units the leveler could allocate
+    cur.execute("""
+        SELECT n.need_id, n.task_id, n.resource_type, n.skill, n.quantity,
+               t.task_name, t.planned_start_date, t.planned_end_date,
+               COUNT(a.allocation_id) AS allocated
+        FROM task_resource_needs n
+        JOIN tasks t ON n.task_id = t.task_id
+        LEFT JOIN resource_allocations a ON a.need_id = n.need_id
+        WHERE t.project_id = %s
+        GROUP BY n.need_id, n.task_id, n.resource_type, n.skill, n.quantity,
+                 t.task_name, t.planned_start_date, t.planned_end_date
+        ORDER BY t.planned_start_date, t.task_id, n.need_id
+    """, (project_id,))
+    needs = cur.fetchall()
+    
+    # Get the leveled allocations with the resource names
+    cur.execute("""
+        SELECT a.*, t.task_name, t.planned_start_date,
+               COALESCE(w.name, e.equipment_name) AS resource_name,
+               DATEDIFF(a.start_date, t.planned_start_date) AS shift_days
+        FROM resource_allocations a
+        JOIN tasks t ON a.task_id = t.task_id
+        LEFT JOIN workers w ON a.resource_type = 'worker' AND w.worker_id = a.resource_id
+        LEFT JOIN equipment e ON a.resource_type = 'equipment' AND e.equipment_id = a.resource_id
+        WHERE a.project_id = %s
+        ORDER BY a.start_date, t.task_id, a.resource_type, resource_name
+    """, (project_id,))
+    allocations = cur.fetchall()
+    
+    cur.execute("""
+        SELECT * FROM leveling_runs
+        WHERE project_id = %s
+        ORDER BY created_at DESC, run_id DESC
+        LIMIT 10
+    """, (project_id,))
+    runs = cur.fetchall()
+    
+    # Get the choices for the needs form
+    cur.execute("""
+        SELECT task_id, task_name FROM tasks
+        WHERE project_id = %s AND status != 'completed'
+        ORDER BY planned_start_date, task_id
+    """, (project_id,))
+    tasks = cur.fetchall()
+    cur.execute("""
+        SELECT DISTINCT specialization FROM workers
+        WHERE specialization IS NOT NULL AND specialization != ''
+        ORDER BY specialization
+    """)
+    specializations = [row['specialization'] for row in cur.fetchall()]
+    cur.execute("SELECT DISTINCT equipment_type FROM equipment ORDER BY equipment_type")
+    equipment_types = [row['equipment_type'] for row in cur.fetchall()]
+    cur.close()
+    
+    return render_template('resources.html', project=project, needs=needs,
+                           allocations=allocations, runs=runs, tasks=tasks,
+                           specializations=specializations, equipment_types=equipment_types)
+
+@app.route('/projects/<int:project_id>/resources/needs', methods=['POST'])
+@login_required
+def add_resource_need(project_id):
+    task_id = int(request.form['task_id'])
+    resource_type = request.form['resource_type']
+    skill = request.form['skill'].strip()
+    quantity = int(request.form.get('quantity') or 1)
+    
+    cur = get_db_connection()
+    cur.execute("""
+        SELECT planned_start_date, planned_end_date FROM tasks
+        WHERE task_id = %s AND project_id = %s
+    """, (task_id, project_id))
+    task = cur.fetchone()
+    if not task or resource_type not in RESOURCE_TYPES or not skill or quantity < 1:
+        cur.close()
+        flash('Choose a task of this project, a resource and a quantity of at least 1', 'danger')
+        return redirect(url_for('project_resources', project_id=project_id))
+    
+    cur.execute("""
+        INSERT INTO task_resource_needs (task_id, resource_type, skill, quantity)
+        VALUES (%s, %s, %s, %s)
+    """, (task_id, resource_type, skill, quantity))
+    result = level_project(cur, project_id, leveling_window(task['planned_start_date'],
+                                                            task['planned_end_date']))
+    mysql.connection.commit()
+    cur.close()
+    
+    if result['unallocated']:
+        flash(f"Need added; {result['unallocated']} units could not be allocated", 'warning')
+    else:
+        flash('Need added and allocated', 'success')
+    return redirect(url_for('project_resources', project_id=project_id))
+
+@app.route('/resource_needs/<int:need_id>/delete', methods=['POST'])
+@login_required
+def delete_resource_need(need_id):
+    cur = get_db_connection()
+    cur.execute("""
+        SELECT t.project_id, t.planned_start_date, t.planned_end_date
+        FROM task_resource_needs n
+        JOIN tasks t ON n.task_id = t.task_id
+        WHERE n.need_id = %s
+    """, (need_id,))
+    task = cur.fetchone()
+    if not task:
+        cur.close()
+        flash('Need not found', 'danger')
+        return redirect(url_for('projects'))
+    
+    cur.execute("DELETE FROM resource_allocations WHERE need_id = %s", (need_id,))
+    cur.execute("DELETE FROM task_resource_needs WHERE need_id = %s", (need_id,))
+    level_project(cur, task['project_id'], leveling_window(task['planned_start_date'],
+                                                           task['planned_end_date']))
+    mysql.connection.commit()
+    cur.close()
+    
+    flash('Need removed', 'success')
+    return redirect(url_for('project_resources', project_id=task['project_id']))
+
+@app.route('/projects/<int:project_id>/resources/level', methods=['POST'])
+@login_required
+def level_resources(project_id):
+    cur = get_db_connection()
+    result = level_project(cur, project_id)
+    mysql.connection.commit()
+    cur.close()
+    
+    flash(f"Leveled {result['tasks']} tasks in {result['elapsed_ms']} ms: "
+          f"{result['allocations']} allocations, {result['unallocated']} units unallocated, "
+          f"{result['shifted']} tasks moved off their planned start", 'success')
+    return redirect(url_for('project_resources', project_id=project_id))
 
 # Update Material Route
 @app.route('/materials/<int:material_id>/edit', methods=['GET', 'POST'])
@@ -1029,20 +1448,31 @@ def add_material_item():
 def reports():
     return render_template('reports.html')
 
+@app.route('/portfolio')
+@login_required
+def portfolio():
+    cur = get_db_connection()
+    # Current earned-value figures come from the portfolio summary, rebuilt in
+    # the job pool like the dashboard's
+    summary = load_summary(cur)
+    if stale_projects(cur) and not jobs.active_job('portfolio_summary', 0):
+        jobs.submit_job('portfolio_summary', 0)
+    cur.close()
+    
+    rows = [dict(row, evm=summary_evm(row)) for row in summary]
+    
+    return render_template('portfolio.html', projects=rows)
+
 from datetime import datetime
 import json
 from flask import render_template, redirect, url_for, flash
-from flask_login import login_required
 
 from flask import render_template
 from datetime import datetime, date
 from decimal import Decimal
 import json
 
-@app.route('/reports/project/<int:project_id>')
-def project_report(project_id):
-    cur = get_db_connection()
-    
+def project_report_context(cur, project_id):
     # Get project details
     cur.execute("SELECT * FROM projects WHERE project_id = %s", (project_id,))
     project = cur.fetchone()
@@ -1060,14 +1490,10 @@ def project_report(project_id):
     # Get all tasks with their material and labor costs
     cur.execute("""
         SELECT t.*, 
-               (SELECT IFNULL(SUM(tm.total_cost), 0)
-                FROM task_materials tm
-                WHERE tm.task_id = t.task_id) AS material_cost,
-               (SELECT IFNULL(SUM(ta.hours_worked * (w.daily_wage / 8)), 0)
-                FROM task_assignments ta
-                JOIN workers w ON ta.worker_id = w.worker_id
-                WHERE ta.task_id = t.task_id) AS labor_cost
+               COALESCE(l.material_cost, 0) AS material_cost,
+               COALESCE(l.labor_cost, 0) AS labor_cost
         FROM tasks t
+        LEFT JOIN task_cost_ledger l ON l.task_id = t.task_id
         WHERE t.project_id = %s
         ORDER BY t.planned_start_date
     """, (project_id,))
@@ -1080,21 +1506,8 @@ def project_report(project_id):
     total_task_costs = total_material + total_labor
     total_actual = total_task_costs + total_expenditures
     
-    # Get progress data for charts
-    cur.execute("""
-        SELECT progress_date, AVG(percentage_completed) AS avg_progress
-        FROM daily_progress
-        WHERE task_id IN (SELECT task_id FROM tasks WHERE project_id = %s)
-        GROUP BY progress_date
-        ORDER BY progress_date
-    """, (project_id,))
-    progress_data = cur.fetchall()
-    
-    cur.close()
-
-    # Prepare data for charts
-    progress_dates = [str(p['progress_date']) for p in progress_data]
-    progress_values = [float(p['avg_progress']) for p in progress_data]
+    # Get the cost-weighted progress series from the daily rollup
+    progress_dates, progress_values = progress_series(cur, project_id)
 
     cost_data = {
         'labels': ['Materials', 'Labor', 'Expenditures'],
@@ -1112,6 +1525,9 @@ def project_report(project_id):
     days_passed = (today - project_start).days if today > project_start else 0
     completion_percentage = (days_passed / total_days) * 100 if total_days > 0 else 0
 
+    # Earned-value series (PV/EV/AC, CPI/SPI, EAC/ETC) for the EVM panel
+    evm = project_evm(cur, project_id)
+
     budget_forecast = {
         'total_days': total_days,
         'days_passed': days_passed,
@@ -1121,234 +1537,405 @@ def project_report(project_id):
         'variance': round(float(total_actual) - (float(project['estimated_budget']) * (completion_percentage / 100)), 2) if completion_percentage > 0 else 0
     }
 
-    return render_template('project_report.html',
-                           project=project,
-                           tasks=tasks,
-                           expenditures=expenditures,
-                           total_estimated=total_estimated,
-                           total_task_costs=total_task_costs,
-                           total_expenditures=total_expenditures,
-                           total_actual=total_actual,
-                           progress_dates=json.dumps(progress_dates),
-                           progress_values=json.dumps(progress_values),
-                           cost_data=json.dumps(cost_data),
-                           budget_forecast=budget_forecast,
-                           abs=abs)
+    return dict(project=project,
+                tasks=tasks,
+                expenditures=expenditures,
+                total_estimated=total_estimated,
+                total_task_costs=total_task_costs,
+                total_expenditures=total_expenditures,
+                total_actual=total_actual,
+                progress_dates=json.dumps(progress_dates),
+                progress_values=json.dumps(progress_values),
+                cost_data=json.dumps(cost_data),
+                budget_forecast=budget_forecast,
+                evm=evm['current'] if evm else None,
+                evm_series=json.dumps({k: v for k, v in evm.items() if k != 'current'}) if evm else 'null')
+
+def report_kind():
+    # The report's budget forecast and EVM figures depend on today's date
+    return f'report:{date.today()}'
+
+def run_job_handler(kind, project_id, artifact_base, progress):
+    # Called inside a job pool process with an app context
+    cur = get_db_connection()
+    try:
+        # Read the version before the data so a concurrent write can only
+        # make the cached entry newer than its key, never older
+        version = project_version(cur, project_id)
+
+        if kind == 'report':
+            cache_kind = report_kind()
+            progress(0, 'Collecting report data')
+            context = project_report_context(cur, project_id)
+            artifact_path = artifact_base + '.pickle'
+            data = pickle.dumps(context)
+            with open(artifact_path, 'wb') as f:
+                f.write(data)
+            report_cache.put(cache_kind, project_id, version, data)
+            return artifact_path, None
+
+        if kind == 'export':
+            cur.execute("SELECT * FROM projects WHERE project_id = %s", (project_id,))
+            project = cur.fetchone()
+            artifact_path = artifact_base + '.xlsx'
+            with open(artifact_path, 'wb') as output:
+                write_project_workbook(mysql.connection, project, output, progress=progress)
+            with open(artifact_path, 'rb') as f:
+                report_cache.put('export', project_id, version, f.read())
+            return artifact_path, f"{project['project_name']}_report.xlsx"
+
+        if kind.startswith('import_'):
+            # The upload and its metadata were staged under the job's path
+            meta_path = artifact_base + '.upload.json'
+            with open(meta_path) as f:
+                upload = json.load(f)
+            try:
+                summary = bulk_import.import_file(mysql.connection, kind[len('import_'):], upload['path'],
+                                                  project_id, upload['user_id'], progress=progress)
+            finally:
+                for path in (upload['path'], meta_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            artifact_path = artifact_base + '.pickle'
+            with open(artifact_path, 'wb') as f:
+                pickle.dump(summary, f)
+            return artifact_path, None
+
+        if kind == 'portfolio_summary':
+            progress(0, 'Refreshing the portfolio summary')
+            refresh_summary(cur)
+            mysql.connection.commit()
+            return None, None
+
+        raise ValueError(f'Unknown job type: {kind}')
+    finally:
+        cur.close()
+
+@app.route('/reports/project/<int:project_id>')
+def project_report(project_id):
+    cur = get_db_connection()
+    cur.execute("SELECT project_id, data_version FROM projects WHERE project_id = %s", (project_id,))
+    project = cur.fetchone()
+    cur.close()
+    
+    if not project:
+        flash("Project not found", "danger")
+        return redirect(url_for('projects'))
+    
+    # Nothing changed since the last build: render the cached report
+    cached = report_cache.get(report_kind(), project_id, project['data_version'])
+    if cached is not None:
+        return render_template('project_report.html', abs=abs, **pickle.loads(cached))
+    
+    # Build the report in the job pool; the job page renders it when done
+    job_id = jobs.submit_job('report', project_id)
+    return redirect(url_for('job_status', job_id=job_id))
 
 @app.route('/export/project/<int:project_id>')
 # @login_required
 def export_project(project_id):
     cur = get_db_connection()
+    cur.execute("SELECT project_id, project_name, data_version FROM projects WHERE project_id = %s", (project_id,))
+    project = cur.fetchone()
+    cur.close()
+    
+    if not project:
+        flash("Project not found", "danger")
+        return redirect(url_for('projects'))
+    
+    # Nothing changed since the last export: send the cached workbook
+    cached = report_cache.get('export', project_id, project['data_version'])
+    if cached is not None:
+        return send_file(io.BytesIO(cached), as_attachment=True,
+                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                         download_name=f"{project['project_name']}_report.xlsx")
+    
+    # Stream the workbook in the job pool; the job page serves the download
+    job_id = jobs.submit_job('export', project_id)
+    return redirect(url_for('job_status', job_id=job_id))
+
+@app.route('/projects/<int:project_id>/charts')
+# @login_required
+def project_charts(project_id):
+    cur = get_db_connection()
+    cur.execute("SELECT * FROM projects WHERE project_id = %s", (project_id,))
+    project = cur.fetchone()
+    
+    if not project:
+        cur.close()
+        flash("Project not found", "danger")
+        return redirect(url_for('projects'))
     
+    # Get task timeline
+    cur.execute("""
+        SELECT task_id, task_name, planned_start_date, planned_end_date,
+               actual_start_date, actual_end_date, status
+        FROM tasks
+        WHERE project_id = %s
+        ORDER BY planned_start_date, task_id
+    """, (project_id,))
+    timeline_data = cur.fetchall()
+    
+    # Get expenditure totals by category
+    cur.execute("""
+        SELECT COALESCE(category, 'Other') AS category, SUM(amount) AS total
+        FROM project_expenditures
+        WHERE project_id = %s
+        GROUP BY COALESCE(category, 'Other')
+        ORDER BY total DESC
+    """, (project_id,))
+    expenditure_categories = cur.fetchall()
+    cur.close()
+    
+    return render_template('project_charts.html',
+                           project=project,
+                           timeline_data=timeline_data,
+                           expenditure_categories=expenditure_categories)
+
+@app.route('/projects/<int:project_id>/charts/<chart_type>')
+# @login_required
+def generate_chart(project_id, chart_type):
+    render_chart = CHARTS.get(chart_type)
+    if render_chart is None:
+        return jsonify({'error': f'Unknown chart type: {chart_type}'}), 404
+    
+    cur = get_db_connection()
     try:
-        # Get project details
-        cur.execute("SELECT * FROM projects WHERE project_id = %s", (project_id,))
-        project = cur.fetchone()
+        version = project_version(cur, project_id)
+        if version is None:
+            return jsonify({'error': 'Project not found'}), 404
         
-        if not project:
-            flash("Project not found", "danger")
-            return redirect(url_for('projects'))
-
-        # Get all tasks with their costs
-        cur.execute("""
-            SELECT 
-                t.task_id, 
-                t.task_name, 
-                t.task_type, 
-                t.planned_start_date, 
-                t.planned_end_date,
-                t.estimated_days, 
-                t.estimated_cost,
-                t.status, 
-                t.actual_start_date, 
-                t.actual_end_date,
-                COALESCE((
-                    SELECT SUM(tm.total_cost)
-                    FROM task_materials tm
-                    WHERE tm.task_id = t.task_id
-                ), 0) as material_cost,
-                COALESCE((
-                    SELECT SUM(ta.hours_worked * (w.daily_wage / 8))
-                    FROM task_assignments ta
-                    JOIN workers w ON ta.worker_id = w.worker_id
-                    WHERE ta.task_id = t.task_id
-                ), 0) as labor_cost,
-                COALESCE((
-                    SELECT SUM(tm.total_cost)
-                    FROM task_materials tm
-                    WHERE tm.task_id = t.task_id
-                ), 0) + COALESCE((
-                    SELECT SUM(ta.hours_worked * (w.daily_wage / 8))
-                    FROM task_assignments ta
-                    JOIN workers w ON ta.worker_id = w.worker_id
-                    WHERE ta.task_id = t.task_id
-                ), 0) as total_cost,
-                t.parent_task_id,
-                (SELECT task_name FROM tasks WHERE task_id = t.parent_task_id) as parent_task_name
-            FROM tasks t
-            WHERE t.project_id = %s
-            ORDER BY t.planned_start_date
-        """, (project_id,))
-        tasks = cur.fetchall()
+        # The browser already has this version of the chart
+        etag = chart_etag(chart_type, project_id, version)
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
         
-        # Get workers assigned
-        cur.execute("""
-            SELECT 
-                ta.task_id, 
-                t.task_name, 
-                w.name as worker_name, 
-                w.specialization,
-                w.daily_wage,
-                ta.assignment_date, 
-                ta.hours_worked,
-                (ta.hours_worked * (w.daily_wage / 8)) as cost
-            FROM task_assignments ta
-            JOIN workers w ON ta.worker_id = w.worker_id
-            JOIN tasks t ON ta.task_id = t.task_id
-            WHERE t.project_id = %s
-            ORDER BY ta.assignment_date
-        """, (project_id,))
-        workers = cur.fetchall()
+        kind = f'chart:{chart_type}'
+        data = report_cache.get(kind, project_id, version)
+        if data is None:
+            data = render_chart(cur, project_id)
+            report_cache.put(kind, project_id, version, data)
+    finally:
+        cur.close()
+    
+    response = app.response_class(data, mimetype='image/svg+xml')
+    response.set_etag(etag)
+    # Revalidate on every view; unchanged charts come back as 304s
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def api_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, timedelta):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def api_response(kind, project_id, version, build):
+    """Serve a JSON view keyed on the project's data_version.
+
+    The version is the change token: a matching If-None-Match gets a 304
+    before any view query runs, and the encoded body is cached so other
+    clients polling the same version skip the queries too.
+    """
+    etag = f'{kind}-{project_id}-{version}'
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    data = report_cache.get(kind, project_id, version)
+    if data is None:
+        data = json.dumps(dict(build(), version=version), default=api_default).encode('utf-8')
+        report_cache.put(kind, project_id, version, data)
+    
+    response = app.response_class(data, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/api/v1/projects/<int:project_id>')
+@login_required
+def api_project(project_id):
+    cur = get_db_connection()
+    try:
+        version = project_version(cur, project_id)
+        if version is None:
+            return jsonify({'error': 'Project not found'}), 404
         
-        # Get materials used
-        cur.execute("""
-            SELECT 
-                tm.task_id, 
-                t.task_name, 
-                m.material_name, 
-                tm.quantity, 
-                m.unit, 
-                m.unit_cost,
-                tm.total_cost, 
-                tm.date_used
-            FROM task_materials tm
-            JOIN materials m ON tm.material_id = m.material_id
-            JOIN tasks t ON tm.task_id = t.task_id
-            WHERE t.project_id = %s
-            ORDER BY tm.date_used
-        """, (project_id,))
-        materials = cur.fetchall()
+        def build():
+            snapshot = load_project_snapshot(cur, project_id)
+            labor_cost, material_cost = project_costs(cur, project_id)
+            try:
+                schedule = project_schedule(cur, project_id, snapshot['tasks'])
+            except ScheduleError:
+                schedule = None
+            return {
+                'project': snapshot['project'],
+                'tasks': snapshot['tasks'],
+                'progress': snapshot['progress'],
+                'labor_cost': labor_cost,
+                'material_cost': material_cost,
+                'critical_path': schedule['critical_path'] if schedule else None,
+                'expenditures': snapshot['expenditures'],
+                'total_expenditures': snapshot['total_expenditures'],
+                'documents': snapshot['documents'],
+                'worker_assignments': snapshot['worker_assignments'],
+                'subcontractors': snapshot['subcontractors']
+            }
+        
+        return api_response('api:project', project_id, version, build)
+    finally:
+        cur.close()
 
-        # Get expenditures
+@app.route('/api/v1/tasks/<int:task_id>')
+@login_required
+def api_task(task_id):
+    cur = get_db_connection()
+    try:
         cur.execute("""
-            SELECT 
-                e.expenditure_date, 
-                e.description, 
-                e.category, 
-                e.amount,
-                u.username as created_by_name
-            FROM project_expenditures e
-            LEFT JOIN users u ON e.created_by = u.user_id
-            WHERE e.project_id = %s
-            ORDER BY e.expenditure_date
-        """, (project_id,))
-        expenditures = cur.fetchall()
+            SELECT t.project_id, p.data_version
+            FROM tasks t
+            JOIN projects p ON t.project_id = p.project_id
+            WHERE t.task_id = %s
+        """, (task_id,))
+        row = cur.fetchone()
+        if not row:
+            return jsonify({'error': 'Task not found'}), 404
         
-        # Create Excel file
-        with pd.ExcelWriter('project_report.xlsx') as writer:
-            # Project summary sheet - now includes expenditures
-            summary_data = {
-                'Project Name': [project['project_name']],
-                'Start Date': [project['start_date']],
-                'End Date': [project['end_date']],
-                'Status': [project['status'].replace('_', ' ').title()],
-                'Estimated Budget': [project['estimated_budget']],
-                'Total Estimated Cost': [sum(t['estimated_cost'] for t in tasks)],
-                'Total Task Costs': [sum(t['total_cost'] for t in tasks)],
-                'Total Expenditures': [sum(e['amount'] for e in expenditures)],
-                'Total Actual Cost': [sum(t['total_cost'] for t in tasks) + sum(e['amount'] for e in expenditures)],
-                'Budget Variance': [sum(t['total_cost'] for t in tasks) + sum(e['amount'] for e in expenditures) - project['estimated_budget']]
-            }
-            pd.DataFrame(summary_data).to_excel(writer, sheet_name='Project Summary', index=False)
+        def build():
+            cur.execute("""
+                SELECT t.*, p.project_name
+                FROM tasks t
+                JOIN projects p ON t.project_id = p.project_id
+                WHERE t.task_id = %s
+            """, (task_id,))
+            task = cur.fetchone()
+            tree = load_subtree(cur, task_id)
+            subtasks = [dict(tree.tasks[subtask_id], depth=depth)
+                        for subtask_id, depth in tree.descendants(task_id)]
             
-            # Tasks sheet
-            tasks_data = []
-            for task in tasks:
-                tasks_data.append({
-                    'Task ID': task['task_id'],
-                    'Task Name': task['task_name'],
-                    'Parent Task': task['parent_task_name'] or 'Main Task',
-                    'Type': task['task_type'].title(),
-                    'Status': task['status'].replace('_', ' ').title(),
-                    'Planned Start': task['planned_start_date'],
-                    'Planned End': task['planned_end_date'],
-                    'Actual Start': task['actual_start_date'] or 'Not started',
-                    'Actual End': task['actual_end_date'] or 'In progress',
-                    'Estimated Days': task['estimated_days'],
-                    'Estimated Cost': task['estimated_cost'],
-                    'Material Cost': task['material_cost'],
-                    'Labor Cost': task['labor_cost'],
-                    'Total Cost': task['total_cost'],
-                    'Cost Variance': task['total_cost'] - task['estimated_cost']
-                })
-            tasks_df = pd.DataFrame(tasks_data)
-            tasks_df.to_excel(writer, sheet_name='Tasks', index=False)
+            cur.execute("""
+                SELECT ta.*, w.name as worker_name, w.specialization
+                FROM task_assignments ta
+                JOIN workers w ON ta.worker_id = w.worker_id
+                WHERE ta.task_id = %s
+                ORDER BY ta.assignment_date DESC
+            """, (task_id,))
+            assignments = cur.fetchall()
+            
+            cur.execute("""
+                SELECT tm.*, m.material_name, m.unit, m.unit_cost
+                FROM task_materials tm
+                JOIN materials m ON tm.material_id = m.material_id
+                WHERE tm.task_id = %s
+                ORDER BY tm.date_used DESC
+            """, (task_id,))
+            materials = cur.fetchall()
             
-            # Workers sheet
-            workers_data = []
-            for worker in workers:
-                workers_data.append({
-                    'Task ID': worker['task_id'],
-                    'Task Name': worker['task_name'],
-                    'Worker Name': worker['worker_name'],
-                    'Specialization': worker['specialization'],
-                    'Daily Wage': worker['daily_wage'],
-                    'Assignment Date': worker['assignment_date'],
-                    'Hours Worked': worker['hours_worked'],
-                    'Cost': worker['cost']
-                })
-            workers_df = pd.DataFrame(workers_data)
-            workers_df.to_excel(writer, sheet_name='Workers', index=False)
+            cur.execute("""
+                SELECT progress_id, progress_date, percentage_completed, notes
+                FROM daily_progress
+                WHERE task_id = %s
+                ORDER BY progress_date DESC
+            """, (task_id,))
+            progress = cur.fetchall()
             
-            # Materials sheet
-            materials_data = []
-            for material in materials:
-                materials_data.append({
-                    'Task ID': material['task_id'],
-                    'Task Name': material['task_name'],
-                    'Material Name': material['material_name'],
-                    'Quantity': material['quantity'],
-                    'Unit': material['unit'],
-                    'Unit Cost': material['unit_cost'],
-                    'Total Cost': material['total_cost'],
-                    'Date Used': material['date_used']
-                })
-            materials_df = pd.DataFrame(materials_data)
-            materials_df.to_excel(writer, sheet_name='Materials', index=False)
-
-            # Expenditures sheet
-            expenditures_data = []
-            for expenditure in expenditures:
-                expenditures_data.append({
-                    'Date': expenditure['expenditure_date'],
-                    'Description': expenditure['description'],
-                    'Category': expenditure['category'],
-                    'Amount': expenditure['amount'],
-                    'Added By': expenditure['created_by_name']
-                })
-            expenditures_df = pd.DataFrame(expenditures_data)
-            expenditures_df.to_excel(writer, sheet_name='Expenditures', index=False)
+            cur.execute("""
+                SELECT predecessor_id, lag_days
+                FROM task_dependencies
+                WHERE successor_id = %s
+            """, (task_id,))
+            dependencies = cur.fetchall()
             
-            # Cost Summary sheet (includes expenditures now)
-            cost_summary = {
-                'Cost Type': ['Materials', 'Labor', 'Expenditures', 'Total'],
-                'Amount': [
-                    sum(t['material_cost'] for t in tasks),
-                    sum(t['labor_cost'] for t in tasks),
-                    sum(e['amount'] for e in expenditures),
-                    sum(t['total_cost'] for t in tasks) + sum(e['amount'] for e in expenditures)
-                ]
+            return {
+                'task': task,
+                'subtasks': subtasks,
+                'subtree': tree.rollup(task_id),
+                'assignments': assignments,
+                'materials': materials,
+                'progress': progress,
+                'dependencies': dependencies
             }
-            pd.DataFrame(cost_summary).to_excel(writer, sheet_name='Cost Summary', index=False)
         
+        return api_response(f'api:task:{task_id}', row['project_id'], row['data_version'], build)
+    finally:
         cur.close()
-        return send_file('project_report.xlsx', as_attachment=True, download_name=f"{project['project_name']}_report.xlsx")
+
+@app.route('/projects/<int:project_id>/import', methods=['GET', 'POST'])
+@login_required
+def import_data(project_id):
+    cur = get_db_connection()
+    cur.execute("SELECT project_id, project_name FROM projects WHERE project_id = %s", (project_id,))
+    project = cur.fetchone()
+    cur.close()
+    
+    if not project:
+        flash("Project not found", "danger")
+        return redirect(url_for('projects'))
+    
+    if request.method == 'POST':
+        kind = request.form['kind']
+        file = request.files.get('file')
+        extension = os.path.splitext(file.filename)[1].lower() if file and file.filename else ''
+        if kind not in bulk_import.COLUMNS or extension not in ('.csv', '.xlsx'):
+            flash('Choose an import type and a .csv or .xlsx file', 'danger')
+            return redirect(url_for('import_data', project_id=project_id))
         
-    except Exception as e:
-        if cur:
-            cur.close()
-        flash(f"Error generating report: {str(e)}", "danger")
-        return redirect(url_for('project_details', project_id=project_id))
+        # Stage the upload where the job will find it, then queue the import
+        job_id = jobs.new_job_id()
+        base = jobs.artifact_base(job_id)
+        upload_path = base + '.upload' + extension
+        file.save(upload_path)
+        with open(base + '.upload.json', 'w') as f:
+            json.dump({'path': upload_path, 'user_id': session['user_id']}, f)
+        jobs.submit_job('import_' + kind, project_id, job_id=job_id)
+        return redirect(url_for('job_status', job_id=job_id))
+    
+    return render_template('import.html', project=project, columns=bulk_import.COLUMNS)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get_job(job_id)
+    if not job:
+        flash('Job not found or expired', 'danger')
+        return redirect(url_for('projects'))
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'job_id': job['job_id'],
+            'kind': job['kind'],
+            'status': job['status'],
+            'progress': job['progress'],
+            'message': job['message']
+        })
+    
+    if job['status'] == 'failed':
+        flash(f"Error generating report: {job['message']}", "danger")
+        return redirect(url_for('project_details', project_id=job['project_id']))
+    
+    if job['status'] == 'done':
+        if job['kind'].startswith('import_'):
+            return render_template('import_result.html', job=job, summary=jobs.load_artifact(job))
+        if job['kind'] == 'report':
+            return render_template('project_report.html', abs=abs, **jobs.load_artifact(job))
+        return send_file(os.path.abspath(job['artifact_path']), as_attachment=True,
+                         download_name=job['download_name'])
+    
+    return render_template('job_status.html', job=job)
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(report_cache.snapshot())
+
+@app.route('/db/pool/stats')
+def db_pool_stats():
+    return jsonify(mysql.pool.snapshot() if mysql.pool else {})
+
 # Configuration
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'doc', 'docx', 'xls', 'xlsx'}
@@ -1358,22 +1945,43 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 # Add after materials routes
-@app.route('/documents')
-# @login_required
-def documents():
-    cur = get_db_connection()
-    cur.execute("""
+def documents_page(cur, args):
+    filters, params = [], []
+    if args.get('project_id'):
+        filters.append("d.project_id = %s")
+        params.append(args['project_id'])
+    add_date_range(filters, params, "d.upload_date", args)
+    return keyset_page(cur, """
         SELECT d.*, p.project_name, u.username as uploaded_by 
         FROM documents d
         LEFT JOIN projects p ON d.project_id = p.project_id
         JOIN users u ON d.uploaded_by = u.user_id
-        ORDER BY d.upload_date DESC
-    """)
-    documents = cur.fetchall()
-    cur.execute("SELECT project_id, project_name FROM projects")
+    """, filters, params,
+        order=[('d.upload_date', 'upload_date'), ('d.document_id', 'document_id')],
+        after=args.get('after'))
+
+@app.route('/documents')
+# @login_required
+def documents():
+    cur = get_db_connection()
+    documents, next_cursor = documents_page(cur, request.args)
+    cur.execute("SELECT project_id, project_name FROM projects ORDER BY project_name")
     projects = cur.fetchall()
     cur.close()
-    return render_template('documents.html', documents=documents, projects=projects)
+    return render_template('documents.html', documents=documents, projects=projects,
+                           next_cursor=next_cursor, filters=list_filters())
+
+@app.route('/documents/data')
+# @login_required
+def documents_data():
+    cur = get_db_connection()
+    documents, next_cursor = documents_page(cur, request.args)
+    cur.close()
+    return jsonify({
+        'items': documents,
+        'next_cursor': next_cursor,
+        'html': render_template('partials/documents_rows.html', documents=documents)
+    })
 
 @app.route('/documents/upload', methods=['POST'])
 # @login_required
@@ -1401,6 +2009,8 @@ def upload_document():
             INSERT INTO documents (document_name, file_path, description, project_id, uploaded_by)
             VALUES (%s, %s, %s, %s, %s)
         """, (document_name, unique_filename, description, project_id, session['user_id']))
+        if project_id:
+            bump_project_version(cur, project_id=project_id)
         mysql.connection.commit()
         cur.close()
         
@@ -1445,6 +2055,7 @@ def delete_document(document_id):
             if os.path.exists(file_path):
                 os.remove(file_path)
             
+            bump_project_version(cur, document_id=document_id)
             cur.execute("DELETE FROM documents WHERE document_id = %s", (document_id,))
             mysql.connection.commit()
             flash('Document deleted successfully', 'success')
@@ -1458,21 +2069,46 @@ def delete_document(document_id):
     return redirect(url_for('documents'))
 
 # Add after documents routes
+def equipment_page(cur, args):
+    filters, params = [], []
+    if args.get('project_id'):
+        filters.append("e.assigned_project = %s")
+        params.append(args['project_id'])
+    if args.get('status'):
+        filters.append("e.status = %s")
+        params.append(args['status'])
+    return keyset_page(cur, """
+        SELECT e.*, p.project_name 
+        FROM equipment e
+        LEFT JOIN projects p ON e.assigned_project = p.project_id
+    """, filters, params,
+        order=[('e.equipment_name', 'equipment_name'), ('e.equipment_id', 'equipment_id')],
+        after=args.get('after'), descending=False)
+
 @app.route('/equipment')
 # @login_required
 def equipment():
     cur = get_db_connection()
-    cur.execute("""
-        SELECT e.*, p.project_name 
-        FROM equipment e
-        LEFT JOIN projects p ON e.assigned_project = p.project_id
-        ORDER BY e.equipment_name
-    """)
-    equipment_list = cur.fetchall()
-    cur.execute("SELECT project_id, project_name FROM projects")
+    equipment_list, next_cursor = equipment_page(cur, request.args)
+    cur.execute("SELECT project_id, project_name FROM projects ORDER BY project_name")
+    projects = cur.fetchall()
+    cur.close()
+    return render_template('equipment.html', equipment=equipment_list, projects=projects,
+                           next_cursor=next_cursor, filters=list_filters())
+
+@app.route('/equipment/data')
+# @login_required
+def equipment_data():
+    cur = get_db_connection()
+    equipment_list, next_cursor = equipment_page(cur, request.args)
+    cur.execute("SELECT project_id, project_name FROM projects ORDER BY project_name")
     projects = cur.fetchall()
     cur.close()
-    return render_template('equipment.html', equipment=equipment_list, projects=projects)
+    return jsonify({
+        'items': equipment_list,
+        'next_cursor': next_cursor,
+        'html': render_template('partials/equipment_rows.html', equipment=equipment_list, projects=projects)
+    })
 
 @app.route('/equipment/add', methods=['POST'])
 # @login_required
@@ -1498,6 +2134,7 @@ def add_equipment():
         purchase_date, purchase_cost, assigned_project,
         status, notes
     ))
+    mark_stale(cur, project_id=assigned_project)
     mysql.connection.commit()
     cur.close()
     
@@ -1517,6 +2154,7 @@ def update_equipment(equipment_id):
     notes = request.form.get('notes', '')
     
     cur = get_db_connection()
+    mark_stale(cur, equipment_id=equipment_id)
     cur.execute("""
         UPDATE equipment SET
             equipment_name = %s,
@@ -1533,6 +2171,7 @@ def update_equipment(equipment_id):
         purchase_date, purchase_cost, assigned_project,
         status, notes, equipment_id
     ))
+    mark_stale(cur, project_id=assigned_project)
     mysql.connection.commit()
     cur.close()
     
@@ -1543,6 +2182,7 @@ def update_equipment(equipment_id):
 # @login_required
 def delete_equipment(equipment_id):
     cur = get_db_connection()
+    mark_stale(cur, equipment_id=equipment_id)
     cur.execute("DELETE FROM equipment WHERE equipment_id = %s", (equipment_id,))
     mysql.connection.commit()
     cur.close()
@@ -1551,22 +2191,48 @@ def delete_equipment(equipment_id):
     return redirect(url_for('equipment'))
 
 # Add after equipment routes
-@app.route('/safety')
-# @login_required
-def safety():
-    cur = get_db_connection()
-    cur.execute("""
+def safety_page(cur, args):
+    filters, params = [], []
+    if args.get('project_id'):
+        filters.append("s.project_id = %s")
+        params.append(args['project_id'])
+    if args.get('severity'):
+        filters.append("s.severity = %s")
+        params.append(args['severity'])
+    add_date_range(filters, params, "s.incident_date", args)
+    return keyset_page(cur, """
         SELECT s.*, p.project_name, u.username as reported_by 
         FROM safety_incidents s
         LEFT JOIN projects p ON s.project_id = p.project_id
         JOIN users u ON s.reported_by = u.user_id
-        ORDER BY s.incident_date DESC
-    """)
-    incidents = cur.fetchall()
-    cur.execute("SELECT project_id, project_name FROM projects")
+    """, filters, params,
+        order=[('s.incident_date', 'incident_date'), ('s.incident_id', 'incident_id')],
+        after=args.get('after'))
+
+@app.route('/safety')
+# @login_required
+def safety():
+    cur = get_db_connection()
+    incidents, next_cursor = safety_page(cur, request.args)
+    cur.execute("SELECT project_id, project_name FROM projects ORDER BY project_name")
     projects = cur.fetchall()
     cur.close()
-    return render_template('safety.html', incidents=incidents, projects=projects)
+    return render_template('safety.html', incidents=incidents, projects=projects,
+                           next_cursor=next_cursor, filters=list_filters())
+
+@app.route('/safety/data')
+# @login_required
+def safety_data():
+    cur = get_db_connection()
+    incidents, next_cursor = safety_page(cur, request.args)
+    cur.execute("SELECT project_id, project_name FROM projects ORDER BY project_name")
+    projects = cur.fetchall()
+    cur.close()
+    return jsonify({
+        'items': incidents,
+        'next_cursor': next_cursor,
+        'html': render_template('partials/safety_rows.html', incidents=incidents, projects=projects)
+    })
 
 @app.route('/safety/add', methods=['POST'])
 # @login_required
@@ -1592,6 +2258,7 @@ def add_safety_incident():
         location, description, severity,
         action_taken, reported_by
     ))
+    mark_stale(cur, project_id=project_id)
     mysql.connection.commit()
     cur.close()
     
@@ -1610,6 +2277,7 @@ def update_safety_incident(incident_id):
     action_taken = request.form['action_taken']
     
     cur = get_db_connection()
+    mark_stale(cur, incident_id=incident_id)
     cur.execute("""
         UPDATE safety_incidents SET
             incident_type = %s,
@@ -1625,6 +2293,7 @@ def update_safety_incident(incident_id):
         location, description, severity,
         action_taken, incident_id
     ))
+    mark_stale(cur, project_id=project_id)
     mysql.connection.commit()
     cur.close()
     
@@ -1635,6 +2304,7 @@ def update_safety_incident(incident_id):
 # @login_required
 def delete_safety_incident(incident_id):
     cur = get_db_connection()
+    mark_stale(cur, incident_id=incident_id)
     cur.execute("DELETE FROM safety_incidents WHERE incident_id = %s", (incident_id,))
     mysql.connection.commit()
     cur.close()
@@ -1656,24 +2326,9 @@ def weather_forecast(project_id):
     location = project['location']
 
     try:
-        geo_url = f"http://api.openweathermap.org/geo/1.0/direct?q={location}&limit=1&appid={WEATHER_API_KEY}"
-        geo_response = requests.get(geo_url)
-        geo_data = geo_response.json()
-
-        if not geo_data:
-            flash('Location not found in weather service', 'danger')
-            return redirect(url_for('project_details', project_id=project_id))
-
-        lat = geo_data[0]['lat']
-        lon = geo_data[0]['lon']
-
-        weather_url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric"
-        weather_response = requests.get(weather_url)
-        weather_data = weather_response.json()
-
-        if 'list' not in weather_data:
-            flash('Weather forecast not available', 'danger')
-            return redirect(url_for('project_details', project_id=project_id))
+        # Cached geocode and forecast; concurrent misses share one fetch
+        weather_data = weather_client.location_forecast(mysql.connection, location)
+        mysql.connection.commit()
 
         forecast = []
         temp_chart = []
@@ -1711,30 +2366,83 @@ def weather_forecast(project_id):
                                temp_chart=temp_chart,
                                rain_chart=rain_chart)
 
+    except WeatherError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('project_details', project_id=project_id))
     except Exception as e:
         flash(f'Error fetching weather data: {str(e)}', 'danger')
         return redirect(url_for('project_details', project_id=project_id))
 
 
 
+@app.route('/weather/risk')
+def weather_risk_all():
+    # Upcoming outdoor tasks across all projects, from cached forecasts only
+    tasks = upcoming_outdoor_tasks(mysql.connection)
+    risks = weather_risks(mysql.connection, tasks)
+    return jsonify([
+        dict(project_id=t['project_id'], project_name=t['project_name'],
+             task_id=t['task_id'], task_name=t['task_name'],
+             planned_start_date=str(t['planned_start_date']),
+             planned_end_date=str(t['planned_end_date']),
+             **risks[t['task_id']])
+        for t in tasks if t['task_id'] in risks and risks[t['task_id']]['at_risk']
+    ])
+
+@app.route('/weather/risk/<int:project_id>')
+def weather_risk_project(project_id):
+    tasks = upcoming_outdoor_tasks(mysql.connection, project_id=project_id)
+    risks = weather_risks(mysql.connection, tasks)
+    return jsonify([
+        dict(task_id=t['task_id'], task_name=t['task_name'],
+             planned_start_date=str(t['planned_start_date']),
+             planned_end_date=str(t['planned_end_date']),
+             **risks[t['task_id']])
+        for t in tasks if t['task_id'] in risks
+    ])
+
 # Add after safety routes
-@app.route('/subcontractors')
-# @login_required
-def subcontractors():
-    cur = get_db_connection()
-    cur.execute("""
+def subcontractors_page(cur, args):
+    filters, params = [], []
+    if args.get('project_id'):
+        filters.append("""EXISTS (
+            SELECT 1 FROM subcontractor_projects fp
+            WHERE fp.subcontractor_id = s.subcontractor_id AND fp.project_id = %s
+        )""")
+        params.append(args['project_id'])
+    return keyset_page(cur, """
         SELECT s.*, GROUP_CONCAT(p.project_name SEPARATOR ', ') as projects
         FROM subcontractors s
         LEFT JOIN subcontractor_projects sp ON s.subcontractor_id = sp.subcontractor_id
         LEFT JOIN projects p ON sp.project_id = p.project_id
-        GROUP BY s.subcontractor_id
-        ORDER BY s.company_name
-    """)
-    subcontractors = cur.fetchall()
-    cur.execute("SELECT project_id, project_name FROM projects")
+    """, filters, params,
+        order=[('s.company_name', 'company_name'), ('s.subcontractor_id', 'subcontractor_id')],
+        after=args.get('after'), descending=False, group_by='s.subcontractor_id')
+
+@app.route('/subcontractors')
+# @login_required
+def subcontractors():
+    cur = get_db_connection()
+    subcontractors, next_cursor = subcontractors_page(cur, request.args)
+    cur.execute("SELECT project_id, project_name FROM projects ORDER BY project_name")
+    projects = cur.fetchall()
+    cur.close()
+    return render_template('subcontractors.html', subcontractors=subcontractors, projects=projects,
+                           next_cursor=next_cursor, filters=list_filters())
+
+@app.route('/subcontractors/data')
+# @login_required
+def subcontractors_data():
+    cur = get_db_connection()
+    subcontractors, next_cursor = subcontractors_page(cur, request.args)
+    cur.execute("SELECT project_id, project_name FROM projects ORDER BY project_name")
     projects = cur.fetchall()
     cur.close()
-    return render_template('subcontractors.html', subcontractors=subcontractors, projects=projects)
+    return jsonify({
+        'items': subcontractors,
+        'next_cursor': next_cursor,
+        'html': render_template('partials/subcontractors_rows.html', subcontractors=subcontractors, projects=projects)
+    })
 
 @app.route('/subcontractors/add', methods=['POST'])
 # @login_required
@@ -1762,6 +2470,7 @@ def add_subcontractor():
                 INSERT INTO subcontractor_projects (subcontractor_id, project_id)
                 VALUES (%s, %s)
             """, (subcontractor_id, project_id))
+        bump_project_version(cur, subcontractor_id=subcontractor_id)
         
         mysql.connection.commit()
         flash('Subcontractor added successfully', 'success')
@@ -1798,12 +2507,14 @@ def update_subcontractor(subcontractor_id):
         """, (company_name, contact_person, email, phone, specialty, contract_details, subcontractor_id))
         
         # Update projects
+        bump_project_version(cur, subcontractor_id=subcontractor_id)
         cur.execute("DELETE FROM subcontractor_projects WHERE subcontractor_id = %s", (subcontractor_id,))
         for project_id in selected_projects:
             cur.execute("""
                 INSERT INTO subcontractor_projects (subcontractor_id, project_id)
                 VALUES (%s, %s)
             """, (subcontractor_id, project_id))
+        bump_project_version(cur, subcontractor_id=subcontractor_id)
         
         mysql.connection.commit()
         flash('Subcontractor updated successfully', 'success')
@@ -1820,6 +2531,7 @@ def update_subcontractor(subcontractor_id):
 def delete_subcontractor(subcontractor_id):
     cur = get_db_connection()
     try:
+        bump_project_version(cur, subcontractor_id=subcontractor_id)
         cur.execute("DELETE FROM subcontractor_projects WHERE subcontractor_id = %s", (subcontractor_id,))
         cur.execute("DELETE FROM subcontractors WHERE subcontractor_id = %s", (subcontractor_id,))
         mysql.connection.commit()
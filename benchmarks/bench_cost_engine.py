@@ -0,0 +1,72 @@
+# Row counts and timings of the project cost query, old cartesian join vs the
+# pre-aggregated cost_engine, as assignments and materials per task grow.
+#     python -m benchmarks.bench_cost_engine [--tasks 2000]
+# The intermediate row count is what the database has to aggregate: the old
+# join produces assignments x materials rows per task, cost_engine
+# assignments + materials.
+import argparse
+import time
+
+from cost_engine import project_costs
+from tests.support import Cursor, connect
+from tests.test_cost_engine import CARTESIAN_SQL
+
+CARTESIAN_ROWS_SQL = """
+    SELECT COUNT(*) AS row_count
+    FROM tasks t
+    LEFT JOIN task_assignments ta ON t.task_id = ta.task_id
+    LEFT JOIN task_materials tm ON t.task_id = tm.task_id
+    WHERE t.project_id = %s
+"""
+
+ENGINE_ROWS_SQL = """
+    SELECT (SELECT COUNT(*) FROM tasks WHERE project_id = %s)
+         + (SELECT COUNT(*) FROM task_assignments ta JOIN tasks t ON ta.task_id = t.task_id
+            WHERE t.project_id = %s)
+         + (SELECT COUNT(*) FROM task_materials tm JOIN tasks t ON tm.task_id = t.task_id
+            WHERE t.project_id = %s) AS row_count
+"""
+
+
+def build(tasks, per_task):
+    conn = connect()
+    cur = Cursor(conn)
+    cur.execute("INSERT INTO projects (project_id, project_name) VALUES (1, 'Bench')")
+    cur.execute("INSERT INTO workers (worker_id, name, daily_wage) VALUES (1, 'W', 800)")
+    cur.executemany("INSERT INTO tasks (task_id, project_id) VALUES (%s, 1)",
+                    [(task_id,) for task_id in range(1, tasks + 1)])
+    cur.executemany("INSERT INTO task_assignments (task_id, worker_id, hours_worked) VALUES (%s, 1, 8)",
+                    [(task_id,) for task_id in range(1, tasks + 1) for _ in range(per_task)])
+    cur.executemany("INSERT INTO task_materials (task_id, total_cost) VALUES (%s, 100)",
+                    [(task_id,) for task_id in range(1, tasks + 1) for _ in range(per_task)])
+    return conn, cur
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the project cost query')
+    parser.add_argument('--tasks', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'rows/task':>9} {'base rows':>10} {'old rows':>10} {'new rows':>10} "
+          f"{'old ms':>8} {'new ms':>8}")
+    for per_task in (1, 2, 4, 8, 16):
+        conn, cur = build(args.tasks, per_task)
+        base_rows = args.tasks * (1 + 2 * per_task)
+        cur.execute(CARTESIAN_ROWS_SQL, (1,))
+        old_rows = cur.fetchone()['row_count']
+        cur.execute(ENGINE_ROWS_SQL, (1, 1, 1))
+        new_rows = cur.fetchone()['row_count']
+        old_ms = timed(lambda: (cur.execute(CARTESIAN_SQL, (1,)), cur.fetchall()))
+        new_ms = timed(lambda: project_costs(cur, 1))
+        print(f"{per_task:>9} {base_rows:>10} {old_rows:>10} {new_rows:>10} "
+              f"{old_ms:>8.1f} {new_ms:>8.1f}")
+        conn.close()
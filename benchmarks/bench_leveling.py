@@ -0,0 +1,105 @@
+# Timings of resource leveling on the 20k-task project from bench_schedule:
+# a full level_project() run, then single-task edits re-leveled over the
+# edited task's window, next to the whole-project load and CPM pass every
+# edit used to pay before leveling loaded only the window.
+#     python -m benchmarks.bench_leveling [--tasks 20000] [--edits 20]
+# Tasks are planned at their CPM early start, each needing one or two workers
+# of one of four specializations and some a crane, with crews a little larger
+# than the busiest planned day needs.
+import argparse
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from benchmarks.bench_schedule import build, generate
+from resource_leveling import level_project
+from schedule import compute_schedule, load_dependencies
+
+SKILLS = ('mason', 'electrician', 'carpenter', 'plumber')
+
+
+def build_project(tasks, deps, seed=1):
+    rng = random.Random(seed)
+    rows, dependencies = generate(tasks, deps, seed)
+    schedule = compute_schedule(rows, dependencies)
+    for row in rows:
+        row['planned_start_date'] = schedule['tasks'][row['task_id']]['early_start']
+        row['planned_end_date'] = row['planned_start_date'] + timedelta(days=row['estimated_days'] - 1)
+    conn, cur = build(rows, dependencies)
+
+    needs = []
+    for row in rows:
+        needs.append((row['task_id'], 'worker', rng.choice(SKILLS), rng.randint(1, 2)))
+        if rng.random() < 0.3:
+            needs.append((row['task_id'], 'equipment', 'crane', 1))
+    cur.executemany("""
+        INSERT INTO task_resource_needs (task_id, resource_type, skill, quantity) VALUES (%s, %s, %s, %s)
+    """, needs)
+
+    # Crews sized to the busiest planned day of each skill, plus a margin
+    planned = {row['task_id']: row for row in rows}
+    daily = {}
+    for task_id, kind, skill, quantity in needs:
+        row = planned[task_id]
+        for offset in range(row['estimated_days']):
+            key = (skill, row['planned_start_date'] + timedelta(days=offset))
+            daily[key] = daily.get(key, 0) + quantity
+    peak = {}
+    for (skill, _), quantity in daily.items():
+        peak[skill] = max(peak.get(skill, 0), quantity)
+    cur.executemany("INSERT INTO workers (name, specialization) VALUES (%s, %s)",
+                    [(f'{skill} {i}', skill) for skill in SKILLS
+                     for i in range(int(peak[skill] * 1.1) + 1)])
+    cur.executemany("INSERT INTO equipment (equipment_type) VALUES (%s)",
+                    [('crane',) for _ in range(int(peak['crane'] * 1.1) + 1)])
+    return conn, cur, rows
+
+
+def whole_project(cur):
+    # What each edit loaded and scheduled before
+    cur.execute("""
+        SELECT task_id, planned_start_date, planned_end_date, estimated_days, status
+        FROM tasks WHERE project_id = 1
+    """)
+    return compute_schedule(cur.fetchall(), load_dependencies(cur, 1))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark incremental resource leveling')
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--deps', type=int, default=3, help='max predecessors per task')
+    parser.add_argument('--edits', type=int, default=20)
+    args = parser.parse_args()
+
+    conn, cur, rows = build_project(args.tasks, args.deps)
+    result = level_project(cur, 1)
+    conn.commit()
+    print(f"full level_project, {args.tasks} tasks: {result['elapsed_ms']:.0f} ms "
+          f"({result['allocations']} allocations, {result['unallocated']} units unallocated)")
+
+    started = time.perf_counter()
+    whole_project(cur)
+    print(f"whole-project load + CPM (per edit, before): "
+          f"{(time.perf_counter() - started) * 1000:.0f} ms")
+
+    rng = random.Random(2)
+    timings, scopes = [], []
+    for _ in range(args.edits):
+        row = rows[rng.randrange(len(rows))]
+        shift = timedelta(days=rng.randint(-3, 3))
+        old = (row['planned_start_date'], row['planned_end_date'])
+        new = (old[0] + shift, old[1] + shift)
+        cur.execute("""
+            UPDATE tasks SET planned_start_date = %s, planned_end_date = %s WHERE task_id = %s
+        """, (new[0], new[1], row['task_id']))
+        started = time.perf_counter()
+        result = level_project(cur, 1, (min(old[0], new[0]), max(old[1], new[1])))
+        timings.append((time.perf_counter() - started) * 1000)
+        scopes.append(result['tasks'])
+        conn.commit()
+    # Edits in the first weeks touch the thousands of tasks without predecessors
+    print(f"windowed level_project per edit: median {statistics.median(timings):.1f} ms "
+          f"({statistics.median(scopes):.0f} tasks re-placed), "
+          f"max {max(timings):.1f} ms ({scopes[timings.index(max(timings))]} tasks)")
+    conn.close()
@@ -0,0 +1,84 @@
+# Timings of the CPM schedule on large projects.
+#     python -m benchmarks.bench_schedule [--tasks 20000] [--deps 3]
+# Each task gets up to --deps predecessors among the tasks just before it, so
+# the graph is long and wide at once. The first table is the bare
+# forward/backward pass as the project grows (it should scale linearly); the
+# second is project_schedule() on the largest project read from the SQLite
+# test database, cold and then served from the report cache.
+import argparse
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+import schedule
+from report_cache import ReportCache
+from schedule import compute_schedule, project_schedule
+from tests.support import Cursor, connect
+
+START = date(2024, 1, 1)
+
+
+def generate(tasks, deps, seed=1):
+    rng = random.Random(seed)
+    rows = []
+    dependencies = []
+    for task_id in range(1, tasks + 1):
+        rows.append({
+            'task_id': task_id,
+            'planned_start_date': START + timedelta(days=task_id % 30),
+            'planned_end_date': None,
+            'estimated_days': rng.randint(1, 10)
+        })
+        window = range(max(1, task_id - 50), task_id)
+        for predecessor_id in rng.sample(window, min(len(window), rng.randint(0, deps))):
+            dependencies.append((predecessor_id, task_id, rng.choice((0, 0, 1, 2))))
+    return rows, dependencies
+
+
+def build(rows, dependencies):
+    conn = connect()
+    cur = Cursor(conn)
+    cur.execute("INSERT INTO projects (project_id, project_name) VALUES (1, 'Bench')")
+    cur.executemany("""
+        INSERT INTO tasks (task_id, project_id, planned_start_date, planned_end_date, estimated_days)
+        VALUES (%s, 1, %s, %s, %s)
+    """, [(r['task_id'], r['planned_start_date'], r['planned_end_date'], r['estimated_days'])
+          for r in rows])
+    cur.executemany("""
+        INSERT INTO task_dependencies (predecessor_id, successor_id, lag_days) VALUES (%s, %s, %s)
+    """, dependencies)
+    return conn, cur
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the CPM schedule')
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--deps', type=int, default=3, help='max predecessors per task')
+    args = parser.parse_args()
+
+    print(f"{'tasks':>7} {'deps':>7} {'ms':>8} {'us/task':>8} {'critical':>9}")
+    for tasks in (args.tasks // 8, args.tasks // 4, args.tasks // 2, args.tasks):
+        rows, dependencies = generate(tasks, args.deps)
+        ms, result = timed(lambda: compute_schedule(rows, dependencies))
+        print(f"{tasks:>7} {len(dependencies):>7} {ms:>8.1f} {ms * 1000 / tasks:>8.2f} "
+              f"{len(result['critical_path']):>9}")
+
+    conn, cur = build(rows, dependencies)
+    with tempfile.TemporaryDirectory() as folder:
+        schedule.report_cache = ReportCache(folder=folder)
+        cold_ms, _ = timed(lambda: project_schedule(cur, 1), repeat=1)
+        warm_ms, _ = timed(lambda: project_schedule(cur, 1))
+    print(f"project_schedule, {args.tasks} tasks: {cold_ms:.1f} ms cold "
+          f"(load + compute + cache), {warm_ms:.1f} ms cached")
+    conn.close()
@@ -0,0 +1,96 @@
+# Timings of the task-tree engine on one large project, next to the
+# level-by-level loading it replaced (one children query per task).
+#     python -m benchmarks.bench_task_tree [--tasks 10000] [--fanout 4]
+# Tasks hang under a single root task, each with up to --fanout children, so
+# the root's subtree is the whole project. Every task has one progress row,
+# an assignment and a material row, so the cascading delete has real rows to
+# remove.
+import argparse
+import time
+
+from task_tree import delete_subtree, load_subtree, rebuild_closure
+from tests.support import Cursor, connect
+
+
+def build(tasks, fanout):
+    conn = connect()
+    cur = Cursor(conn)
+    cur.execute("INSERT INTO projects (project_id, project_name) VALUES (1, 'Bench')")
+    cur.execute("INSERT INTO workers (worker_id, name, daily_wage) VALUES (1, 'W', 800)")
+    rows = []
+    for task_id in range(1, tasks + 1):
+        parent_id = (task_id - 2) // fanout + 1 if task_id > 1 else None
+        rows.append((task_id, parent_id, 1000 + task_id % 500, task_id % 300))
+    cur.executemany("""
+        INSERT INTO tasks (task_id, project_id, parent_task_id, estimated_cost, actual_cost)
+        VALUES (%s, 1, %s, %s, %s)
+    """, rows)
+    ids = [(task_id,) for task_id in range(1, tasks + 1)]
+    cur.executemany("""
+        INSERT INTO daily_progress (task_id, progress_date, percentage_completed)
+        VALUES (%s, '2024-01-01', 50)
+    """, ids)
+    cur.executemany("INSERT INTO task_assignments (task_id, worker_id, hours_worked) VALUES (%s, 1, 8)",
+                    ids)
+    cur.executemany("INSERT INTO task_materials (task_id, total_cost) VALUES (%s, 100)", ids)
+    return conn, cur
+
+
+def load_by_level(cur, task_id):
+    # What task_details used to do, taken to every depth: one query per task
+    cur.execute("SELECT * FROM tasks WHERE task_id = %s", (task_id,))
+    tasks = [cur.fetchone()]
+    queue = [task_id]
+    while queue:
+        parent_id = queue.pop()
+        cur.execute("""
+            SELECT * FROM tasks WHERE parent_task_id = %s ORDER BY planned_start_date
+        """, (parent_id,))
+        children = cur.fetchall()
+        tasks.extend(children)
+        queue.extend(child['task_id'] for child in children)
+    return tasks
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the task-tree engine')
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--fanout', type=int, default=4)
+    args = parser.parse_args()
+
+    conn, cur = build(args.tasks, args.fanout)
+    rebuild_ms, closure_rows = timed(lambda: rebuild_closure(cur), repeat=1)
+    print(f"{args.tasks} tasks, fanout {args.fanout}, {closure_rows} closure rows "
+          f"(rebuilt in {rebuild_ms:.0f} ms)")
+
+    old_ms, old_tasks = timed(lambda: load_by_level(cur, 1))
+    load_ms, tree = timed(lambda: load_subtree(cur, 1))
+    leaf = args.tasks
+    depth = len(tree.ancestors(leaf))
+    print(f"{'load tree, query per task':<32} {old_ms:>9.1f} ms  ({len(old_tasks)} tasks, "
+          f"{len(old_tasks)} queries)")
+    print(f"{'load tree, closure join':<32} {load_ms:>9.1f} ms  ({len(tree.tasks)} tasks, 2 queries)")
+
+    rollup_ms, rollup = timed(lambda: tree.rollup(1))
+    print(f"{'rollup of the root':<32} {rollup_ms:>9.1f} ms  (progress {rollup['progress']}%)")
+    ancestors_ms, _ = timed(lambda: tree.ancestors(leaf))
+    print(f"{'ancestors of a leaf':<32} {ancestors_ms:>9.3f} ms  (depth {depth})")
+    descendants_ms, below = timed(lambda: tree.descendants(2))
+    print(f"{'descendants of a top branch':<32} {descendants_ms:>9.1f} ms  ({len(below)} tasks)")
+
+    started = time.perf_counter()
+    deleted = delete_subtree(cur, 2)
+    conn.commit()
+    delete_ms = (time.perf_counter() - started) * 1000
+    print(f"{'delete a top branch':<32} {delete_ms:>9.1f} ms  ({len(deleted)} tasks, one transaction)")
+    conn.close()
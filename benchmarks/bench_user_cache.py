@@ -0,0 +1,100 @@
+# Requests per second of an authenticated page load, before and after the
+# user identity cache.
+#     python -m benchmarks.bench_user_cache [--requests 5000] [--rtt 0.3]
+# Each request resolves the current user the way app.py does: load_user() for
+# Flask-Login and get_user_role() for the page. Before the cache that was two
+# users queries per request; with user_cache it is none once the user is warm.
+# The users table lives in in-memory SQLite, so --rtt adds a simulated network
+# round trip (ms) per query to stand in for MySQL.
+import argparse
+import time
+
+from flask import Flask, session
+
+import user_cache
+from tests.support import Cursor, connect
+
+USERS = 50
+
+
+def build():
+    conn = connect()
+    cur = Cursor(conn)
+    cur.execute("""
+        CREATE TABLE users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL UNIQUE,
+            role TEXT NOT NULL
+        )
+    """)
+    cur.executemany("INSERT INTO users (user_id, username, role) VALUES (%s, %s, %s)",
+                    [(user_id, f'user{user_id}', 'manager') for user_id in range(1, USERS + 1)])
+    return conn, cur
+
+
+def make_app(cur, cached, rtt):
+    app = Flask(__name__)
+    app.secret_key = 'bench'
+    queries = {'count': 0}
+
+    def fetch_user(user_id):
+        queries['count'] += 1
+        if rtt:
+            time.sleep(rtt / 1000)
+        cur.execute("SELECT user_id, username, role FROM users WHERE user_id = %s", (user_id,))
+        return cur.fetchone()
+
+    def load_user(user_id):
+        if cached:
+            return user_cache.get_cached_user(user_id, fetch_user)
+        return fetch_user(user_id)
+
+    def get_user_role():
+        if cached and 'role' in session:
+            return session['role']
+        return fetch_user(session['user_id'])['role']
+
+    @app.route('/login/<int:user_id>')
+    def login(user_id):
+        session['user_id'] = user_id
+        session['role'] = 'manager'
+        return 'ok'
+
+    @app.route('/page')
+    def page():
+        user = load_user(session['user_id'])
+        return f"{user['username']} {get_user_role()}"
+
+    return app, queries
+
+
+def run(cur, cached, requests, rtt):
+    user_cache._users = user_cache.TTLCache()
+    app, queries = make_app(cur, cached, rtt)
+    clients = []
+    for user_id in range(1, USERS + 1):
+        client = app.test_client()
+        client.get(f'/login/{user_id}')
+        clients.append(client)
+
+    queries['count'] = 0
+    started = time.perf_counter()
+    for i in range(requests):
+        response = clients[i % USERS].get('/page')
+        assert response.status_code == 200
+    elapsed = time.perf_counter() - started
+    return requests / elapsed, queries['count'] / requests
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the user identity cache')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--rtt', type=float, default=0.3, help='simulated ms per users query')
+    args = parser.parse_args()
+
+    conn, cur = build()
+    print(f"{'':>8} {'req/s':>10} {'queries/req':>12}")
+    for label, cached in (('before', False), ('after', True)):
+        rate, per_request = run(cur, cached, args.requests, args.rtt)
+        print(f"{label:>8} {rate:>10.0f} {per_request:>12.2f}")
+    conn.close()
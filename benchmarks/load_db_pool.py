@@ -0,0 +1,114 @@
+# Load test for db_pool against a local MySQL.
+# Worker threads each run short "requests" (check out a connection, run one
+# indexed query, check it back in) and the run reports throughput, latency
+# percentiles and the pool's own metrics, next to a baseline that opens a
+# fresh connection per request the way flask_mysqldb did.
+#     MYSQL_USER=... MYSQL_PASSWORD=... MYSQL_DB=project_management \
+#         python -m benchmarks.load_db_pool --threads 32 --requests 200
+import argparse
+import os
+import threading
+import time
+
+import MySQLdb
+import MySQLdb.cursors
+
+from db_pool import ConnectionPool
+
+QUERY = "SELECT project_id, data_version FROM projects ORDER BY project_id LIMIT 1"
+
+
+def connect_args():
+    return {
+        'host': os.environ.get('MYSQL_HOST', '127.0.0.1'),
+        'port': int(os.environ.get('MYSQL_PORT', 3306)),
+        'user': os.environ['MYSQL_USER'],
+        'passwd': os.environ.get('MYSQL_PASSWORD', ''),
+        'db': os.environ.get('MYSQL_DB', 'project_management'),
+        'charset': 'utf8mb4',
+        'use_unicode': True,
+        'cursorclass': MySQLdb.cursors.DictCursor
+    }
+
+
+def run(label, request, threads, requests):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker():
+        mine = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            try:
+                request()
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    def pct(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000 if latencies else 0
+    print(f"{label:<10} {len(latencies) / elapsed:>9.0f} req/s   p50 {pct(0.5):6.2f} ms   "
+          f"p95 {pct(0.95):6.2f} ms   p99 {pct(0.99):6.2f} ms   errors {len(errors)}")
+    return errors
+
+
+def query(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute(QUERY)
+        cur.fetchall()
+    finally:
+        cur.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the MySQL connection pool')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=200, help='requests per thread')
+    parser.add_argument('--min-size', type=int, default=2)
+    parser.add_argument('--max-size', type=int, default=10)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    args = parser.parse_args()
+
+    params = connect_args()
+
+    def unpooled():
+        conn = MySQLdb.connect(**params)
+        try:
+            query(conn)
+        finally:
+            conn.close()
+
+    pool = ConnectionPool(params, min_size=args.min_size, max_size=args.max_size,
+                          timeout=args.timeout)
+    pool.fill()
+
+    def pooled():
+        conn = pool.checkout()
+        try:
+            query(conn)
+        finally:
+            pool.checkin(conn)
+
+    print(f"{args.threads} threads x {args.requests} requests")
+    run('unpooled', unpooled, args.threads, args.requests)
+    run('pooled', pooled, args.threads, args.requests)
+    stats = pool.snapshot()
+    print(f"pool: size {stats['size']}/{stats['max_size']}, checkouts {stats['checkouts']}, "
+          f"waits {stats['waits']}, avg wait {stats['avg_wait'] * 1000:.2f} ms, "
+          f"max wait {stats['max_wait'] * 1000:.2f} ms, timeouts {stats['timeouts']}, "
+          f"created {stats['created']}, ping failures {stats['ping_failures']}")
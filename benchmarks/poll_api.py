@@ -0,0 +1,96 @@
+# Poll throughput of a running app: the project_details HTML page the site
+# clients used to poll, the JSON API with a fresh fetch each time, and the
+# JSON API with If-None-Match, which answers 304 after a single version lookup.
+#     python app.py &
+#     BENCH_USER=... BENCH_PASSWORD=... python -m benchmarks.poll_api \
+#         --url http://127.0.0.1:5000 --project 1 --task 1 --threads 8 --requests 200
+# Every thread keeps its own logged-in, keep-alive session.
+import argparse
+import os
+import threading
+import time
+
+import requests
+
+
+def login(base_url):
+    session = requests.Session()
+    response = session.post(f'{base_url}/login', data={
+        'username': os.environ['BENCH_USER'],
+        'password': os.environ['BENCH_PASSWORD']
+    }, allow_redirects=False)
+    if response.status_code != 302:
+        raise SystemExit('Login failed; check BENCH_USER and BENCH_PASSWORD')
+    return session
+
+
+def run(label, poll, sessions, requests_per_thread):
+    latencies = []
+    sizes = []
+    statuses = {}
+    errors = []
+    lock = threading.Lock()
+
+    def worker(session):
+        mine = []
+        my_bytes = 0
+        my_statuses = {}
+        for _ in range(requests_per_thread):
+            started = time.perf_counter()
+            try:
+                response = poll(session)
+            except requests.RequestException as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            mine.append(time.perf_counter() - started)
+            my_bytes += len(response.content)
+            my_statuses[response.status_code] = my_statuses.get(response.status_code, 0) + 1
+        with lock:
+            latencies.extend(mine)
+            sizes.append(my_bytes)
+            for status, count in my_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    pool = [threading.Thread(target=worker, args=(session,)) for session in sessions]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    def pct(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000 if latencies else 0
+    per_response = sum(sizes) / len(latencies) if latencies else 0
+    codes = ', '.join(f'{status}: {count}' for status, count in sorted(statuses.items()))
+    print(f"{label:<16} {len(latencies) / elapsed:>8.0f} req/s   p50 {pct(0.5):7.2f} ms   "
+          f"p95 {pct(0.95):7.2f} ms   {per_response:>9.0f} B/resp   [{codes}]   "
+          f"errors {len(errors)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark polling the project and task views')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--project', type=int, required=True)
+    parser.add_argument('--task', type=int, help='also poll this task')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requests per thread')
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip('/')
+    sessions = [login(base_url) for _ in range(args.threads)]
+
+    views = [('project', f'/projects/{args.project}', f'/api/v1/projects/{args.project}')]
+    if args.task:
+        views.append(('task', f'/tasks/{args.task}', f'/api/v1/tasks/{args.task}'))
+
+    print(f"{args.threads} threads x {args.requests} requests")
+    for name, page, api in views:
+        etag = sessions[0].get(base_url + api).headers.get('ETag')
+
+        run(f'{name} html', lambda s: s.get(base_url + page), sessions, args.requests)
+        run(f'{name} json', lambda s: s.get(base_url + api), sessions, args.requests)
+        run(f'{name} json 304', lambda s: s.get(base_url + api, headers={'If-None-Match': etag}),
+            sessions, args.requests)
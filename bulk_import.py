@@ -0,0 +1,334 @@
+# Bulk CSV/XLSX import of tasks, worker assignments, material usage and daily
+# progress into one project.
+# Rows are streamed from the file, validated in chunks against lookups loaded
+# once per import, and written with executemany, one transaction per chunk.
+# Rows that fail validation are skipped and reported with their line number,
+# as are assignments that would book a worker past MAX_DAY_HOURS in a day.
+# Cost ledger deltas are summed per task and applied set-wise with each chunk;
+# the other per-row side effects of the single-row routes (closure table,
+# progress rollup, task status, data_version) are applied once for the
+# project at the end instead of once per row.
+#
+# Imports run in the job pool (see run_job_handler in app.py), or directly:
+#     python bulk_import.py assignments timesheets.csv --project 3 --user 1
+import argparse
+import csv
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+import cost_ledger
+from progress_rollup import rebuild_progress
+from report_cache import bump_project_version
+from task_tree import rebuild_closure
+from worker_utilization import MAX_DAY_HOURS, booked_hours
+
+CHUNK_SIZE = 5000
+MAX_ERRORS = 200
+
+TASK_TYPES = ('daily', 'weekly', 'monthly', 'yearly')
+
+# Required and optional columns per import kind
+COLUMNS = {
+    'tasks': (['task_name', 'task_type', 'planned_start_date', 'planned_end_date',
+               'estimated_days', 'estimated_cost'],
+              ['description', 'parent_task_id', 'is_outdoor']),
+    'assignments': (['task_id', 'worker_id', 'assignment_date', 'hours_worked'], ['notes']),
+    'materials': (['task_id', 'material_id', 'quantity', 'date_used'], ['notes']),
+    'progress': (['task_id', 'progress_date', 'percentage_completed'], ['notes'])
+}
+
+
+class BulkImportError(ValueError):
+    pass
+
+
+def _date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value).strip())
+
+
+def _int(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return int(str(value).strip())
+
+
+def _decimal(value):
+    try:
+        return Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f'not a number: {value!r}')
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def read_rows(path):
+    """Yield (line_number, {column: value}) from a CSV or XLSX file."""
+    if path.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [_text(h).lower() for h in next(rows, [])]
+            for line, values in enumerate(rows, start=2):
+                if any(v not in (None, '') for v in values):
+                    yield line, dict(zip(header, values))
+        finally:
+            workbook.close()
+        return
+
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = [h.strip().lower() for h in next(reader, [])]
+        for line, values in enumerate(reader, start=2):
+            if any(v.strip() for v in values):
+                yield line, dict(zip(header, values))
+
+
+def count_rows(path):
+    """Data rows in the file (for progress reporting only)."""
+    if path.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        try:
+            return max((workbook.active.max_row or 1) - 1, 0)
+        finally:
+            workbook.close()
+    with open(path, 'rb') as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def _chunks(rows, size=CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _lookups(cur, kind, project_id):
+    cur.execute("SELECT task_id FROM tasks WHERE project_id = %s", (project_id,))
+    lookups = {'tasks': {row['task_id'] for row in cur.fetchall()}}
+    if kind == 'assignments':
+        cur.execute("SELECT worker_id FROM workers")
+        lookups['workers'] = {row['worker_id'] for row in cur.fetchall()}
+    if kind == 'materials':
+        cur.execute("SELECT material_id, unit_cost FROM materials")
+        lookups['materials'] = {row['material_id']: Decimal(str(row['unit_cost'])) for row in cur.fetchall()}
+    return lookups
+
+
+def _parse(kind, row, project_id, user_id, lookups):
+    """Turn one file row into the insert tuple for its table."""
+    if kind == 'tasks':
+        task_type = _text(row['task_type']).lower()
+        if task_type not in TASK_TYPES:
+            raise ValueError(f'task_type must be one of {", ".join(TASK_TYPES)}')
+        start, end = _date(row['planned_start_date']), _date(row['planned_end_date'])
+        if end < start:
+            raise ValueError('planned_end_date is before planned_start_date')
+        parent_task_id = _int(row['parent_task_id']) if _text(row.get('parent_task_id')) else None
+        if parent_task_id is not None and parent_task_id not in lookups['tasks']:
+            raise ValueError(f'parent task {parent_task_id} is not in this project')
+        is_outdoor = _text(row.get('is_outdoor')).lower() not in ('0', 'no', 'false', 'n')
+        return (project_id, _text(row['task_name']), _text(row.get('description')), task_type,
+                parent_task_id, start, end, _int(row['estimated_days']),
+                _decimal(row['estimated_cost']), 1 if is_outdoor else 0)
+
+    task_id = _int(row['task_id'])
+    if task_id not in lookups['tasks']:
+        raise ValueError(f'task {task_id} is not in this project')
+
+    if kind == 'assignments':
+        worker_id = _int(row['worker_id'])
+        if worker_id not in lookups['workers']:
+            raise ValueError(f'unknown worker {worker_id}')
+        hours = _decimal(row['hours_worked'])
+        if not 0 < hours <= 24:
+            raise ValueError('hours_worked must be between 0 and 24')
+        return (task_id, worker_id, _date(row['assignment_date']), hours, _text(row.get('notes')))
+
+    if kind == 'materials':
+        material_id = _int(row['material_id'])
+        if material_id not in lookups['materials']:
+            raise ValueError(f'unknown material {material_id}')
+        quantity = _decimal(row['quantity'])
+        if quantity <= 0:
+            raise ValueError('quantity must be positive')
+        return (task_id, material_id, quantity, quantity * lookups['materials'][material_id],
+                _date(row['date_used']), _text(row.get('notes')))
+
+    percentage = _decimal(row['percentage_completed'])
+    if not 0 <= percentage <= 100:
+        raise ValueError('percentage_completed must be between 0 and 100')
+    return (task_id, _date(row['progress_date']), percentage, _text(row.get('notes')), user_id)
+
+
+INSERT_SQL = {
+    'tasks': """
+        INSERT INTO tasks (
+            project_id, task_name, description, task_type, parent_task_id,
+            planned_start_date, planned_end_date, estimated_days, estimated_cost, is_outdoor
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """,
+    'assignments': """
+        INSERT INTO task_assignments (task_id, worker_id, assignment_date, hours_worked, notes)
+        VALUES (%s, %s, %s, %s, %s)
+    """,
+    'materials': """
+        INSERT INTO task_materials (task_id, material_id, quantity, total_cost, date_used, notes)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """,
+    'progress': """
+        INSERT INTO daily_progress (task_id, progress_date, percentage_completed, notes, created_by)
+        VALUES (%s, %s, %s, %s, %s)
+    """
+}
+
+
+def _overbooked(cur, parsed):
+    """Split parsed assignment rows into accepted records and errors for
+    rows that would book a worker past the daily limit.
+
+    One indexed lookup per chunk gives the hours already booked (including
+    earlier chunks of this file); rows are then added in file order. The
+    chunk's workers stay locked until the chunk commits.
+    """
+    booked = booked_hours(cur, [(record[1], record[2]) for _, record in parsed], lock=True)
+    accepted, errors = [], []
+    for line, record in parsed:
+        key = (record[1], record[2])
+        total = booked.get(key, Decimal('0')) + record[3]
+        if total > MAX_DAY_HOURS:
+            errors.append({'line': line, 'error': f'worker {record[1]} would be booked for '
+                                                  f'{total} hours on {record[2]} (limit {MAX_DAY_HOURS})'})
+            continue
+        booked[key] = total
+        accepted.append(record)
+    return accepted, errors
+
+
+def _finish(cur, kind, project_id, task_ids):
+    """Apply the per-row side effects once for everything imported."""
+    if kind == 'tasks':
+        rebuild_closure(cur, project_id)
+        rebuild_progress(cur, project_id)
+    elif kind == 'progress':
+        rebuild_progress(cur, project_id)
+
+    ids = sorted(task_ids)
+    for start in range(0, len(ids), 1000):
+        batch = ids[start:start + 1000]
+        placeholders = ', '.join(['%s'] * len(batch))
+        if kind == 'assignments':
+            cur.execute(f"""
+                UPDATE tasks SET status = 'in_progress'
+                WHERE task_id IN ({placeholders}) AND status = 'not_started'
+            """, batch)
+        elif kind == 'progress':
+            cur.execute(f"""
+                UPDATE tasks t
+                JOIN (
+                    SELECT task_id, MIN(progress_date) AS done_date
+                    FROM daily_progress
+                    WHERE task_id IN ({placeholders}) AND percentage_completed >= 100
+                    GROUP BY task_id
+                ) done ON done.task_id = t.task_id
+                SET t.status = 'completed', t.actual_end_date = done.done_date
+                WHERE t.status != 'completed'
+            """, batch)
+    bump_project_version(cur, project_id=project_id)
+
+
+def import_file(conn, kind, path, project_id, user_id, progress=None):
+    """Import a file into a project; returns a summary dict.
+
+    conn is a DB-API connection with dict cursors; each chunk commits on its
+    own, so a failure part-way keeps the chunks already written.
+    """
+    if kind not in COLUMNS:
+        raise BulkImportError(f'Unknown import type: {kind}')
+    required, optional = COLUMNS[kind]
+
+    cur = conn.cursor()
+    try:
+        lookups = _lookups(cur, kind, project_id)
+        total_rows = count_rows(path) if progress else 0
+        summary = {'kind': kind, 'rows': 0, 'imported': 0, 'errors': []}
+        task_ids = set()
+
+        for chunk in _chunks(read_rows(path)):
+            if summary['rows'] == 0:
+                missing = [c for c in required if c not in chunk[0][1]]
+                if missing:
+                    raise BulkImportError(f"Missing columns: {', '.join(missing)}")
+
+            parsed = []
+            for line, row in chunk:
+                summary['rows'] += 1
+                try:
+                    parsed.append((line, _parse(kind, row, project_id, user_id, lookups)))
+                except (ValueError, TypeError, KeyError) as e:
+                    if len(summary['errors']) < MAX_ERRORS:
+                        summary['errors'].append({'line': line, 'error': str(e)})
+
+            if kind == 'assignments' and parsed:
+                values, errors = _overbooked(cur, parsed)
+                summary['errors'].extend(errors[:max(MAX_ERRORS - len(summary['errors']), 0)])
+            else:
+                values = [record for _, record in parsed]
+            if kind != 'tasks':
+                task_ids.update(record[0] for record in values)
+
+            if values:
+                cur.executemany(INSERT_SQL[kind], values)
+                # Costs of the imported rows go in with the chunk that holds them
+                if kind == 'assignments':
+                    cost_ledger.apply_assignments(cur, project_id, [
+                        (task_id, worker_id, hours) for task_id, worker_id, _, hours, _ in values])
+                elif kind == 'materials':
+                    cost_ledger.apply_materials(cur, project_id, [
+                        (task_id, total_cost) for task_id, _, _, total_cost, _, _ in values])
+                summary['imported'] += len(values)
+            # Also releases the worker locks of a chunk with nothing to insert
+            conn.commit()
+            if progress and total_rows:
+                progress(min(summary['rows'] / total_rows, 1) * 0.9,
+                         f"Imported {summary['imported']} of {summary['rows']} rows")
+
+        summary['skipped'] = summary['rows'] - summary['imported']
+        if summary['imported']:
+            if progress:
+                progress(0.9, 'Updating costs and progress')
+            _finish(cur, kind, project_id, task_ids)
+            conn.commit()
+        return summary
+    finally:
+        cur.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk import rows into a project')
+    parser.add_argument('kind', choices=sorted(COLUMNS))
+    parser.add_argument('path', help='CSV or XLSX file with a header row')
+    parser.add_argument('--project', type=int, required=True)
+    parser.add_argument('--user', type=int, required=True, help='user recorded as creator of progress rows')
+    args = parser.parse_args()
+
+    from app import app, mysql
+
+    with app.app_context():
+        result = import_file(mysql.connection, args.kind, args.path, args.project, args.user)
+    print(f"Imported {result['imported']} of {result['rows']} rows")
+    for error in result['errors']:
+        print(f"  line {error['line']}: {error['error']}")
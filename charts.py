@@ -0,0 +1,153 @@
+# Server-rendered project charts.
+# Each chart is one aggregate query turned into a small SVG document, built by
+# hand so no plotting library is needed. Rendered bytes are cached in
+# report_cache under the project's data_version, and the same key doubles as
+# the HTTP ETag, so a browser revalidating an unchanged chart costs one
+# indexed version lookup.
+import math
+from xml.sax.saxutils import escape
+
+from report_cache import ReportCache
+
+WIDTH = 480
+HEIGHT = 300
+PALETTE = ['#3498db', '#27ae60', '#f39c12', '#e74c3c', '#9b59b6', '#1abc9c', '#34495e', '#95a5a6']
+STATUS_COLORS = {
+    'completed': '#27ae60',
+    'in_progress': '#3498db',
+    'not_started': '#95a5a6',
+    'delayed': '#e74c3c'
+}
+
+
+def chart_etag(chart_type, project_id, version):
+    return ReportCache.key(f'chart:{chart_type}', project_id, version)
+
+
+def _label(value):
+    return str(value).replace('_', ' ').title()
+
+
+def _svg(body):
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" '
+        f'viewBox="0 0 {WIDTH} {HEIGHT}" font-family="Segoe UI, Tahoma, sans-serif" font-size="12">'
+        f'{body}</svg>'
+    ).encode('utf-8')
+
+
+def _empty(message):
+    return _svg(f'<text x="{WIDTH / 2}" y="{HEIGHT / 2}" text-anchor="middle" fill="#6c757d">'
+                f'{escape(message)}</text>')
+
+
+def donut_svg(items, colors=None):
+    """items: [(label, value)]; a donut with a legend on the right."""
+    items = [(label, float(value or 0)) for label, value in items if value]
+    total = sum(value for _, value in items)
+    if not total:
+        return _empty('No data yet')
+
+    cx, cy, outer, inner = 140, HEIGHT / 2, 110, 60
+    parts = []
+    angle = -math.pi / 2
+    for i, (label, value) in enumerate(items):
+        color = (colors or {}).get(label) or PALETTE[i % len(PALETTE)]
+        sweep = 2 * math.pi * value / total
+        if sweep >= 2 * math.pi - 1e-9:
+            parts.append(f'<circle cx="{cx}" cy="{cy}" r="{(outer + inner) / 2}" fill="none" '
+                         f'stroke="{color}" stroke-width="{outer - inner}"/>')
+        else:
+            end = angle + sweep
+            large = 1 if sweep > math.pi else 0
+            x1, y1 = cx + outer * math.cos(angle), cy + outer * math.sin(angle)
+            x2, y2 = cx + outer * math.cos(end), cy + outer * math.sin(end)
+            x3, y3 = cx + inner * math.cos(end), cy + inner * math.sin(end)
+            x4, y4 = cx + inner * math.cos(angle), cy + inner * math.sin(angle)
+            parts.append(
+                f'<path d="M{x1:.2f},{y1:.2f} A{outer},{outer} 0 {large} 1 {x2:.2f},{y2:.2f} '
+                f'L{x3:.2f},{y3:.2f} A{inner},{inner} 0 {large} 0 {x4:.2f},{y4:.2f} Z" fill="{color}"/>')
+            angle = end
+
+        y = 40 + i * 24
+        parts.append(f'<rect x="290" y="{y - 10}" width="12" height="12" fill="{color}"/>')
+        parts.append(f'<text x="308" y="{y}">{escape(_label(label))}: '
+                     f'{value:,.0f} ({value / total * 100:.0f}%)</text>')
+    return _svg(''.join(parts))
+
+
+def bar_svg(items, colors=None):
+    """items: [(label, value)]; vertical bars with value labels."""
+    items = [(label, float(value or 0)) for label, value in items]
+    peak = max((value for _, value in items), default=0)
+    if not peak:
+        return _empty('No data yet')
+
+    left, top, bottom = 20, 30, HEIGHT - 40
+    slot = (WIDTH - 2 * left) / len(items)
+    parts = [f'<line x1="{left}" y1="{bottom}" x2="{WIDTH - left}" y2="{bottom}" stroke="#adb5bd"/>']
+    for i, (label, value) in enumerate(items):
+        color = (colors or {}).get(label) or PALETTE[i % len(PALETTE)]
+        height = (bottom - top) * value / peak
+        x = left + i * slot + slot * 0.15
+        parts.append(f'<rect x="{x:.2f}" y="{bottom - height:.2f}" width="{slot * 0.7:.2f}" '
+                     f'height="{height:.2f}" fill="{color}"/>')
+        center = left + i * slot + slot / 2
+        parts.append(f'<text x="{center:.2f}" y="{bottom - height - 6:.2f}" text-anchor="middle">'
+                     f'₹{value:,.0f}</text>')
+        parts.append(f'<text x="{center:.2f}" y="{bottom + 18}" text-anchor="middle">'
+                     f'{escape(_label(label))}</text>')
+    return _svg(''.join(parts))
+
+
+def task_status_chart(cur, project_id):
+    cur.execute("""
+        SELECT status, COUNT(*) AS count
+        FROM tasks
+        WHERE project_id = %s
+        GROUP BY status
+        ORDER BY count DESC
+    """, (project_id,))
+    return donut_svg([(row['status'], row['count']) for row in cur.fetchall()], STATUS_COLORS)
+
+
+def budget_vs_actual_chart(cur, project_id):
+    cur.execute("""
+        SELECT p.estimated_budget,
+               (SELECT COALESCE(SUM(l.labor_cost), 0)
+                FROM task_cost_ledger l WHERE l.project_id = p.project_id) AS labor_cost,
+               (SELECT COALESCE(SUM(l.material_cost), 0)
+                FROM task_cost_ledger l WHERE l.project_id = p.project_id) AS material_cost,
+               (SELECT COALESCE(SUM(e.amount), 0)
+                FROM project_expenditures e WHERE e.project_id = p.project_id) AS expenditures
+        FROM projects p
+        WHERE p.project_id = %s
+    """, (project_id,))
+    row = cur.fetchone()
+    actual = float(row['labor_cost']) + float(row['material_cost']) + float(row['expenditures'])
+    over = actual > float(row['estimated_budget'] or 0)
+    return bar_svg([
+        ('budget', row['estimated_budget']),
+        ('labor', row['labor_cost']),
+        ('materials', row['material_cost']),
+        ('expenditures', row['expenditures']),
+        ('total_actual', actual)
+    ], {'budget': '#34495e', 'total_actual': '#e74c3c' if over else '#27ae60'})
+
+
+def expenditure_categories_chart(cur, project_id):
+    cur.execute("""
+        SELECT COALESCE(category, 'Other') AS category, SUM(amount) AS total
+        FROM project_expenditures
+        WHERE project_id = %s
+        GROUP BY COALESCE(category, 'Other')
+        ORDER BY total DESC
+    """, (project_id,))
+    return donut_svg([(row['category'], row['total']) for row in cur.fetchall()])
+
+
+CHARTS = {
+    'task_status': task_status_chart,
+    'budget_vs_actual': budget_vs_actual_chart,
+    'expenditure_categories': expenditure_categories_chart
+}
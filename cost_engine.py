@@ -0,0 +1,51 @@
+# Labor and material cost rollups for tasks and projects.
+# Each side is aggregated per task on its own and only then merged, so a task
+# with several assignments and several materials never multiplies rows.
+from decimal import Decimal
+
+
+TASK_COSTS_SQL = """
+    SELECT
+        t.task_id,
+        COALESCE(l.labor_cost, 0) as labor_cost,
+        COALESCE(m.material_cost, 0) as material_cost
+    FROM tasks t
+    LEFT JOIN (
+        SELECT ta.task_id, SUM(ta.hours_worked * (w.daily_wage / 8)) as labor_cost
+        FROM task_assignments ta
+        JOIN tasks lt ON ta.task_id = lt.task_id
+        JOIN workers w ON ta.worker_id = w.worker_id
+        WHERE lt.project_id = %s
+        GROUP BY ta.task_id
+    ) l ON l.task_id = t.task_id
+    LEFT JOIN (
+        SELECT tm.task_id, SUM(tm.total_cost) as material_cost
+        FROM task_materials tm
+        JOIN tasks mt ON tm.task_id = mt.task_id
+        WHERE mt.project_id = %s
+        GROUP BY tm.task_id
+    ) m ON m.task_id = t.task_id
+    WHERE t.project_id = %s
+"""
+
+
+def task_costs(cur, project_id):
+    """Return {task_id: {'labor_cost', 'material_cost'}} for a project."""
+    cur.execute(TASK_COSTS_SQL, (project_id, project_id, project_id))
+    return {
+        row['task_id']: {
+            'labor_cost': row['labor_cost'],
+            'material_cost': row['material_cost']
+        }
+        for row in cur.fetchall()
+    }
+
+
+def project_costs(cur, project_id):
+    """Return (labor_cost, material_cost) totals for a project."""
+    labor_cost = Decimal('0')
+    material_cost = Decimal('0')
+    for costs in task_costs(cur, project_id).values():
+        labor_cost += costs['labor_cost'] or 0
+        material_cost += costs['material_cost'] or 0
+    return labor_cost, material_cost
@@ -0,0 +1,213 @@
+# Materialized per-task cost ledger.
+# task_cost_ledger keeps labor and material totals per task and tasks.actual_cost
+# mirrors their sum. Writes apply deltas instead of re-summing the raw tables,
+# and reconcile_ledger() checks (and optionally repairs) the ledger against
+# task_assignments / task_materials.
+#
+# Run as a reconcile worker:
+#     python cost_ledger.py                 # report drift once
+#     python cost_ledger.py --repair        # rewrite drifted rows
+#     python cost_ledger.py --repair --interval 3600
+import argparse
+import time
+from decimal import Decimal
+
+from cost_engine import task_costs
+
+
+def _apply_delta(cur, task_id, labor_delta, material_delta):
+    cur.execute("""
+        INSERT INTO task_cost_ledger (task_id, project_id, labor_cost, material_cost)
+        SELECT task_id, project_id, %s, %s FROM tasks WHERE task_id = %s
+        ON DUPLICATE KEY UPDATE
+            labor_cost = labor_cost + VALUES(labor_cost),
+            material_cost = material_cost + VALUES(material_cost)
+    """, (labor_delta, material_delta, task_id))
+    cur.execute("""
+        UPDATE tasks
+        SET actual_cost = COALESCE(actual_cost, 0) + %s + %s
+        WHERE task_id = %s
+    """, (labor_delta, material_delta, task_id))
+
+
+def _apply_deltas(cur, project_id, deltas, batch_size=1000):
+    """Add {task_id: (labor_delta, material_delta)} of one project to the
+    ledger and to tasks.actual_cost, one upsert and one update per batch."""
+    task_ids = sorted(deltas)
+    for start in range(0, len(task_ids), batch_size):
+        batch = task_ids[start:start + batch_size]
+        params = []
+        for task_id in batch:
+            params.extend([task_id, project_id, deltas[task_id][0], deltas[task_id][1]])
+        cur.execute(f"""
+            INSERT INTO task_cost_ledger (task_id, project_id, labor_cost, material_cost)
+            VALUES {', '.join(['(%s, %s, %s, %s)'] * len(batch))}
+            ON DUPLICATE KEY UPDATE
+                labor_cost = labor_cost + VALUES(labor_cost),
+                material_cost = material_cost + VALUES(material_cost)
+        """, params)
+
+        params = []
+        for task_id in batch:
+            params.extend([task_id, deltas[task_id][0] + deltas[task_id][1]])
+        cur.execute(f"""
+            UPDATE tasks
+            SET actual_cost = COALESCE(actual_cost, 0) + CASE task_id {' '.join(['WHEN %s THEN %s'] * len(batch))} END
+            WHERE task_id IN ({', '.join(['%s'] * len(batch))})
+        """, params + batch)
+
+
+def apply_assignment(cur, task_id, worker_id, hours_worked, sign=1):
+    """Add (sign=1) or remove (sign=-1) the labor cost of one assignment."""
+    cur.execute("SELECT daily_wage FROM workers WHERE worker_id = %s", (worker_id,))
+    worker = cur.fetchone()
+    if not worker or worker['daily_wage'] is None:
+        return
+    labor_delta = sign * Decimal(str(hours_worked)) * (worker['daily_wage'] / 8)
+    _apply_delta(cur, task_id, labor_delta, 0)
+
+
+def apply_assignments(cur, project_id, assignments):
+    """Add the labor cost of many (task_id, worker_id, hours_worked) rows of
+    one project, summed per task and applied set-wise."""
+    worker_ids = sorted({worker_id for _, worker_id, _ in assignments})
+    if not worker_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(worker_ids))
+    cur.execute(f"""
+        SELECT worker_id, daily_wage FROM workers WHERE worker_id IN ({placeholders})
+    """, worker_ids)
+    wages = {row['worker_id']: row['daily_wage'] for row in cur.fetchall()}
+
+    labor = {}
+    for task_id, worker_id, hours_worked in assignments:
+        if wages.get(worker_id) is None:
+            continue
+        cost = Decimal(str(hours_worked)) * (wages[worker_id] / 8)
+        labor[task_id] = labor.get(task_id, Decimal('0')) + cost
+    _apply_deltas(cur, project_id, {task_id: (cost, Decimal('0')) for task_id, cost in labor.items()})
+
+
+def apply_materials(cur, project_id, materials):
+    """Add the cost of many (task_id, total_cost) task_materials rows of one
+    project, summed per task and applied set-wise."""
+    material = {}
+    for task_id, total_cost in materials:
+        if total_cost:
+            material[task_id] = material.get(task_id, Decimal('0')) + Decimal(str(total_cost))
+    _apply_deltas(cur, project_id, {task_id: (Decimal('0'), cost) for task_id, cost in material.items()})
+
+
+def apply_material(cur, task_material_id, sign=1):
+    """Add (sign=1) or remove (sign=-1) the cost of one task_materials row."""
+    cur.execute("""
+        SELECT task_id, total_cost FROM task_materials WHERE task_material_id = %s
+    """, (task_material_id,))
+    row = cur.fetchone()
+    if not row or not row['total_cost']:
+        return
+    _apply_delta(cur, row['task_id'], 0, sign * row['total_cost'])
+
+
+def apply_expenditure(cur, project_id, amount_delta):
+    """Shift projects.actual_budget by an expenditure delta."""
+    cur.execute("""
+        UPDATE projects
+        SET actual_budget = COALESCE(actual_budget, 0) + %s
+        WHERE project_id = %s
+    """, (amount_delta, project_id))
+
+
+def reconcile_ledger(cur, project_id=None, repair=False):
+    """Compare the ledger with the raw cost tables.
+
+    Returns a list of drifted rows; with repair=True they are rewritten
+    (the caller commits).
+    """
+    if project_id is None:
+        cur.execute("SELECT project_id FROM projects ORDER BY project_id")
+        project_ids = [p['project_id'] for p in cur.fetchall()]
+    else:
+        project_ids = [project_id]
+
+    drift = []
+    for pid in project_ids:
+        expected = task_costs(cur, pid)
+        cur.execute("""
+            SELECT l.task_id, l.labor_cost, l.material_cost, t.actual_cost
+            FROM task_cost_ledger l
+            JOIN tasks t ON l.task_id = t.task_id
+            WHERE l.project_id = %s
+        """, (pid,))
+        ledger = {row['task_id']: row for row in cur.fetchall()}
+
+        for task_id, costs in expected.items():
+            labor = Decimal(str(costs['labor_cost'] or 0)).quantize(Decimal('0.01'))
+            material = Decimal(str(costs['material_cost'] or 0)).quantize(Decimal('0.01'))
+            row = ledger.get(task_id)
+            stored = (
+                (Decimal(str(row['labor_cost'])).quantize(Decimal('0.01')),
+                 Decimal(str(row['material_cost'])).quantize(Decimal('0.01')),
+                 Decimal(str(row['actual_cost'] or 0)).quantize(Decimal('0.01')))
+                if row else None
+            )
+            if stored == (labor, material, labor + material):
+                continue
+            if stored is None and labor == 0 and material == 0:
+                continue
+
+            drift.append({
+                'project_id': pid,
+                'task_id': task_id,
+                'ledger': stored,
+                'expected': (labor, material, labor + material)
+            })
+            if repair:
+                cur.execute("""
+                    INSERT INTO task_cost_ledger (task_id, project_id, labor_cost, material_cost)
+                    VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        labor_cost = VALUES(labor_cost),
+                        material_cost = VALUES(material_cost)
+                """, (task_id, pid, labor, material))
+                cur.execute("""
+                    UPDATE tasks SET actual_cost = %s WHERE task_id = %s
+                """, (labor + material, task_id))
+
+        if repair:
+            cur.execute("""
+                UPDATE projects
+                SET actual_budget = COALESCE((
+                    SELECT SUM(amount) FROM project_expenditures WHERE project_id = %s
+                ), 0)
+                WHERE project_id = %s
+            """, (pid, pid))
+
+    return drift
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reconcile the task cost ledger')
+    parser.add_argument('--project', type=int, help='only check this project')
+    parser.add_argument('--repair', action='store_true', help='rewrite drifted ledger rows')
+    parser.add_argument('--interval', type=int, default=0,
+                        help='keep running, reconciling every N seconds')
+    args = parser.parse_args()
+
+    from app import app, mysql
+
+    while True:
+        with app.app_context():
+            cur = mysql.connection.cursor()
+            try:
+                drift = reconcile_ledger(cur, args.project, repair=args.repair)
+                mysql.connection.commit()
+            finally:
+                cur.close()
+        for row in drift:
+            print(f"Project {row['project_id']} task {row['task_id']}: "
+                  f"ledger {row['ledger']} != expected {row['expected']}")
+        print(f"{len(drift)} drifted ledger rows{' repaired' if args.repair else ''}")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
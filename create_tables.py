@@ -1,3 +1,5 @@
+import sys
+
 import mysql.connector
 from mysql.connector import Error
 
@@ -168,11 +170,329 @@ CREATE TABLE IF NOT EXISTS subcontractor_projects (
     UNIQUE KEY (subcontractor_id, project_id)
 );
 
-INSERT INTO users (username, password_hash, full_name, email, role)
+CREATE TABLE IF NOT EXISTS task_cost_ledger (
+    task_id INT PRIMARY KEY,
+    project_id INT NOT NULL,
+    labor_cost DECIMAL(15,4) NOT NULL DEFAULT 0,
+    material_cost DECIMAL(15,4) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (task_id) REFERENCES tasks(task_id),
+    FOREIGN KEY (project_id) REFERENCES projects(project_id),
+    KEY (project_id)
+);
+
+INSERT IGNORE INTO users (username, password_hash, full_name, email, role)
 VALUES ('admin', 'hashed_password', 'Admin User', 'admin@example.com', 'admin');
 """
 
+# Versioned migrations, applied in order on top of sql_script.
+# Each entry is (version, description, statements); applied versions are
+# recorded in schema_migrations so every migration runs exactly once.
+MIGRATIONS = [
+    (1, "Expenditure tables used by the app", [
+        """CREATE TABLE IF NOT EXISTS project_expenditures (
+            expenditure_id INT AUTO_INCREMENT PRIMARY KEY,
+            project_id INT NOT NULL,
+            description VARCHAR(255) NOT NULL,
+            amount DECIMAL(15,2) NOT NULL,
+            expenditure_date DATE NOT NULL,
+            category VARCHAR(50) DEFAULT 'Other',
+            created_by INT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (project_id) REFERENCES projects(project_id),
+            FOREIGN KEY (created_by) REFERENCES users(user_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS expenditure_documents (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            expenditure_id INT NOT NULL,
+            document_id INT NOT NULL,
+            FOREIGN KEY (expenditure_id) REFERENCES project_expenditures(expenditure_id),
+            FOREIGN KEY (document_id) REFERENCES documents(document_id),
+            UNIQUE KEY (expenditure_id, document_id)
+        )""",
+    ]),
+    (2, "Secondary indexes for route filters and sorts", [
+        # project_details, project_report, export_project, dashboard
+        "CREATE INDEX idx_tasks_project_start ON tasks (project_id, planned_start_date)",
+        "CREATE INDEX idx_tasks_parent_start ON tasks (parent_task_id, planned_start_date)",
+        "CREATE INDEX idx_tasks_status_start ON tasks (status, planned_start_date)",
+        "CREATE INDEX idx_projects_created ON projects (created_at)",
+        "CREATE INDEX idx_projects_status ON projects (status)",
+        # task_details, project_report progress chart
+        "CREATE INDEX idx_progress_task_date ON daily_progress (task_id, progress_date, percentage_completed)",
+        "CREATE INDEX idx_assignments_task_date ON task_assignments (task_id, assignment_date)",
+        "CREATE INDEX idx_task_materials_task_date ON task_materials (task_id, date_used)",
+        # documents, project_details, view_expenditure
+        "CREATE INDEX idx_documents_project_uploaded ON documents (project_id, upload_date)",
+        "CREATE INDEX idx_documents_uploaded ON documents (upload_date)",
+        "CREATE INDEX idx_expenditures_project_date ON project_expenditures (project_id, expenditure_date)",
+        # safety, equipment, lookup dropdowns
+        "CREATE INDEX idx_incidents_project_date ON safety_incidents (project_id, incident_date)",
+        "CREATE INDEX idx_incidents_date ON safety_incidents (incident_date)",
+        "CREATE INDEX idx_equipment_name ON equipment (equipment_name)",
+        "CREATE INDEX idx_workers_name ON workers (name)",
+        "CREATE INDEX idx_materials_name ON materials (material_name)",
+        "CREATE INDEX idx_subcontractors_company ON subcontractors (company_name)",
+    ]),
+    (3, "Indexes for paginated list filters", [
+        "CREATE INDEX idx_projects_status_created ON projects (status, created_at)",
+        "DROP INDEX idx_projects_status ON projects",
+        "CREATE INDEX idx_equipment_status_name ON equipment (status, equipment_name)",
+        "CREATE INDEX idx_equipment_project_name ON equipment (assigned_project, equipment_name)",
+        "CREATE INDEX idx_incidents_severity_date ON safety_incidents (severity, incident_date)",
+        "CREATE INDEX idx_subcontractor_projects_project ON subcontractor_projects (project_id, subcontractor_id)",
+    ]),
+    (4, "Project data version for report caching", [
+        "ALTER TABLE projects ADD COLUMN data_version INT NOT NULL DEFAULT 0",
+    ]),
+    (5, "Weather geocode and forecast caches", [
+        """CREATE TABLE IF NOT EXISTS weather_geocode_cache (
+            location VARCHAR(100) PRIMARY KEY,
+            lat DECIMAL(9,6) NOT NULL,
+            lon DECIMAL(9,6) NOT NULL,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS weather_forecast_cache (
+            coord_key VARCHAR(32) PRIMARY KEY,
+            payload MEDIUMTEXT NOT NULL,
+            expires_at BIGINT NOT NULL,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )""",
+    ]),
+    (6, "Outdoor flag on tasks for weather risk", [
+        "ALTER TABLE tasks ADD COLUMN is_outdoor TINYINT(1) NOT NULL DEFAULT 1",
+    ]),
+    (7, "Task ancestry closure table", [
+        """CREATE TABLE IF NOT EXISTS task_closure (
+            ancestor_id INT NOT NULL,
+            descendant_id INT NOT NULL,
+            depth INT NOT NULL,
+            PRIMARY KEY (ancestor_id, descendant_id),
+            KEY idx_task_closure_descendant (descendant_id, depth),
+            FOREIGN KEY (ancestor_id) REFERENCES tasks(task_id),
+            FOREIGN KEY (descendant_id) REFERENCES tasks(task_id)
+        )""",
+        """INSERT INTO task_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE chain AS (
+            SELECT task_id AS ancestor_id, task_id AS descendant_id, 0 AS depth
+            FROM tasks
+            UNION ALL
+            SELECT chain.ancestor_id, t.task_id, chain.depth + 1
+            FROM chain
+            JOIN tasks t ON t.parent_task_id = chain.descendant_id
+        )
+        SELECT ancestor_id, descendant_id, depth FROM chain""",
+    ]),
+    (8, "Task dependencies for critical path scheduling", [
+        """CREATE TABLE IF NOT EXISTS task_dependencies (
+            predecessor_id INT NOT NULL,
+            successor_id INT NOT NULL,
+            lag_days INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (predecessor_id, successor_id),
+            KEY idx_task_dependencies_successor (successor_id),
+            FOREIGN KEY (predecessor_id) REFERENCES tasks(task_id),
+            FOREIGN KEY (successor_id) REFERENCES tasks(task_id)
+        )""",
+    ]),
+    # Backfill with `python progress_rollup.py --rebuild`
+    (9, "Daily weighted progress rollup per project", [
+        """CREATE TABLE IF NOT EXISTS project_progress_daily (
+            project_id INT NOT NULL,
+            progress_date DATE NOT NULL,
+            weighted_progress DECIMAL(20,4) NOT NULL DEFAULT 0,
+            PRIMARY KEY (project_id, progress_date),
+            FOREIGN KEY (project_id) REFERENCES projects(project_id)
+        )""",
+    ]),
+    # Fill with `python portfolio_summary.py --all`
+    (10, "Materialized portfolio summary for the dashboard", [
+        """CREATE TABLE IF NOT EXISTS portfolio_summary (
+            project_id INT PRIMARY KEY,
+            project_name VARCHAR(100) NOT NULL,
+            status VARCHAR(20),
+            start_date DATE,
+            end_date DATE,
+            created_at TIMESTAMP NULL,
+            estimated_budget DECIMAL(15,2) NOT NULL DEFAULT 0,
+            actual_cost DECIMAL(15,2) NOT NULL DEFAULT 0,
+            progress DECIMAL(5,2) NOT NULL DEFAULT 0,
+            total_tasks INT NOT NULL DEFAULT 0,
+            completed_tasks INT NOT NULL DEFAULT 0,
+            delayed_tasks INT NOT NULL DEFAULT 0,
+            overdue_tasks INT NOT NULL DEFAULT 0,
+            recent_incidents INT NOT NULL DEFAULT 0,
+            serious_incidents INT NOT NULL DEFAULT 0,
+            equipment_assigned INT NOT NULL DEFAULT 0,
+            equipment_in_use INT NOT NULL DEFAULT 0,
+            cpi DECIMAL(8,3),
+            spi DECIMAL(8,3),
+            source_version INT NOT NULL DEFAULT -1,
+            refreshed_at TIMESTAMP NULL,
+            KEY idx_portfolio_summary_status (status, project_name)
+        )""",
+    ]),
+    # Worker calendar: overbooking checks and the utilization heatmap read
+    # hours straight from the index
+    (11, "Worker calendar index on task assignments", [
+        "CREATE INDEX idx_assignments_worker_date ON task_assignments (worker_id, assignment_date, hours_worked)",
+    ]),
+    # Allocate with `python resource_leveling.py --all`
+    (12, "Task resource needs, leveled allocations and leveling runs", [
+        """CREATE TABLE IF NOT EXISTS task_resource_needs (
+            need_id INT AUTO_INCREMENT PRIMARY KEY,
+            task_id INT NOT NULL,
+            resource_type ENUM('worker', 'equipment') NOT NULL,
+            skill VARCHAR(100) NOT NULL,
+            quantity INT NOT NULL DEFAULT 1,
+            FOREIGN KEY (task_id) REFERENCES tasks(task_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS resource_allocations (
+            allocation_id INT AUTO_INCREMENT PRIMARY KEY,
+            project_id INT NOT NULL,
+            task_id INT NOT NULL,
+            need_id INT NOT NULL,
+            resource_type ENUM('worker', 'equipment') NOT NULL,
+            resource_id INT NOT NULL,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL,
+            FOREIGN KEY (task_id) REFERENCES tasks(task_id),
+            FOREIGN KEY (need_id) REFERENCES task_resource_needs(need_id),
+            KEY idx_allocations_resource (resource_type, resource_id, end_date),
+            KEY idx_allocations_project_start (project_id, start_date)
+        )""",
+        """CREATE TABLE IF NOT EXISTS leveling_runs (
+            run_id INT AUTO_INCREMENT PRIMARY KEY,
+            project_id INT NOT NULL,
+            window_start DATE,
+            window_end DATE,
+            tasks_leveled INT NOT NULL DEFAULT 0,
+            allocations INT NOT NULL DEFAULT 0,
+            unallocated INT NOT NULL DEFAULT 0,
+            shifted_tasks INT NOT NULL DEFAULT 0,
+            elapsed_ms DECIMAL(12,2) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_leveling_runs_project (project_id, created_at)
+        )""",
+    ]),
+    # The portfolio page reads these instead of computing EVM per project
+    (13, "Current earned-value figures on the portfolio summary", [
+        """ALTER TABLE portfolio_summary
+            ADD COLUMN evm_status_date DATE,
+            ADD COLUMN bac DECIMAL(15,2),
+            ADD COLUMN pv DECIMAL(15,2),
+            ADD COLUMN ev DECIMAL(15,2),
+            ADD COLUMN ac DECIMAL(15,2),
+            ADD COLUMN eac DECIMAL(15,2),
+            ADD COLUMN etc DECIMAL(15,2)""",
+    ]),
+]
+
+# Representative query per route, explained after migrating.
+EXPLAIN_QUERIES = [
+    ("dashboard: portfolio summary",
+     "SELECT * FROM portfolio_summary ORDER BY status, project_name"),
+    ("dashboard: upcoming tasks",
+     "SELECT t.task_id, t.task_name, p.project_name FROM tasks t "
+     "JOIN projects p ON t.project_id = p.project_id "
+     "WHERE t.status IN ('not_started', 'in_progress') ORDER BY t.planned_start_date LIMIT 5"),
+    ("projects",
+     "SELECT p.*, u.username FROM projects p JOIN users u ON p.created_by = u.user_id "
+     "ORDER BY p.created_at DESC"),
+    ("project_details: tasks",
+     "SELECT t.* FROM tasks t WHERE t.project_id = 1 ORDER BY t.planned_start_date, t.task_id"),
+    ("project_details: expenditures",
+     "SELECT pe.* FROM project_expenditures pe WHERE pe.project_id = 1 "
+     "ORDER BY pe.expenditure_date DESC"),
+    ("project_details: documents",
+     "SELECT d.* FROM documents d WHERE d.project_id = 1 ORDER BY d.upload_date DESC"),
+    ("task_details: subtasks",
+     "SELECT * FROM tasks WHERE parent_task_id = 1 ORDER BY planned_start_date"),
+    ("task_details: assignments",
+     "SELECT ta.* FROM task_assignments ta WHERE ta.task_id = 1 ORDER BY ta.assignment_date DESC"),
+    ("task_details: materials",
+     "SELECT tm.* FROM task_materials tm WHERE tm.task_id = 1 ORDER BY tm.date_used DESC"),
+    ("task_details: progress",
+     "SELECT dp.* FROM daily_progress dp WHERE dp.task_id = 1 ORDER BY dp.progress_date DESC"),
+    ("project_report: progress weight",
+     "SELECT SUM(CASE WHEN estimated_cost > 0 THEN estimated_cost "
+     "ELSE COALESCE(estimated_days, 0) END) FROM tasks WHERE project_id = 1"),
+    ("project_report: progress chart",
+     "SELECT progress_date, weighted_progress FROM project_progress_daily "
+     "WHERE project_id = 1 ORDER BY progress_date"),
+    ("documents",
+     "SELECT d.* FROM documents d ORDER BY d.upload_date DESC, d.document_id DESC LIMIT 51"),
+    ("documents: project filter",
+     "SELECT d.* FROM documents d WHERE d.project_id = 1 "
+     "ORDER BY d.upload_date DESC, d.document_id DESC LIMIT 51"),
+    ("projects: status filter",
+     "SELECT p.* FROM projects p WHERE p.status = 'in_progress' "
+     "ORDER BY p.created_at DESC, p.project_id DESC LIMIT 51"),
+    ("safety",
+     "SELECT s.* FROM safety_incidents s ORDER BY s.incident_date DESC, s.incident_id DESC LIMIT 51"),
+    ("safety: severity filter",
+     "SELECT s.* FROM safety_incidents s WHERE s.severity = 'high' "
+     "ORDER BY s.incident_date DESC, s.incident_id DESC LIMIT 51"),
+    ("equipment",
+     "SELECT e.* FROM equipment e ORDER BY e.equipment_name, e.equipment_id LIMIT 51"),
+    ("equipment: status filter",
+     "SELECT e.* FROM equipment e WHERE e.status = 'available' "
+     "ORDER BY e.equipment_name, e.equipment_id LIMIT 51"),
+]
+
+
+def run_schema(cursor):
+    for statement in sql_script.strip().split(';'):
+        if statement.strip():
+            cursor.execute(statement + ';')
+
+
+def migrate(connection, cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+
+    for version, description, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        print(f"Applying migration {version}: {description}")
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+            (version, description)
+        )
+        connection.commit()
+
+
+def explain_report(connection):
+    cursor = connection.cursor(dictionary=True)
+    full_scans = 0
+    print(f"{'route':<36} {'table':<22} {'type':<8} {'key':<32} {'rows':>8}  extra")
+    for route, query in EXPLAIN_QUERIES:
+        cursor.execute("EXPLAIN " + query)
+        for row in cursor.fetchall():
+            extra = row.get('Extra') or ''
+            flag = ''
+            if row['type'] == 'ALL' and row['table'] not in ('users', '<derived2>'):
+                flag = '  <-- full scan'
+                full_scans += 1
+            elif 'filesort' in extra:
+                flag = '  <-- filesort'
+            print(f"{route:<36} {str(row['table']):<22} {str(row['type']):<8} "
+                  f"{str(row['key']):<32} {str(row['rows']):>8}  {extra}{flag}")
+    cursor.close()
+    print(f"{full_scans} full table scans")
+    return full_scans
+
+
 # Connect to MySQL and execute
+connection = None
 try:
     connection = mysql.connector.connect(
         host='192.168.0.174',       # or '127.0.0.1'
@@ -183,17 +503,21 @@ try:
     if connection.is_connected():
         print("Connected to MySQL Server")
         cursor = connection.cursor()
-        for statement in sql_script.strip().split(';'):
-            if statement.strip():
-                cursor.execute(statement + ';')
+        run_schema(cursor)
         print("Database and tables created successfully.")
         connection.commit()
 
+        migrate(connection, cursor)
+        print("Migrations applied.")
+
+        if '--explain' in sys.argv:
+            explain_report(connection)
+
 except Error as e:
     print("Error:", e)
 
 finally:
-    if connection.is_connected():
+    if connection is not None and connection.is_connected():
         cursor.close()
         connection.close()
         print("MySQL connection closed.")
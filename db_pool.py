@@ -0,0 +1,202 @@
+# Pooled MySQL access for the app.
+# PooledMySQL is a drop-in replacement for flask_mysqldb.MySQL: mysql.connection
+# checks a connection out of a bounded pool for the current app context and
+# the teardown hook returns it. Idle connections are pinged before reuse and
+# the pool keeps wait-time and utilisation metrics. The pool lock only guards
+# the bookkeeping; connects, pings and rollbacks run outside it.
+#
+# Load test against a local MySQL: python -m benchmarks.load_db_pool
+import os
+import threading
+import time
+
+import MySQLdb
+import MySQLdb.cursors
+from flask import g
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect_args, min_size=2, max_size=10, timeout=5.0, ping_interval=30.0):
+        self.connect_args = connect_args
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+        self.stats = {
+            'checkouts': 0, 'waits': 0, 'wait_time': 0.0, 'max_wait': 0.0,
+            'timeouts': 0, 'created': 0, 'discarded': 0, 'ping_failures': 0
+        }
+
+    def _connect(self):
+        return MySQLdb.connect(**self.connect_args)
+
+    def _reset_after_fork(self):
+        # Connections must never be shared with a forked child
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._size = 0
+
+    def fill(self):
+        with self._cond:
+            self._reset_after_fork()
+            while self._size < self.min_size:
+                self._idle.append((self._connect(), time.monotonic()))
+                self._size += 1
+                self.stats['created'] += 1
+
+    def _discard(self, conn):
+        # Called without the lock: closing may touch the network
+        try:
+            conn.close()
+        except MySQLdb.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self.stats['discarded'] += 1
+            self._cond.notify()
+
+    def checkout(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            conn = None
+            stale = False
+            with self._cond:
+                self._reset_after_fork()
+                while True:
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        stale = time.monotonic() - idle_since > self.ping_interval
+                        break
+                    if self._size < self.max_size:
+                        # Reserve the slot; the connection is opened below
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats['timeouts'] += 1
+                        raise PoolTimeout(f'No database connection available within {self.timeout}s')
+                    waited = True
+                    self._cond.wait(remaining)
+
+            # Connects and pings are network round trips, so they run after
+            # the lock is released and never hold up other checkouts
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self.stats['created'] += 1
+                break
+            if stale:
+                try:
+                    conn.ping()
+                except MySQLdb.Error:
+                    with self._cond:
+                        self.stats['ping_failures'] += 1
+                    self._discard(conn)
+                    continue
+            break
+
+        wait = time.monotonic() - start
+        with self._cond:
+            self.stats['checkouts'] += 1
+            if waited:
+                self.stats['waits'] += 1
+            self.stats['wait_time'] += wait
+            self.stats['max_wait'] = max(self.stats['max_wait'], wait)
+        return conn
+
+    def checkin(self, conn):
+        if self._pid != os.getpid():
+            return
+        try:
+            # Never hand an open transaction to the next request
+            conn.rollback()
+        except MySQLdb.Error:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def snapshot(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['min_size'] = self.min_size
+            stats['max_size'] = self.max_size
+        stats['avg_wait'] = stats['wait_time'] / stats['checkouts'] if stats['checkouts'] else 0
+        return stats
+
+
+class PooledMySQL:
+    def __init__(self, app=None):
+        self.pool = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('MYSQL_HOST', 'localhost')
+        app.config.setdefault('MYSQL_PORT', 3306)
+        app.config.setdefault('MYSQL_CHARSET', 'utf8mb4')
+        app.config.setdefault('MYSQL_POOL_MIN', 2)
+        app.config.setdefault('MYSQL_POOL_MAX', 10)
+        app.config.setdefault('MYSQL_POOL_TIMEOUT', 5.0)
+        app.config.setdefault('MYSQL_POOL_PING_INTERVAL', 30.0)
+        app.teardown_appcontext(self.teardown)
+
+    def get_pool(self):
+        with self._lock:
+            if self.pool is None:
+                config = self.app.config
+                cursorclass = config.get('MYSQL_CURSORCLASS')
+                connect_args = {
+                    'host': config['MYSQL_HOST'],
+                    'port': config['MYSQL_PORT'],
+                    'user': config['MYSQL_USER'],
+                    'passwd': config['MYSQL_PASSWORD'],
+                    'db': config['MYSQL_DB'],
+                    'charset': config['MYSQL_CHARSET'],
+                    'use_unicode': True
+                }
+                if cursorclass:
+                    connect_args['cursorclass'] = getattr(MySQLdb.cursors, cursorclass)
+                self.pool = ConnectionPool(
+                    connect_args,
+                    min_size=config['MYSQL_POOL_MIN'],
+                    max_size=config['MYSQL_POOL_MAX'],
+                    timeout=config['MYSQL_POOL_TIMEOUT'],
+                    ping_interval=config['MYSQL_POOL_PING_INTERVAL']
+                )
+                self.pool.fill()
+            return self.pool
+
+    @property
+    def connection(self):
+        if '_db_connection' not in g:
+            g._db_connection = self.get_pool().checkout()
+        return g._db_connection
+
+    def teardown(self, exception):
+        conn = g.pop('_db_connection', None)
+        if conn is not None:
+            self.pool.checkin(conn)
@@ -0,0 +1,196 @@
+# Earned value management (EVM) series per project.
+# Every input is turned into per-day increments on one date axis and summed
+# with np.bincount / np.cumsum, so the cost is linear in tasks, progress
+# entries and cost rows and independent of how many days a project spans:
+#   PV  planned value    task budgets spread evenly over their planned days
+#   EV  earned value     task budget x latest recorded % complete
+#   AC  actual cost      labor + materials + expenditures on the day spent
+# CPI = EV/AC, SPI = EV/PV, EAC = BAC/CPI and ETC = EAC - AC, where BAC is the
+# sum of task estimates. Results are cached per project data_version and day.
+import pickle
+from datetime import date, timedelta
+
+import numpy as np
+
+from report_cache import report_cache, project_version
+
+
+def _day_index(dates, start, days):
+    """Days since start for a list of dates, clipped onto the axis."""
+    offsets = np.array([(d - start).days for d in dates], dtype=np.int64)
+    return np.clip(offsets, 0, days - 1)
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = numerator / denominator
+    result[~np.isfinite(result)] = np.nan
+    return result
+
+
+def _as_list(values):
+    return [None if np.isnan(v) else round(float(v), 2) for v in values]
+
+
+def compute_evm(project, tasks, progress, costs, status_date=None):
+    """Build the EVM series.
+
+    tasks: rows with task_id, planned_start_date, planned_end_date,
+    estimated_cost; progress: (task_id, progress_date, percentage) in
+    recording order; costs: (date, amount) for every actual cost.
+    """
+    status_date = status_date or date.today()
+    planned = [t for t in tasks if t['planned_start_date'] and t['planned_end_date']]
+    starts = [t['planned_start_date'] for t in planned]
+    ends = [t['planned_end_date'] for t in planned]
+    if project['start_date']:
+        starts.append(project['start_date'])
+    if project['end_date']:
+        ends.append(project['end_date'])
+    if not starts:
+        return None
+
+    # The axis runs from the first planned day to the last planned, recorded
+    # or status day, whichever is latest
+    activity = [p[1] for p in progress] + [c[0] for c in costs]
+    start = min(starts)
+    finish = max(starts + ends + activity + [status_date])
+    days = (finish - start).days + 1
+    axis = [start + timedelta(days=i) for i in range(days)]
+
+    # PV: each task spends estimated_cost / duration per planned day; the
+    # daily rate is laid down as a difference array and integrated twice
+    budget = np.array([float(t['estimated_cost'] or 0) for t in planned])
+    first = _day_index([t['planned_start_date'] for t in planned], start, days)
+    last = _day_index([t['planned_end_date'] for t in planned], start, days)
+    last = np.maximum(last, first)
+    rate = budget / (last - first + 1)
+    rate_change = np.zeros(days + 1)
+    np.add.at(rate_change, first, rate)
+    np.add.at(rate_change, last + 1, -rate)
+    pv = np.cumsum(np.cumsum(rate_change[:days]))
+    bac = float(budget.sum())
+
+    # EV: each entry adds (new % - task's previous %) x budget on its day
+    ev_daily = np.zeros(days)
+    if progress:
+        budget_by_task = {t['task_id']: float(t['estimated_cost'] or 0) for t in tasks}
+        task_ids = np.array([p[0] for p in progress])
+        percent = np.array([float(p[2]) for p in progress])
+        day = _day_index([p[1] for p in progress], start, days)
+        order = np.lexsort((np.arange(len(progress)), day, task_ids))
+        task_ids, percent, day = task_ids[order], percent[order], day[order]
+        previous = np.concatenate(([0.0], percent[:-1]))
+        previous[np.concatenate(([True], task_ids[1:] != task_ids[:-1]))] = 0.0
+        weight = np.array([budget_by_task.get(t, 0.0) for t in task_ids]) / 100
+        ev_daily = np.bincount(day, weights=(percent - previous) * weight, minlength=days)
+    ev = np.cumsum(ev_daily)
+
+    # AC: every cost row lands on the day it was incurred
+    ac_daily = np.zeros(days)
+    if costs:
+        amounts = np.array([float(c[1] or 0) for c in costs])
+        ac_daily = np.bincount(_day_index([c[0] for c in costs], start, days),
+                               weights=amounts, minlength=days)
+    ac = np.cumsum(ac_daily)
+
+    # Earned and actual values only exist up to the status date
+    status_index = min(max((status_date - start).days, -1), days - 1)
+    future = np.arange(days) > status_index
+    ev[future] = np.nan
+    ac[future] = np.nan
+
+    cpi = _ratio(ev, ac)
+    spi = _ratio(ev, pv)
+    eac = _ratio(np.full(days, bac), cpi)
+    etc = eac - ac
+
+    current = None
+    if status_index >= 0:
+        i = status_index
+        current = {
+            'status_date': axis[i],
+            'bac': round(bac, 2),
+            'pv': round(float(pv[i]), 2),
+            'ev': round(float(ev[i]), 2),
+            'ac': round(float(ac[i]), 2),
+            'cpi': None if np.isnan(cpi[i]) else round(float(cpi[i]), 3),
+            'spi': None if np.isnan(spi[i]) else round(float(spi[i]), 3),
+            'eac': None if np.isnan(eac[i]) else round(float(eac[i]), 2),
+            'etc': None if np.isnan(etc[i]) else round(float(etc[i]), 2),
+            'cost_variance': round(float(ev[i] - ac[i]), 2),
+            'schedule_variance': round(float(ev[i] - pv[i]), 2)
+        }
+
+    return {
+        'dates': [str(d) for d in axis],
+        'pv': _as_list(pv),
+        'ev': _as_list(ev),
+        'ac': _as_list(ac),
+        'cpi': _as_list(cpi),
+        'spi': _as_list(spi),
+        'eac': _as_list(eac),
+        'etc': _as_list(etc),
+        'current': current
+    }
+
+
+def load_evm_inputs(cur, project_id):
+    cur.execute("SELECT * FROM projects WHERE project_id = %s", (project_id,))
+    project = cur.fetchone()
+
+    cur.execute("""
+        SELECT task_id, planned_start_date, planned_end_date, estimated_cost
+        FROM tasks
+        WHERE project_id = %s
+    """, (project_id,))
+    tasks = cur.fetchall()
+
+    cur.execute("""
+        SELECT dp.task_id, dp.progress_date, dp.percentage_completed
+        FROM daily_progress dp
+        JOIN tasks t ON dp.task_id = t.task_id
+        WHERE t.project_id = %s
+        ORDER BY dp.progress_date, dp.progress_id
+    """, (project_id,))
+    progress = [(r['task_id'], r['progress_date'], r['percentage_completed']) for r in cur.fetchall()]
+
+    # Actual costs by day: labor, materials and project expenditures
+    cur.execute("""
+        SELECT ta.assignment_date AS cost_date,
+               SUM(ta.hours_worked * (w.daily_wage / 8)) AS amount
+        FROM task_assignments ta
+        JOIN tasks t ON ta.task_id = t.task_id
+        JOIN workers w ON ta.worker_id = w.worker_id
+        WHERE t.project_id = %s
+        GROUP BY ta.assignment_date
+        UNION ALL
+        SELECT tm.date_used, SUM(tm.total_cost)
+        FROM task_materials tm
+        JOIN tasks t ON tm.task_id = t.task_id
+        WHERE t.project_id = %s
+        GROUP BY tm.date_used
+        UNION ALL
+        SELECT expenditure_date, SUM(amount)
+        FROM project_expenditures
+        WHERE project_id = %s
+        GROUP BY expenditure_date
+    """, (project_id, project_id, project_id))
+    costs = [(r['cost_date'], r['amount']) for r in cur.fetchall() if r['cost_date']]
+
+    return project, tasks, progress, costs
+
+
+def project_evm(cur, project_id):
+    """Cached EVM series for a project, or None without a schedule."""
+    today = date.today()
+    version = project_version(cur, project_id)
+    kind = f'evm:{today}'
+    data = report_cache.get(kind, project_id, version)
+    if data is not None:
+        return pickle.loads(data)
+
+    project, tasks, progress, costs = load_evm_inputs(cur, project_id)
+    evm = compute_evm(project, tasks, progress, costs, today) if project else None
+    report_cache.put(kind, project_id, version, pickle.dumps(evm))
+    return evm
@@ -0,0 +1,216 @@
+# Streaming Excel export for a single project.
+# Each sheet is read through a server-side (unbuffered) cursor in chunks and
+# written with xlsxwriter in constant_memory mode, so memory stays flat no
+# matter how many assignment or material rows a project has. The workbook is
+# written to a per-request file object, never to a shared path.
+from datetime import date, datetime
+from decimal import Decimal
+
+import MySQLdb.cursors
+import xlsxwriter
+
+CHUNK_SIZE = 2000
+
+
+def _stream(conn, sql, params):
+    cur = conn.cursor(MySQLdb.cursors.SSDictCursor)
+    try:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    finally:
+        cur.close()
+
+
+class _Sheet:
+    def __init__(self, workbook, name, headers, formats):
+        self.worksheet = workbook.add_worksheet(name)
+        self.formats = formats
+        self.row = 0
+        self.append(headers, header=True)
+
+    def append(self, values, header=False):
+        for col, value in enumerate(values):
+            if header:
+                self.worksheet.write_string(self.row, col, value, self.formats['header'])
+            elif value is None:
+                self.worksheet.write_blank(self.row, col, None)
+            elif isinstance(value, datetime):
+                self.worksheet.write_datetime(self.row, col, value, self.formats['datetime'])
+            elif isinstance(value, date):
+                self.worksheet.write_datetime(
+                    self.row, col, datetime(value.year, value.month, value.day), self.formats['date'])
+            elif isinstance(value, (int, float, Decimal)):
+                self.worksheet.write_number(self.row, col, float(value))
+            else:
+                self.worksheet.write_string(self.row, col, str(value))
+        self.row += 1
+
+
+def write_project_workbook(conn, project, output, progress=None):
+    """Write the project workbook to output (a path or file object).
+
+    progress, if given, is called with the completed fraction after each sheet.
+    """
+    project_id = project['project_id']
+    report = progress or (lambda fraction, message=None: None)
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'in_memory': False})
+    formats = {
+        'header': workbook.add_format({'bold': True}),
+        'date': workbook.add_format({'num_format': 'yyyy-mm-dd'}),
+        'datetime': workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm'})
+    }
+
+    # Sheet order is fixed up front; the summaries are filled in at the end
+    summary = _Sheet(workbook, 'Project Summary', [
+        'Project Name', 'Start Date', 'End Date', 'Status', 'Estimated Budget',
+        'Total Estimated Cost', 'Total Task Costs', 'Total Expenditures',
+        'Total Actual Cost', 'Budget Variance'
+    ], formats)
+
+    totals = {
+        'estimated': Decimal('0'),
+        'material': Decimal('0'),
+        'labor': Decimal('0'),
+        'expenditures': Decimal('0')
+    }
+
+    report(0, 'Writing Tasks')
+
+    # Tasks sheet
+    tasks = _Sheet(workbook, 'Tasks', [
+        'Task ID', 'Task Name', 'Parent Task', 'Type', 'Status', 'Planned Start',
+        'Planned End', 'Actual Start', 'Actual End', 'Estimated Days',
+        'Estimated Cost', 'Material Cost', 'Labor Cost', 'Total Cost', 'Cost Variance'
+    ], formats)
+    for task in _stream(conn, """
+        SELECT
+            t.task_id, t.task_name, t.task_type, t.planned_start_date, t.planned_end_date,
+            t.estimated_days, t.estimated_cost, t.status, t.actual_start_date, t.actual_end_date,
+            COALESCE(l.material_cost, 0) as material_cost,
+            COALESCE(l.labor_cost, 0) as labor_cost,
+            pt.task_name as parent_task_name
+        FROM tasks t
+        LEFT JOIN task_cost_ledger l ON l.task_id = t.task_id
+        LEFT JOIN tasks pt ON pt.task_id = t.parent_task_id
+        WHERE t.project_id = %s
+        ORDER BY t.planned_start_date
+    """, (project_id,)):
+        total_cost = task['material_cost'] + task['labor_cost']
+        totals['estimated'] += task['estimated_cost']
+        totals['material'] += task['material_cost']
+        totals['labor'] += task['labor_cost']
+        tasks.append([
+            task['task_id'],
+            task['task_name'],
+            task['parent_task_name'] or 'Main Task',
+            task['task_type'].title(),
+            task['status'].replace('_', ' ').title(),
+            task['planned_start_date'],
+            task['planned_end_date'],
+            task['actual_start_date'] or 'Not started',
+            task['actual_end_date'] or 'In progress',
+            task['estimated_days'],
+            task['estimated_cost'],
+            task['material_cost'],
+            task['labor_cost'],
+            total_cost,
+            total_cost - task['estimated_cost']
+        ])
+
+    report(0.2, 'Writing Workers')
+
+    # Workers sheet
+    workers = _Sheet(workbook, 'Workers', [
+        'Task ID', 'Task Name', 'Worker Name', 'Specialization', 'Daily Wage',
+        'Assignment Date', 'Hours Worked', 'Cost'
+    ], formats)
+    for worker in _stream(conn, """
+        SELECT
+            ta.task_id, t.task_name, w.name as worker_name, w.specialization, w.daily_wage,
+            ta.assignment_date, ta.hours_worked,
+            (ta.hours_worked * (w.daily_wage / 8)) as cost
+        FROM task_assignments ta
+        JOIN workers w ON ta.worker_id = w.worker_id
+        JOIN tasks t ON ta.task_id = t.task_id
+        WHERE t.project_id = %s
+        ORDER BY ta.assignment_date
+    """, (project_id,)):
+        workers.append([
+            worker['task_id'], worker['task_name'], worker['worker_name'],
+            worker['specialization'], worker['daily_wage'], worker['assignment_date'],
+            worker['hours_worked'], worker['cost']
+        ])
+
+    report(0.5, 'Writing Materials')
+
+    # Materials sheet
+    materials = _Sheet(workbook, 'Materials', [
+        'Task ID', 'Task Name', 'Material Name', 'Quantity', 'Unit', 'Unit Cost',
+        'Total Cost', 'Date Used'
+    ], formats)
+    for material in _stream(conn, """
+        SELECT
+            tm.task_id, t.task_name, m.material_name, tm.quantity, m.unit, m.unit_cost,
+            tm.total_cost, tm.date_used
+        FROM task_materials tm
+        JOIN materials m ON tm.material_id = m.material_id
+        JOIN tasks t ON tm.task_id = t.task_id
+        WHERE t.project_id = %s
+        ORDER BY tm.date_used
+    """, (project_id,)):
+        materials.append([
+            material['task_id'], material['task_name'], material['material_name'],
+            material['quantity'], material['unit'], material['unit_cost'],
+            material['total_cost'], material['date_used']
+        ])
+
+    report(0.8, 'Writing Expenditures')
+
+    # Expenditures sheet
+    expenditures = _Sheet(workbook, 'Expenditures', [
+        'Date', 'Description', 'Category', 'Amount', 'Added By'
+    ], formats)
+    for expenditure in _stream(conn, """
+        SELECT e.expenditure_date, e.description, e.category, e.amount,
+               u.username as created_by_name
+        FROM project_expenditures e
+        LEFT JOIN users u ON e.created_by = u.user_id
+        WHERE e.project_id = %s
+        ORDER BY e.expenditure_date
+    """, (project_id,)):
+        totals['expenditures'] += expenditure['amount']
+        expenditures.append([
+            expenditure['expenditure_date'], expenditure['description'],
+            expenditure['category'], expenditure['amount'], expenditure['created_by_name']
+        ])
+
+    report(0.95, 'Writing summaries')
+
+    task_costs = totals['material'] + totals['labor']
+    actual = task_costs + totals['expenditures']
+    summary.append([
+        project['project_name'],
+        project['start_date'],
+        project['end_date'],
+        project['status'].replace('_', ' ').title(),
+        project['estimated_budget'],
+        totals['estimated'],
+        task_costs,
+        totals['expenditures'],
+        actual,
+        actual - (project['estimated_budget'] or 0)
+    ])
+
+    # Cost Summary sheet
+    cost_summary = _Sheet(workbook, 'Cost Summary', ['Cost Type', 'Amount'], formats)
+    cost_summary.append(['Materials', totals['material']])
+    cost_summary.append(['Labor', totals['labor']])
+    cost_summary.append(['Expenditures', totals['expenditures']])
+    cost_summary.append(['Total', actual])
+
+    workbook.close()
@@ -0,0 +1,165 @@
+# Local background job queue for heavy report/export generation and imports.
+# Job state lives in a small SQLite database so every app process can report
+# on and serve any job; the work itself runs in a process pool so a big
+# project never ties up a request worker.
+#
+#     python jobs.py --cleanup      # drop expired jobs and their artifacts
+import argparse
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+JOB_FOLDER = 'job_artifacts'
+JOB_DB = os.path.join(JOB_FOLDER, 'jobs.sqlite3')
+JOB_WORKERS = 2
+JOB_RETENTION = 24 * 60 * 60
+JOB_TIMEOUT = 60 * 60
+
+_executor = None
+
+
+def _connect():
+    os.makedirs(JOB_FOLDER, exist_ok=True)
+    conn = sqlite3.connect(JOB_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            project_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            artifact_path TEXT,
+            download_name TEXT,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        )
+    """)
+    return conn
+
+
+def _update(job_id, **fields):
+    columns = ', '.join(f"{name} = ?" for name in fields)
+    conn = _connect()
+    with conn:
+        conn.execute(f"UPDATE jobs SET {columns} WHERE job_id = ?", (*fields.values(), job_id))
+    conn.close()
+
+
+def get_job(job_id):
+    conn = _connect()
+    row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def load_artifact(job):
+    """Return the pickled result of a finished report job."""
+    with open(job['artifact_path'], 'rb') as f:
+        return pickle.load(f)
+
+
+def _run_job(job_id, kind, project_id):
+    # Runs in a pool process; the app is imported here so the child gets its
+    # own MySQL connection instead of sharing the parent's
+    from app import app, run_job_handler
+
+    def progress(fraction, message=None):
+        _update(job_id, progress=round(fraction, 3), message=message)
+
+    _update(job_id, status='running')
+    try:
+        with app.app_context():
+            artifact_path, download_name = run_job_handler(
+                kind, project_id, os.path.join(JOB_FOLDER, job_id), progress)
+        _update(job_id, status='done', progress=1, message=None,
+                artifact_path=artifact_path, download_name=download_name,
+                finished_at=time.time())
+    except Exception as e:
+        traceback.print_exc()
+        _update(job_id, status='failed', message=str(e), finished_at=time.time())
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=JOB_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+def artifact_base(job_id):
+    os.makedirs(JOB_FOLDER, exist_ok=True)
+    return os.path.join(JOB_FOLDER, job_id)
+
+
+def submit_job(kind, project_id, job_id=None):
+    """Queue a job and return its id.
+
+    Pass a job_id from new_job_id() when inputs have to be staged under the
+    job's artifact path before it runs.
+    """
+    cleanup_jobs()
+    job_id = job_id or new_job_id()
+    conn = _connect()
+    with conn:
+        conn.execute("""
+            INSERT INTO jobs (job_id, kind, project_id, created_at) VALUES (?, ?, ?, ?)
+        """, (job_id, kind, project_id, time.time()))
+    conn.close()
+    _get_executor().submit(_run_job, job_id, kind, project_id)
+    return job_id
+
+
+def active_job(kind, project_id):
+    """Id of a queued or running job of this kind, or None."""
+    conn = _connect()
+    row = conn.execute("""
+        SELECT job_id FROM jobs
+        WHERE kind = ? AND project_id = ? AND status IN ('queued', 'running') AND created_at > ?
+        LIMIT 1
+    """, (kind, project_id, time.time() - JOB_TIMEOUT)).fetchone()
+    conn.close()
+    return row['job_id'] if row else None
+
+
+def cleanup_jobs(retention=JOB_RETENTION):
+    """Delete finished jobs past retention and fail jobs that never finished."""
+    now = time.time()
+    conn = _connect()
+    with conn:
+        conn.execute("""
+            UPDATE jobs SET status = 'failed', message = 'Job timed out', finished_at = ?
+            WHERE status IN ('queued', 'running') AND created_at < ?
+        """, (now, now - JOB_TIMEOUT))
+        expired = conn.execute("""
+            SELECT job_id, artifact_path FROM jobs
+            WHERE status IN ('done', 'failed') AND finished_at < ?
+        """, (now - retention,)).fetchall()
+        for job in expired:
+            if job['artifact_path'] and os.path.exists(job['artifact_path']):
+                os.remove(job['artifact_path'])
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job['job_id'],))
+    conn.close()
+    return len(expired)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage background jobs')
+    parser.add_argument('--cleanup', action='store_true', help='remove expired jobs')
+    parser.add_argument('--retention', type=int, default=JOB_RETENTION,
+                        help='seconds to keep finished jobs')
+    args = parser.parse_args()
+    if args.cleanup:
+        print(f"Removed {cleanup_jobs(args.retention)} expired jobs")
@@ -0,0 +1,64 @@
+# Keyset (cursor-based) pagination for the list pages.
+# Instead of OFFSET, each page continues after the sort key of the last row
+# it returned, so every page is one index range read regardless of depth.
+import base64
+import json
+
+PAGE_SIZE = 50
+
+
+def encode_cursor(row, keys):
+    values = [str(row[key]) for key in keys]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(token, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def keyset_page(cur, select_sql, filters, params, order, after=None,
+                descending=True, group_by=None, limit=PAGE_SIZE):
+    """Run one page of a list query.
+
+    order is a list of (column_expression, row_key) pairs whose combination
+    is unique (end it with the primary key). Returns (rows, next_cursor);
+    next_cursor is None on the last page.
+    """
+    filters = list(filters)
+    params = list(params)
+
+    values = decode_cursor(after, len(order)) if after else None
+    if values:
+        op = '<' if descending else '>'
+        # (a, b) < (x, y) expanded so MySQL can use the index range
+        clauses = []
+        for i, (column, _) in enumerate(order):
+            terms = [f"{prev} = %s" for prev, _ in order[:i]] + [f"{column} {op} %s"]
+            clauses.append('(' + ' AND '.join(terms) + ')')
+            params.extend(values[:i + 1])
+        filters.append('(' + ' OR '.join(clauses) + ')')
+
+    sql = select_sql
+    if filters:
+        sql += ' WHERE ' + ' AND '.join(filters)
+    if group_by:
+        sql += ' GROUP BY ' + group_by
+    direction = 'DESC' if descending else 'ASC'
+    sql += ' ORDER BY ' + ', '.join(f"{column} {direction}" for column, _ in order)
+    sql += ' LIMIT %s'
+    params.append(limit + 1)
+
+    cur.execute(sql, params)
+    rows = list(cur.fetchall())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], [key for _, key in order])
+    return rows, next_cursor
@@ -0,0 +1,227 @@
+# Materialized per-project summary for the dashboard.
+# portfolio_summary holds one row per project with budget vs actual cost,
+# weighted progress, task and overdue counts, recent safety incidents,
+# equipment utilization and the current earned-value figures, so the dashboard
+# and the portfolio page read a single indexed table instead of aggregating the
+# base tables.
+#
+# Rows remember the projects.data_version they were built from. Equipment and
+# safety writes mark their project's row stale with mark_stale(), and every row
+# is rebuilt once a day for the date-dependent counts. Project writes rebuild
+# their row after committing; otherwise the dashboard and the portfolio page
+# only read this table and queue a 'portfolio_summary' job in the jobs.py pool
+# when rows are missing or stale. From cron, like the weather prefetch:
+#     python portfolio_summary.py                # refresh stale rows once
+#     python portfolio_summary.py --all          # rebuild every row
+#     python portfolio_summary.py --interval 300
+import argparse
+import time
+
+from evm import project_evm
+
+RECENT_INCIDENT_DAYS = 30
+
+# project_evm()['current'] keys stored on each row; evm_status_date holds
+# status_date and stays NULL for projects without planned tasks
+EVM_FIELDS = ('status_date', 'bac', 'pv', 'ev', 'ac', 'cpi', 'spi', 'eac', 'etc')
+
+SUMMARY_SQL = """
+    INSERT INTO portfolio_summary (
+        project_id, project_name, status, start_date, end_date, created_at,
+        estimated_budget, actual_cost, progress,
+        total_tasks, completed_tasks, delayed_tasks, overdue_tasks,
+        recent_incidents, serious_incidents,
+        equipment_assigned, equipment_in_use, source_version, refreshed_at
+    )
+    SELECT
+        p.project_id, p.project_name, p.status, p.start_date, p.end_date, p.created_at,
+        COALESCE(p.estimated_budget, 0),
+        COALESCE(tc.task_cost, 0) + COALESCE(ex.amount, 0),
+        CASE WHEN tc.total_weight > 0
+             THEN LEAST(COALESCE(pg.weighted_progress, 0) / tc.total_weight, 100)
+             ELSE 0 END,
+        COALESCE(tc.total_tasks, 0), COALESCE(tc.completed_tasks, 0),
+        COALESCE(tc.delayed_tasks, 0), COALESCE(tc.overdue_tasks, 0),
+        COALESCE(si.recent, 0), COALESCE(si.serious, 0),
+        COALESCE(eq.assigned, 0), COALESCE(eq.in_use, 0),
+        p.data_version, NOW()
+    FROM projects p
+    LEFT JOIN (
+        SELECT project_id,
+               SUM(COALESCE(actual_cost, 0)) AS task_cost,
+               SUM(CASE WHEN estimated_cost > 0 THEN estimated_cost
+                        ELSE COALESCE(estimated_days, 0) END) AS total_weight,
+               COUNT(*) AS total_tasks,
+               SUM(status = 'completed') AS completed_tasks,
+               SUM(status = 'delayed') AS delayed_tasks,
+               SUM(status != 'completed' AND planned_end_date < CURDATE()) AS overdue_tasks
+        FROM tasks
+        WHERE project_id IN ({ids})
+        GROUP BY project_id
+    ) tc ON tc.project_id = p.project_id
+    LEFT JOIN (
+        SELECT project_id, SUM(amount) AS amount
+        FROM project_expenditures
+        WHERE project_id IN ({ids})
+        GROUP BY project_id
+    ) ex ON ex.project_id = p.project_id
+    LEFT JOIN (
+        SELECT d.project_id, d.weighted_progress
+        FROM project_progress_daily d
+        JOIN (
+            SELECT project_id, MAX(progress_date) AS progress_date
+            FROM project_progress_daily
+            WHERE project_id IN ({ids})
+            GROUP BY project_id
+        ) latest ON latest.project_id = d.project_id AND latest.progress_date = d.progress_date
+    ) pg ON pg.project_id = p.project_id
+    LEFT JOIN (
+        SELECT project_id,
+               COUNT(*) AS recent,
+               SUM(severity IN ('high', 'critical')) AS serious
+        FROM safety_incidents
+        WHERE project_id IN ({ids})
+          AND incident_date >= CURDATE() - INTERVAL {days} DAY
+        GROUP BY project_id
+    ) si ON si.project_id = p.project_id
+    LEFT JOIN (
+        SELECT assigned_project AS project_id,
+               SUM(status != 'retired') AS assigned,
+               SUM(status = 'in_use') AS in_use
+        FROM equipment
+        WHERE assigned_project IN ({ids})
+        GROUP BY assigned_project
+    ) eq ON eq.project_id = p.project_id
+    WHERE p.project_id IN ({ids})
+    ON DUPLICATE KEY UPDATE
+        project_name = VALUES(project_name),
+        status = VALUES(status),
+        start_date = VALUES(start_date),
+        end_date = VALUES(end_date),
+        created_at = VALUES(created_at),
+        estimated_budget = VALUES(estimated_budget),
+        actual_cost = VALUES(actual_cost),
+        progress = VALUES(progress),
+        total_tasks = VALUES(total_tasks),
+        completed_tasks = VALUES(completed_tasks),
+        delayed_tasks = VALUES(delayed_tasks),
+        overdue_tasks = VALUES(overdue_tasks),
+        recent_incidents = VALUES(recent_incidents),
+        serious_incidents = VALUES(serious_incidents),
+        equipment_assigned = VALUES(equipment_assigned),
+        equipment_in_use = VALUES(equipment_in_use),
+        source_version = VALUES(source_version),
+        refreshed_at = VALUES(refreshed_at)
+"""
+
+
+def stale_projects(cur):
+    cur.execute("""
+        SELECT p.project_id
+        FROM projects p
+        LEFT JOIN portfolio_summary s ON s.project_id = p.project_id
+        WHERE s.project_id IS NULL
+           OR s.source_version != p.data_version
+           OR s.refreshed_at < CURDATE()
+    """)
+    return [row['project_id'] for row in cur.fetchall()]
+
+
+def refresh_summary(cur, project_ids=None, batch_size=200):
+    """Rebuild the summary rows of the given (default: stale) projects.
+
+    Returns the number of projects refreshed; the caller commits.
+    """
+    if project_ids is None:
+        project_ids = stale_projects(cur)
+
+    for start in range(0, len(project_ids), batch_size):
+        batch = list(project_ids[start:start + batch_size])
+        placeholders = ', '.join(['%s'] * len(batch))
+        # Six IN lists: tasks, expenditures, progress, incidents, equipment, projects
+        cur.execute(SUMMARY_SQL.format(ids=placeholders, days=RECENT_INCIDENT_DAYS), batch * 6)
+
+        for project_id in batch:
+            evm = project_evm(cur, project_id)
+            current = (evm and evm['current']) or {}
+            cur.execute("""
+                UPDATE portfolio_summary
+                SET evm_status_date = %s, bac = %s, pv = %s, ev = %s, ac = %s,
+                    cpi = %s, spi = %s, eac = %s, etc = %s
+                WHERE project_id = %s
+            """, [current.get(field) for field in EVM_FIELDS] + [project_id])
+
+    # Projects that no longer exist
+    cur.execute("""
+        DELETE s FROM portfolio_summary s
+        LEFT JOIN projects p ON p.project_id = s.project_id
+        WHERE p.project_id IS NULL
+    """)
+    return len(project_ids)
+
+
+def mark_stale(cur, project_id=None, equipment_id=None, incident_id=None):
+    """Flag summary rows for the next refresh, given a project or the
+    equipment / incident row about to change."""
+    if project_id:
+        cur.execute("""
+            UPDATE portfolio_summary SET source_version = -1 WHERE project_id = %s
+        """, (project_id,))
+    if equipment_id is not None:
+        cur.execute("""
+            UPDATE portfolio_summary s
+            JOIN equipment e ON e.assigned_project = s.project_id
+            SET s.source_version = -1
+            WHERE e.equipment_id = %s
+        """, (equipment_id,))
+    if incident_id is not None:
+        cur.execute("""
+            UPDATE portfolio_summary s
+            JOIN safety_incidents i ON i.project_id = s.project_id
+            SET s.source_version = -1
+            WHERE i.incident_id = %s
+        """, (incident_id,))
+
+
+def summary_evm(row):
+    """The project_evm()['current'] figures kept on a summary row, or None."""
+    if row['evm_status_date'] is None:
+        return None
+    return dict({field: row[field] for field in EVM_FIELDS[1:]},
+                status_date=row['evm_status_date'])
+
+
+def load_summary(cur):
+    cur.execute("""
+        SELECT *
+        FROM portfolio_summary
+        ORDER BY status, project_name
+    """)
+    return cur.fetchall()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refresh the dashboard portfolio summary')
+    parser.add_argument('--all', action='store_true', help='rebuild every project, not just stale ones')
+    parser.add_argument('--interval', type=int, default=0,
+                        help='keep running, refreshing every N seconds')
+    args = parser.parse_args()
+
+    from app import app, mysql
+
+    while True:
+        with app.app_context():
+            cur = mysql.connection.cursor()
+            try:
+                if args.all:
+                    cur.execute("SELECT project_id FROM projects ORDER BY project_id")
+                    count = refresh_summary(cur, [row['project_id'] for row in cur.fetchall()])
+                else:
+                    count = refresh_summary(cur)
+                mysql.connection.commit()
+            finally:
+                cur.close()
+        print(f"Refreshed {count} portfolio summary rows")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,165 @@
+# Materialized daily progress per project.
+# project_progress_daily holds, for every day a project had progress recorded,
+# the sum over its tasks of (latest percentage as of that day) x (task weight).
+# A task's weight is its estimated cost, or its estimated days when it has no
+# cost. Reports divide by the project's current total weight, so adding a task
+# needs no rewrite; changing a task's estimate or deleting tasks rebuilds the
+# project's series.
+#
+# record_progress() applies each entry as a delta over the days it is the
+# task's latest value, so nothing re-scans daily_progress.
+#
+# Backfill or rebuild:
+#     python progress_rollup.py --rebuild [--project N]
+import argparse
+from decimal import Decimal
+
+
+def task_weight(task):
+    if task['estimated_cost']:
+        return Decimal(str(task['estimated_cost']))
+    return Decimal(str(task['estimated_days'] or 0))
+
+
+def apply_progress(cur, task_id, progress_date, percentage_completed):
+    """Fold a new daily_progress entry into the rollup.
+
+    Call before inserting the entry; the caller commits.
+    """
+    cur.execute("""
+        SELECT project_id, estimated_cost, estimated_days FROM tasks WHERE task_id = %s
+    """, (task_id,))
+    task = cur.fetchone()
+    if not task:
+        return
+    project_id = task['project_id']
+
+    # The task's value this entry replaces, and where its next entry takes over
+    cur.execute("""
+        SELECT percentage_completed
+        FROM daily_progress
+        WHERE task_id = %s AND progress_date <= %s
+        ORDER BY progress_date DESC, progress_id DESC
+        LIMIT 1
+    """, (task_id, progress_date))
+    previous = cur.fetchone()
+    cur.execute("""
+        SELECT MIN(progress_date) AS next_date
+        FROM daily_progress
+        WHERE task_id = %s AND progress_date > %s
+    """, (task_id, progress_date))
+    next_date = cur.fetchone()['next_date']
+
+    old = Decimal(str(previous['percentage_completed'])) if previous else Decimal('0')
+    delta = (Decimal(str(percentage_completed)) - old) * task_weight(task)
+
+    # Seed the day from the last earlier day so the series stays cumulative
+    cur.execute("""
+        SELECT weighted_progress
+        FROM project_progress_daily
+        WHERE project_id = %s AND progress_date < %s
+        ORDER BY progress_date DESC
+        LIMIT 1
+    """, (project_id, progress_date))
+    seed = cur.fetchone()
+    cur.execute("""
+        INSERT IGNORE INTO project_progress_daily (project_id, progress_date, weighted_progress)
+        VALUES (%s, %s, %s)
+    """, (project_id, progress_date, seed['weighted_progress'] if seed else 0))
+
+    if not delta:
+        return
+    if next_date is None:
+        cur.execute("""
+            UPDATE project_progress_daily
+            SET weighted_progress = weighted_progress + %s
+            WHERE project_id = %s AND progress_date >= %s
+        """, (delta, project_id, progress_date))
+    else:
+        cur.execute("""
+            UPDATE project_progress_daily
+            SET weighted_progress = weighted_progress + %s
+            WHERE project_id = %s AND progress_date >= %s AND progress_date < %s
+        """, (delta, project_id, progress_date, next_date))
+
+
+def rebuild_progress(cur, project_id=None):
+    """Recompute the series from daily_progress. Returns rows written."""
+    if project_id is None:
+        cur.execute("SELECT project_id FROM projects ORDER BY project_id")
+        project_ids = [p['project_id'] for p in cur.fetchall()]
+    else:
+        project_ids = [project_id]
+
+    written = 0
+    for pid in project_ids:
+        cur.execute("""
+            SELECT dp.task_id, dp.progress_date, dp.percentage_completed,
+                   t.estimated_cost, t.estimated_days
+            FROM daily_progress dp
+            JOIN tasks t ON dp.task_id = t.task_id
+            WHERE t.project_id = %s
+            ORDER BY dp.progress_date, dp.progress_id
+        """, (pid,))
+
+        current = {}
+        total = Decimal('0')
+        series = {}
+        for row in cur.fetchall():
+            value = Decimal(str(row['percentage_completed'])) * task_weight(row)
+            total += value - current.get(row['task_id'], 0)
+            current[row['task_id']] = value
+            series[row['progress_date']] = total
+
+        cur.execute("DELETE FROM project_progress_daily WHERE project_id = %s", (pid,))
+        if series:
+            cur.executemany("""
+                INSERT INTO project_progress_daily (project_id, progress_date, weighted_progress)
+                VALUES (%s, %s, %s)
+            """, [(pid, day, value) for day, value in series.items()])
+        written += len(series)
+    return written
+
+
+def progress_series(cur, project_id):
+    """(dates, percentages) of the project's weighted progress over time."""
+    cur.execute("""
+        SELECT SUM(CASE WHEN estimated_cost > 0 THEN estimated_cost
+                        ELSE COALESCE(estimated_days, 0) END) AS total_weight
+        FROM tasks
+        WHERE project_id = %s
+    """, (project_id,))
+    total_weight = cur.fetchone()['total_weight']
+
+    cur.execute("""
+        SELECT progress_date, weighted_progress
+        FROM project_progress_daily
+        WHERE project_id = %s
+        ORDER BY progress_date
+    """, (project_id,))
+    rows = cur.fetchall()
+    if not total_weight:
+        return [str(r['progress_date']) for r in rows], [0.0 for _ in rows]
+    return ([str(r['progress_date']) for r in rows],
+            [round(float(r['weighted_progress'] / total_weight), 2) for r in rows])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill the project progress rollup')
+    parser.add_argument('--rebuild', action='store_true', help='recompute from daily_progress')
+    parser.add_argument('--project', type=int, help='only rebuild this project')
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.error('nothing to do; pass --rebuild')
+
+    from app import app, mysql
+
+    with app.app_context():
+        cur = mysql.connection.cursor()
+        try:
+            count = rebuild_progress(cur, args.project)
+            mysql.connection.commit()
+        finally:
+            cur.close()
+    print(f"Wrote {count} daily progress rows")
@@ -185,4 +185,198 @@ CREATE TABLE subcontractor_projects (
 );
 select * from projects;
 
+-- Per-task cost ledger, maintained incrementally by the app
+CREATE TABLE IF NOT EXISTS task_cost_ledger (
+    task_id INT PRIMARY KEY,
+    project_id INT NOT NULL,
+    labor_cost DECIMAL(15,4) NOT NULL DEFAULT 0,
+    material_cost DECIMAL(15,4) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (task_id) REFERENCES tasks(task_id),
+    FOREIGN KEY (project_id) REFERENCES projects(project_id),
+    KEY (project_id)
+);
+
+-- Expenditure tables (migration 1 in create_tables.py)
+CREATE TABLE IF NOT EXISTS project_expenditures (
+    expenditure_id INT AUTO_INCREMENT PRIMARY KEY,
+    project_id INT NOT NULL,
+    description VARCHAR(255) NOT NULL,
+    amount DECIMAL(15,2) NOT NULL,
+    expenditure_date DATE NOT NULL,
+    category VARCHAR(50) DEFAULT 'Other',
+    created_by INT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (project_id) REFERENCES projects(project_id),
+    FOREIGN KEY (created_by) REFERENCES users(user_id)
+);
+
+CREATE TABLE IF NOT EXISTS expenditure_documents (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    expenditure_id INT NOT NULL,
+    document_id INT NOT NULL,
+    FOREIGN KEY (expenditure_id) REFERENCES project_expenditures(expenditure_id),
+    FOREIGN KEY (document_id) REFERENCES documents(document_id),
+    UNIQUE KEY (expenditure_id, document_id)
+);
+
+-- Secondary indexes (applied as migration 2 by create_tables.py)
+CREATE INDEX idx_tasks_project_start ON tasks (project_id, planned_start_date);
+CREATE INDEX idx_tasks_parent_start ON tasks (parent_task_id, planned_start_date);
+CREATE INDEX idx_tasks_status_start ON tasks (status, planned_start_date);
+CREATE INDEX idx_projects_created ON projects (created_at);
+CREATE INDEX idx_projects_status ON projects (status);
+CREATE INDEX idx_progress_task_date ON daily_progress (task_id, progress_date, percentage_completed);
+CREATE INDEX idx_assignments_task_date ON task_assignments (task_id, assignment_date);
+CREATE INDEX idx_task_materials_task_date ON task_materials (task_id, date_used);
+CREATE INDEX idx_documents_project_uploaded ON documents (project_id, upload_date);
+CREATE INDEX idx_documents_uploaded ON documents (upload_date);
+CREATE INDEX idx_expenditures_project_date ON project_expenditures (project_id, expenditure_date);
+CREATE INDEX idx_incidents_project_date ON safety_incidents (project_id, incident_date);
+CREATE INDEX idx_incidents_date ON safety_incidents (incident_date);
+CREATE INDEX idx_equipment_name ON equipment (equipment_name);
+CREATE INDEX idx_workers_name ON workers (name);
+CREATE INDEX idx_materials_name ON materials (material_name);
+CREATE INDEX idx_subcontractors_company ON subcontractors (company_name);
+
+-- Indexes for paginated list filters (migration 3)
+CREATE INDEX idx_projects_status_created ON projects (status, created_at);
+DROP INDEX idx_projects_status ON projects;
+CREATE INDEX idx_equipment_status_name ON equipment (status, equipment_name);
+CREATE INDEX idx_equipment_project_name ON equipment (assigned_project, equipment_name);
+CREATE INDEX idx_incidents_severity_date ON safety_incidents (severity, incident_date);
+CREATE INDEX idx_subcontractor_projects_project ON subcontractor_projects (project_id, subcontractor_id);
+
+-- Bumped on every write that changes a project's reports (migration 4)
+ALTER TABLE projects ADD COLUMN data_version INT NOT NULL DEFAULT 0;
+
+-- Weather caches (migration 5)
+CREATE TABLE IF NOT EXISTS weather_geocode_cache (
+    location VARCHAR(100) PRIMARY KEY,
+    lat DECIMAL(9,6) NOT NULL,
+    lon DECIMAL(9,6) NOT NULL,
+    fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS weather_forecast_cache (
+    coord_key VARCHAR(32) PRIMARY KEY,
+    payload MEDIUMTEXT NOT NULL,
+    expires_at BIGINT NOT NULL,
+    fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Weather-sensitive tasks (migration 6)
+ALTER TABLE tasks ADD COLUMN is_outdoor TINYINT(1) NOT NULL DEFAULT 1;
+
+-- Task ancestry closure table (migration 7); backfill with
+-- `python task_tree.py --rebuild`
+CREATE TABLE IF NOT EXISTS task_closure (
+    ancestor_id INT NOT NULL,
+    descendant_id INT NOT NULL,
+    depth INT NOT NULL,
+    PRIMARY KEY (ancestor_id, descendant_id),
+    KEY idx_task_closure_descendant (descendant_id, depth),
+    FOREIGN KEY (ancestor_id) REFERENCES tasks(task_id),
+    FOREIGN KEY (descendant_id) REFERENCES tasks(task_id)
+);
+
+-- Finish-to-start task dependencies for CPM scheduling (migration 8)
+CREATE TABLE IF NOT EXISTS task_dependencies (
+    predecessor_id INT NOT NULL,
+    successor_id INT NOT NULL,
+    lag_days INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (predecessor_id, successor_id),
+    KEY idx_task_dependencies_successor (successor_id),
+    FOREIGN KEY (predecessor_id) REFERENCES tasks(task_id),
+    FOREIGN KEY (successor_id) REFERENCES tasks(task_id)
+);
+
+-- Daily weighted progress per project (migration 9); backfill with
+-- `python progress_rollup.py --rebuild`
+CREATE TABLE IF NOT EXISTS project_progress_daily (
+    project_id INT NOT NULL,
+    progress_date DATE NOT NULL,
+    weighted_progress DECIMAL(20,4) NOT NULL DEFAULT 0,
+    PRIMARY KEY (project_id, progress_date),
+    FOREIGN KEY (project_id) REFERENCES projects(project_id)
+);
+
+-- Dashboard portfolio summary (migration 10); fill with
+-- `python portfolio_summary.py --all`
+CREATE TABLE IF NOT EXISTS portfolio_summary (
+    project_id INT PRIMARY KEY,
+    project_name VARCHAR(100) NOT NULL,
+    status VARCHAR(20),
+    start_date DATE,
+    end_date DATE,
+    created_at TIMESTAMP NULL,
+    estimated_budget DECIMAL(15,2) NOT NULL DEFAULT 0,
+    actual_cost DECIMAL(15,2) NOT NULL DEFAULT 0,
+    progress DECIMAL(5,2) NOT NULL DEFAULT 0,
+    total_tasks INT NOT NULL DEFAULT 0,
+    completed_tasks INT NOT NULL DEFAULT 0,
+    delayed_tasks INT NOT NULL DEFAULT 0,
+    overdue_tasks INT NOT NULL DEFAULT 0,
+    recent_incidents INT NOT NULL DEFAULT 0,
+    serious_incidents INT NOT NULL DEFAULT 0,
+    equipment_assigned INT NOT NULL DEFAULT 0,
+    equipment_in_use INT NOT NULL DEFAULT 0,
+    cpi DECIMAL(8,3),
+    spi DECIMAL(8,3),
+    source_version INT NOT NULL DEFAULT -1,
+    refreshed_at TIMESTAMP NULL,
+    KEY idx_portfolio_summary_status (status, project_name)
+);
+
+-- Worker calendar index (migration 11)
+CREATE INDEX idx_assignments_worker_date ON task_assignments (worker_id, assignment_date, hours_worked);
+
+-- Resource leveling (migration 12); allocate with
+-- `python resource_leveling.py --all`
+CREATE TABLE IF NOT EXISTS task_resource_needs (
+    need_id INT AUTO_INCREMENT PRIMARY KEY,
+    task_id INT NOT NULL,
+    resource_type ENUM('worker', 'equipment') NOT NULL,
+    skill VARCHAR(100) NOT NULL,
+    quantity INT NOT NULL DEFAULT 1,
+    FOREIGN KEY (task_id) REFERENCES tasks(task_id)
+);
+
+CREATE TABLE IF NOT EXISTS resource_allocations (
+    allocation_id INT AUTO_INCREMENT PRIMARY KEY,
+    project_id INT NOT NULL,
+    task_id INT NOT NULL,
+    need_id INT NOT NULL,
+    resource_type ENUM('worker', 'equipment') NOT NULL,
+    resource_id INT NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    FOREIGN KEY (task_id) REFERENCES tasks(task_id),
+    FOREIGN KEY (need_id) REFERENCES task_resource_needs(need_id),
+    KEY idx_allocations_resource (resource_type, resource_id, end_date),
+    KEY idx_allocations_project_start (project_id, start_date)
+);
+
+CREATE TABLE IF NOT EXISTS leveling_runs (
+    run_id INT AUTO_INCREMENT PRIMARY KEY,
+    project_id INT NOT NULL,
+    window_start DATE,
+    window_end DATE,
+    tasks_leveled INT NOT NULL DEFAULT 0,
+    allocations INT NOT NULL DEFAULT 0,
+    unallocated INT NOT NULL DEFAULT 0,
+    shifted_tasks INT NOT NULL DEFAULT 0,
+    elapsed_ms DECIMAL(12,2) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_leveling_runs_project (project_id, created_at)
+);
 
+-- Current earned-value figures on the portfolio summary (migration 13)
+ALTER TABLE portfolio_summary
+    ADD COLUMN evm_status_date DATE,
+    ADD COLUMN bac DECIMAL(15,2),
+    ADD COLUMN pv DECIMAL(15,2),
+    ADD COLUMN ev DECIMAL(15,2),
+    ADD COLUMN ac DECIMAL(15,2),
+    ADD COLUMN eac DECIMAL(15,2),
+    ADD COLUMN etc DECIMAL(15,2);
@@ -0,0 +1,128 @@
+# Set-based loader for everything the project_details page shows.
+# All tasks of a project are fetched in one query and the parent/child
+# structure, subtask counts and status rollups are built in Python, so no
+# correlated subqueries run per task row.
+from decimal import Decimal
+
+
+def build_task_structure(tasks):
+    """Attach subtask counts and return (main_tasks, gantt_tasks, progress)."""
+    subtask_counts = {}
+    for task in tasks:
+        parent_id = task['parent_task_id']
+        if parent_id is not None:
+            subtask_counts[parent_id] = subtask_counts.get(parent_id, 0) + 1
+
+    progress = {
+        'total_tasks': 0,
+        'completed_tasks': 0,
+        'in_progress_tasks': 0,
+        'not_started_tasks': 0,
+        'delayed_tasks': 0,
+        'estimated_cost': Decimal('0'),
+        'actual_cost': Decimal('0')
+    }
+
+    main_tasks = []
+    gantt_tasks = []
+    for task in tasks:
+        count = subtask_counts.get(task['task_id'], 0)
+        task['subtask_count'] = count
+
+        if task['parent_task_id'] is None:
+            main_tasks.append(task)
+
+        gantt_tasks.append({
+            'task_id': task['task_id'],
+            'task_name': task['task_name'],
+            'start_date': task['planned_start_date'],
+            'end_date': task['planned_end_date'],
+            'status': task['status'],
+            'has_subtasks': count
+        })
+
+        progress['total_tasks'] += 1
+        status_key = f"{task['status']}_tasks"
+        if status_key in progress:
+            progress[status_key] += 1
+        progress['estimated_cost'] += task['estimated_cost'] or 0
+        progress['actual_cost'] += task['actual_cost'] or 0
+
+    return main_tasks, gantt_tasks, progress
+
+
+def load_project_snapshot(cur, project_id):
+    """Load the project, its task tree and related lists in a few queries."""
+    cur.execute("""
+        SELECT p.*, u.username as created_by_name
+        FROM projects p
+        JOIN users u ON p.created_by = u.user_id
+        WHERE p.project_id = %s
+    """, (project_id,))
+    project = cur.fetchone()
+
+    # All tasks of the project in one pass; ordering matches the Gantt chart
+    cur.execute("""
+        SELECT t.*
+        FROM tasks t
+        WHERE t.project_id = %s
+        ORDER BY t.planned_start_date, t.task_id
+    """, (project_id,))
+    tasks = list(cur.fetchall())
+    main_tasks, gantt_tasks, progress = build_task_structure(tasks)
+
+    cur.execute("""
+        SELECT pe.*, u.username as created_by_name
+        FROM project_expenditures pe
+        JOIN users u ON pe.created_by = u.user_id
+        WHERE pe.project_id = %s
+        ORDER BY pe.expenditure_date DESC
+    """, (project_id,))
+    expenditures = cur.fetchall()
+
+    cur.execute("""
+        SELECT d.*, u.username as uploaded_by
+        FROM documents d
+        JOIN users u ON d.uploaded_by = u.user_id
+        WHERE d.project_id = %s
+        ORDER BY d.upload_date DESC
+    """, (project_id,))
+    documents = cur.fetchall()
+
+    # Worker hours per worker across the project's tasks
+    cur.execute("""
+        SELECT
+            ta.worker_id,
+            w.name as worker_name,
+            w.specialization,
+            SUM(ta.hours_worked) as hours_worked
+        FROM task_assignments ta
+        JOIN tasks t ON ta.task_id = t.task_id
+        JOIN workers w ON ta.worker_id = w.worker_id
+        WHERE t.project_id = %s
+        GROUP BY ta.worker_id, w.name, w.specialization
+        ORDER BY hours_worked DESC
+    """, (project_id,))
+    worker_assignments = cur.fetchall()
+
+    cur.execute("""
+        SELECT s.*
+        FROM subcontractors s
+        JOIN subcontractor_projects sp ON s.subcontractor_id = sp.subcontractor_id
+        WHERE sp.project_id = %s
+        ORDER BY s.company_name
+    """, (project_id,))
+    subcontractors = cur.fetchall()
+
+    return {
+        'project': project,
+        'tasks': tasks,
+        'main_tasks': main_tasks,
+        'gantt_tasks': gantt_tasks,
+        'progress': progress,
+        'expenditures': expenditures,
+        'total_expenditures': sum(e['amount'] for e in expenditures) if expenditures else 0,
+        'documents': documents,
+        'worker_assignments': worker_assignments,
+        'subcontractors': subcontractors
+    }
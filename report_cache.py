@@ -0,0 +1,155 @@
+# Cache for generated project reports and exports.
+# Entries are keyed on a hash of (kind, project, data_version); any write to a
+# project's tasks, assignments, materials, progress or expenditures bumps
+# projects.data_version, so stale entries are simply never asked for again and
+# age out of the LRU. A small in-memory LRU sits in front of an on-disk LRU
+# that is shared by all app and job processes.
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+CACHE_FOLDER = os.path.join('job_artifacts', 'report_cache')
+MEMORY_LIMIT = 64 * 1024 * 1024
+DISK_LIMIT = 1024 * 1024 * 1024
+
+
+class ReportCache:
+    def __init__(self, folder=CACHE_FOLDER, memory_limit=MEMORY_LIMIT, disk_limit=DISK_LIMIT):
+        self.folder = folder
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def key(kind, project_id, version):
+        return hashlib.sha256(f"{kind}:{project_id}:{version}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key)
+
+    def _remember(self, key, data):
+        # Keep the memory tier small; very large exports live on disk only
+        if len(data) > self.memory_limit // 4:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_size -= len(self._memory.pop(key))
+            self._memory[key] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_limit:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+                self.stats['evictions'] += 1
+
+    def get(self, kind, project_id, version):
+        key = self.key(kind, project_id, version)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return data
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+
+        # Touch the file so disk eviction sees it as recently used
+        os.utime(path)
+        with self._lock:
+            self.stats['disk_hits'] += 1
+        self._remember(key, data)
+        return data
+
+    def put(self, kind, project_id, version, data):
+        key = self.key(kind, project_id, version)
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = self._path(key) + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self.stats['stores'] += 1
+        self._remember(key, data)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.folder):
+            if name.endswith('.tmp'):
+                continue
+            try:
+                st = os.stat(self._path(name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.disk_limit:
+                break
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self.stats['evictions'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_size
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 3) if lookups else 0
+        return stats
+
+
+report_cache = ReportCache()
+
+
+def project_version(cur, project_id):
+    cur.execute("SELECT data_version FROM projects WHERE project_id = %s", (project_id,))
+    row = cur.fetchone()
+    return row['data_version'] if row else None
+
+
+def bump_project_version(cur, project_id=None, task_id=None, document_id=None, subcontractor_id=None):
+    """Invalidate cached reports for a project, given it, one of its tasks or
+    documents, or a subcontractor linked to it (every linked project)."""
+    if project_id is not None:
+        cur.execute("""
+            UPDATE projects SET data_version = data_version + 1 WHERE project_id = %s
+        """, (project_id,))
+    elif task_id is not None:
+        cur.execute("""
+            UPDATE projects p
+            JOIN tasks t ON t.project_id = p.project_id
+            SET p.data_version = p.data_version + 1
+            WHERE t.task_id = %s
+        """, (task_id,))
+    elif document_id is not None:
+        cur.execute("""
+            UPDATE projects p
+            JOIN documents d ON d.project_id = p.project_id
+            SET p.data_version = p.data_version + 1
+            WHERE d.document_id = %s
+        """, (document_id,))
+    elif subcontractor_id is not None:
+        cur.execute("""
+            UPDATE projects p
+            JOIN subcontractor_projects sp ON sp.project_id = p.project_id
+            SET p.data_version = p.data_version + 1
+            WHERE sp.subcontractor_id = %s
+        """, (subcontractor_id,))
@@ -0,0 +1,417 @@
+# Resource leveling: conflict-free worker and equipment allocations per task.
+# Tasks list what they need in task_resource_needs: a number of workers of a
+# specialization, or of equipment of a type. Workers come from the workers
+# table; equipment from equipment that is neither in maintenance nor retired
+# and is unassigned or assigned to the project (equipment.assigned_project).
+#
+# The leveler is a serial schedule generation scheme. Of the tasks whose
+# predecessors are placed, the one with the earliest CPM late start goes next,
+# on the first day from its earliest start where every need can be met without
+# double-booking anyone. A task may slip up to its CPM late start and never
+# into a placed successor; in-progress tasks do not slip. Within a skill it
+# prefers the resource the need already had, then the least loaded one. Needs
+# that still cannot be met are left unallocated.
+#
+# Leveling is incremental: level_project(cur, pid, window) only re-places the
+# open tasks whose planned dates or allocations overlap the window (an edited
+# task's old and new dates) and treats every other allocation, in this project
+# or any other, as fixed. Only those tasks and their direct predecessors and
+# successors are loaded and scheduled, so the cost of a run follows the window,
+# not the project size. Each run's computation time is recorded in
+# leveling_runs (the last RUNS_KEPT runs per project are kept).
+#     python resource_leveling.py --project 3
+#     python resource_leveling.py --all
+import argparse
+import heapq
+import time
+from bisect import bisect_right, insort
+from datetime import date
+
+from schedule import ScheduleError, compute_schedule, load_dependencies, task_duration
+
+RESOURCE_TYPES = ('worker', 'equipment')
+RUNS_KEPT = 50
+CALENDAR_DAYS = 60
+INFINITY = float('inf')
+TASK_COLUMNS = "task_id, planned_start_date, planned_end_date, estimated_days, status"
+
+
+def _in_batches(cur, sql, ids, params=(), size=1000):
+    """Run sql (with an {ids} placeholder list) over ids in batches; yields rows."""
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        batch = ids[start:start + size]
+        cur.execute(sql.format(ids=', '.join(['%s'] * len(batch))), list(params) + batch)
+        yield from cur.fetchall()
+
+
+def _availability(pools, calendar, skill, start, end):
+    """Split a skill's pool into resources free over [start, end] and, for
+    the busy ones, the first day after the booking that blocks them."""
+    calendar.cover(end)
+    free, blocked = [], []
+    for key in pools.get(skill, ()):
+        bookings = calendar.bookings.get(key)
+        if bookings:
+            i = bisect_right(bookings, (end, INFINITY)) - 1
+            if i >= 0 and bookings[i][1] >= start:
+                blocked.append(bookings[i][1] + 1)
+                continue
+        free.append(key)
+    return free, blocked
+
+
+def _assign(needs, free, load, previous):
+    """Pick resources per need from the free lists, preferring what the need
+    already had, then the least loaded. Returns (picks, units short)."""
+    picks, short, taken = {}, 0, set()
+    for need in needs:
+        mine = previous.get(need['need_id'], ())
+        candidates = [k for k in free.get((need['resource_type'], need['skill']), ()) if k not in taken]
+        chosen = heapq.nsmallest(need['quantity'], candidates,
+                                 key=lambda k: (k not in mine, load.get(k, 0), k))
+        taken.update(chosen)
+        picks[need['need_id']] = chosen
+        short += need['quantity'] - len(chosen)
+    return picks, short
+
+
+def place_task(needs, pools, calendar, previous, earliest, latest, length):
+    """First start in [earliest, latest] where all needs are met, else the
+    earliest start with whatever is free. Days are ordinals.
+
+    Returns (start, picks, short).
+    """
+    demand = {}
+    for need in needs:
+        skill = (need['resource_type'], need['skill'])
+        demand[skill] = demand.get(skill, 0) + need['quantity']
+
+    # Scarcest skills first, so a failing probe stops before the big pools
+    skills = sorted(demand, key=lambda skill: len(pools.get(skill, ())))
+    start = earliest
+    while True:
+        free, retry = {}, start
+        for skill in skills:
+            free[skill], blocked = _availability(pools, calendar, skill, start, start + length - 1)
+            missing = demand[skill] - len(free[skill])
+            if missing <= 0:
+                continue
+            # Met once `missing` more of the busy resources free up
+            retry = heapq.nsmallest(missing, blocked)[-1] if len(blocked) >= missing else None
+            break
+        if retry == start or retry is None or retry > latest:
+            break
+        start = retry
+
+    if retry != start:
+        start = earliest
+        free = {skill: _availability(pools, calendar, skill, start, start + length - 1)[0]
+                for skill in skills}
+    picks, short = _assign(needs, free, calendar.load, previous)
+    return start, picks, short
+
+
+def _load_pools(cur, project_id, needs):
+    """{(resource_type, skill): [(resource_type, resource_id)]} for the skills needed."""
+    skills = {kind: sorted({n['skill'] for n in needs if n['resource_type'] == kind})
+              for kind in RESOURCE_TYPES}
+    pools = {}
+    if skills['worker']:
+        for row in _in_batches(cur, """
+            SELECT worker_id, specialization FROM workers
+            WHERE LOWER(TRIM(specialization)) IN ({ids})
+        """, skills['worker']):
+            key = ('worker', row['specialization'].strip().lower())
+            pools.setdefault(key, []).append(('worker', row['worker_id']))
+    if skills['equipment']:
+        for row in _in_batches(cur, """
+            SELECT equipment_id, equipment_type FROM equipment
+            WHERE status NOT IN ('maintenance', 'retired')
+              AND (assigned_project IS NULL OR assigned_project = %s)
+              AND LOWER(TRIM(equipment_type)) IN ({ids})
+        """, skills['equipment'], (project_id,)):
+            key = ('equipment', row['equipment_type'].strip().lower())
+            pools.setdefault(key, []).append(('equipment', row['equipment_id']))
+    return pools
+
+
+class _Calendar:
+    """Bookings of the pooled resources from horizon_start on, other than the
+    allocations being re-placed, and each resource's booked days.
+
+    Bookings are read CALENDAR_DAYS at a time as placement probes later
+    days, so a run only reads the part of the calendar it looks at.
+    """
+
+    def __init__(self, cur, pools, scope, horizon_start):
+        self.cur = cur
+        self.scope = scope
+        self.horizon_start = horizon_start
+        self.resources = {kind: sorted({key[1] for keys in pools.values() for key in keys
+                                        if key[0] == kind})
+                          for kind in RESOURCE_TYPES}
+        self.bookings = {}
+        self.load = {}
+        self.loaded_until = None
+
+    def book(self, key, start, end):
+        insort(self.bookings.setdefault(key, []), (start, end))
+        self.load[key] = self.load.get(key, 0) + end - start + 1
+
+    def cover(self, day):
+        """Make sure every booking starting on or before day is loaded."""
+        if self.loaded_until is not None and day <= self.loaded_until:
+            return
+        if self.loaded_until is None:
+            until = max(day, self.horizon_start.toordinal() + CALENDAR_DAYS)
+            sql = """
+                SELECT task_id, resource_id, start_date, end_date
+                FROM resource_allocations
+                WHERE resource_type = %s AND end_date >= %s AND start_date <= %s
+                  AND resource_id IN ({ids})
+            """
+            bounds = (self.horizon_start, date.fromordinal(until))
+        else:
+            # Bookings starting after the last slice also end after it
+            until = max(day, self.loaded_until + CALENDAR_DAYS)
+            after = date.fromordinal(self.loaded_until)
+            sql = """
+                SELECT task_id, resource_id, start_date, end_date
+                FROM resource_allocations
+                WHERE resource_type = %s AND end_date > %s
+                  AND start_date > %s AND start_date <= %s AND resource_id IN ({ids})
+            """
+            bounds = (after, after, date.fromordinal(until))
+        for kind, resource_ids in self.resources.items():
+            for row in _in_batches(self.cur, sql, resource_ids, (kind,) + bounds):
+                if row['task_id'] not in self.scope:
+                    self.book((kind, row['resource_id']),
+                              row['start_date'].toordinal(), row['end_date'].toordinal())
+        self.loaded_until = until
+
+
+def _load_window(cur, project_id, window):
+    """Open tasks whose planned dates or allocations overlap window, plus
+    their direct predecessors and successors, and the dependencies touching
+    them. Returns (tasks, dependencies, scope)."""
+    cur.execute(f"""
+        SELECT {TASK_COLUMNS}
+        FROM tasks
+        WHERE project_id = %s AND status != 'completed'
+          AND ((planned_start_date <= %s AND planned_end_date >= %s)
+               OR task_id IN (SELECT task_id FROM resource_allocations
+                              WHERE project_id = %s AND start_date <= %s AND end_date >= %s))
+    """, (project_id, window[1], window[0], project_id, window[1], window[0]))
+    tasks = {t['task_id']: t for t in cur.fetchall()}
+    scope = set(tasks)
+
+    dependencies = set()
+    for column in ('successor_id', 'predecessor_id'):
+        for row in _in_batches(cur, f"""
+            SELECT predecessor_id, successor_id, lag_days
+            FROM task_dependencies
+            WHERE {column} IN ({{ids}})
+        """, sorted(scope)):
+            dependencies.add((row['predecessor_id'], row['successor_id'], row['lag_days']))
+
+    neighbours = {task_id for dependency in dependencies for task_id in dependency[:2]} - scope
+    for row in _in_batches(cur, f"SELECT {TASK_COLUMNS} FROM tasks WHERE task_id IN ({{ids}})",
+                           sorted(neighbours)):
+        tasks[row['task_id']] = row
+    return tasks, sorted(dependencies), scope
+
+
+def level_project(cur, project_id, window=None):
+    """(Re)allocate resources to a project's open tasks.
+
+    window is an inclusive (start, end) date pair; only tasks overlapping it
+    are re-placed. Returns the run summary; the caller commits.
+    """
+    started = time.perf_counter()
+    finish_by = None
+    if window is None:
+        cur.execute(f"SELECT {TASK_COLUMNS} FROM tasks WHERE project_id = %s", (project_id,))
+        tasks = {t['task_id']: t for t in cur.fetchall()}
+        dependencies = load_dependencies(cur, project_id)
+        scope = {task_id for task_id, task in tasks.items() if task['status'] != 'completed'}
+    else:
+        tasks, dependencies, scope = _load_window(cur, project_id, window)
+        # The window's slack runs to the end of the whole project
+        cur.execute("""
+            SELECT planned_end_date FROM tasks
+            WHERE project_id = %s
+            ORDER BY planned_end_date DESC
+            LIMIT 1
+        """, (project_id,))
+        last = cur.fetchone()
+        finish_by = last['planned_end_date'] if last else None
+    # Not project_schedule(): callers level inside their write transaction,
+    # and a cached schedule must not outlive a rollback
+    try:
+        schedule = compute_schedule(list(tasks.values()), dependencies, finish_by)['tasks']
+    except ScheduleError:
+        schedule = {}
+
+    # Where every task currently sits: its allocations, else its CPM start
+    placed, previous = {}, {}
+    for row in _in_batches(cur, """
+        SELECT task_id, need_id, resource_type, resource_id, start_date
+        FROM resource_allocations
+        WHERE task_id IN ({ids})
+    """, sorted(tasks)):
+        day = row['start_date'].toordinal()
+        placed[row['task_id']] = min(placed.get(row['task_id'], day), day)
+        previous.setdefault(row['need_id'], set()).add((row['resource_type'], row['resource_id']))
+
+    length = {task_id: max(task_duration(task), 1) for task_id, task in tasks.items()}
+    sits = {}
+    for task_id, task in tasks.items():
+        planned = schedule.get(task_id, {}).get('early_start') or task['planned_start_date']
+        sits[task_id] = placed.get(task_id, planned.toordinal())
+
+    summary = {'project_id': project_id, 'tasks': len(scope), 'allocations': 0,
+               'unallocated': 0, 'shifted': 0,
+               'window_start': window[0] if window else None,
+               'window_end': window[1] if window else None}
+
+    if scope:
+        needs = {}
+        for row in _in_batches(cur, """
+            SELECT need_id, task_id, resource_type, skill, quantity
+            FROM task_resource_needs
+            WHERE task_id IN ({ids})
+            ORDER BY need_id
+        """, sorted(scope)):
+            row['skill'] = row['skill'].strip().lower()
+            needs.setdefault(row['task_id'], []).append(row)
+        all_needs = [n for task_needs in needs.values() for n in task_needs]
+        pools = _load_pools(cur, project_id, all_needs)
+        horizon_start = date.fromordinal(min(
+            min(sits[t], tasks[t]['planned_start_date'].toordinal()) for t in scope))
+        calendar = _Calendar(cur, pools, scope, horizon_start)
+
+        predecessors = {task_id: [] for task_id in scope}
+        successors = {task_id: [] for task_id in scope}
+        waiting = dict.fromkeys(scope, 0)
+        for predecessor_id, successor_id, lag in dependencies:
+            if successor_id in scope:
+                predecessors[successor_id].append((predecessor_id, lag or 0))
+                if predecessor_id in scope:
+                    waiting[successor_id] += 1
+            if predecessor_id in scope:
+                successors[predecessor_id].append((successor_id, lag or 0))
+
+        def priority(task_id):
+            late = schedule.get(task_id, {}).get('late_start')
+            return (late.toordinal() if late else sits[task_id], sits[task_id], task_id)
+
+        ready = [priority(t) for t, count in waiting.items() if count == 0]
+        heapq.heapify(ready)
+        allocations = []
+        leveled = {}
+        while ready:
+            _, _, task_id = heapq.heappop(ready)
+            task = tasks[task_id]
+            span = length[task_id]
+
+            earliest = task['planned_start_date'].toordinal()
+            for predecessor_id, lag in predecessors[task_id]:
+                if predecessor_id in tasks:
+                    start = leveled.get(predecessor_id, sits[predecessor_id])
+                    earliest = max(earliest, start + length[predecessor_id] + lag)
+            latest = earliest
+            if task['status'] != 'in_progress':
+                late = schedule.get(task_id, {}).get('late_start')
+                latest = late.toordinal() if late else earliest
+                for successor_id, lag in successors[task_id]:
+                    if successor_id not in scope and successor_id in tasks:
+                        latest = min(latest, sits[successor_id] - lag - span)
+                latest = max(latest, earliest)
+
+            start, picks, short = place_task(needs.get(task_id, []), pools, calendar,
+                                             previous, earliest, latest, span)
+            leveled[task_id] = start
+            end = start + span - 1
+            for need_id, keys in picks.items():
+                for key in keys:
+                    calendar.book(key, start, end)
+                    allocations.append((project_id, task_id, need_id, key[0], key[1],
+                                        date.fromordinal(start), date.fromordinal(end)))
+            summary['unallocated'] += short
+            if start != task['planned_start_date'].toordinal():
+                summary['shifted'] += 1
+
+            for successor_id, _ in successors[task_id]:
+                if successor_id in scope:
+                    waiting[successor_id] -= 1
+                    if waiting[successor_id] == 0:
+                        heapq.heappush(ready, priority(successor_id))
+
+        ids = sorted(scope)
+        for offset in range(0, len(ids), 1000):
+            batch = ids[offset:offset + 1000]
+            cur.execute(f"""
+                DELETE FROM resource_allocations WHERE task_id IN ({', '.join(['%s'] * len(batch))})
+            """, batch)
+        if allocations:
+            cur.executemany("""
+                INSERT INTO resource_allocations (
+                    project_id, task_id, need_id, resource_type, resource_id, start_date, end_date
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, allocations)
+        summary['allocations'] = len(allocations)
+
+    summary['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    cur.execute("""
+        INSERT INTO leveling_runs (
+            project_id, window_start, window_end, tasks_leveled, allocations,
+            unallocated, shifted_tasks, elapsed_ms
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, (project_id, summary['window_start'], summary['window_end'], summary['tasks'],
+          summary['allocations'], summary['unallocated'], summary['shifted'], summary['elapsed_ms']))
+    cur.execute("""
+        DELETE FROM leveling_runs
+        WHERE project_id = %s AND run_id < (
+            SELECT MIN(run_id) FROM (
+                SELECT run_id FROM leveling_runs
+                WHERE project_id = %s
+                ORDER BY run_id DESC
+                LIMIT %s
+            ) kept
+        )
+    """, (project_id, project_id, RUNS_KEPT))
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Level worker and equipment allocations')
+    parser.add_argument('--project', type=int, help='level this project')
+    parser.add_argument('--all', action='store_true', help='level every active project')
+    args = parser.parse_args()
+
+    if not args.project and not args.all:
+        parser.error('pass --project N or --all')
+
+    from app import app, mysql
+
+    with app.app_context():
+        cur = mysql.connection.cursor()
+        try:
+            if args.all:
+                cur.execute("""
+                    SELECT project_id FROM projects
+                    WHERE status NOT IN ('completed', 'cancelled')
+                    ORDER BY start_date, project_id
+                """)
+                project_ids = [row['project_id'] for row in cur.fetchall()]
+            else:
+                project_ids = [args.project]
+            for project_id in project_ids:
+                result = level_project(cur, project_id)
+                mysql.connection.commit()
+                print(f"Project {project_id}: {result['allocations']} allocations for "
+                      f"{result['tasks']} tasks, {result['unallocated']} unallocated, "
+                      f"{result['shifted']} shifted, {result['elapsed_ms']} ms")
+        finally:
+            cur.close()
@@ -0,0 +1,146 @@
+# Critical path (CPM) scheduling over a project's task dependency graph.
+# Tasks are ordered with Kahn's topological sort, then a forward pass gives
+# the earliest start/finish and a backward pass the latest start/finish of
+# every task, so a whole project is scheduled in O(tasks + dependencies).
+# Schedules are cached in report_cache under the project's data_version, which
+# task and dependency edits bump.
+import pickle
+from collections import deque
+from datetime import timedelta
+
+from report_cache import report_cache, project_version
+
+
+class ScheduleError(ValueError):
+    pass
+
+
+def task_duration(task):
+    """Working length in days: estimated_days, else the planned span."""
+    if task['estimated_days']:
+        return max(int(task['estimated_days']), 0)
+    if task['planned_start_date'] and task['planned_end_date']:
+        return max((task['planned_end_date'] - task['planned_start_date']).days + 1, 0)
+    return 0
+
+
+def compute_schedule(tasks, dependencies, finish_by=None):
+    """Run the forward/backward pass.
+
+    tasks are rows with task_id, planned_start_date, planned_end_date and
+    estimated_days; dependencies are (predecessor_id, successor_id, lag_days).
+    A task never starts before its planned start date, so tasks without
+    predecessors keep their planned offset from the project start.
+    finish_by (a date) starts the backward pass no earlier than that day's
+    end, so a part of a project keeps the whole project's slack.
+    """
+    if not tasks:
+        return {'start': None, 'finish': None, 'duration': 0, 'tasks': {}, 'critical_path': []}
+
+    project_start = min(t['planned_start_date'] for t in tasks if t['planned_start_date'])
+    duration = {}
+    release = {}
+    for task in tasks:
+        task_id = task['task_id']
+        duration[task_id] = task_duration(task)
+        start = task['planned_start_date']
+        release[task_id] = (start - project_start).days if start else 0
+
+    successors = {task_id: [] for task_id in duration}
+    predecessors = {task_id: [] for task_id in duration}
+    indegree = dict.fromkeys(duration, 0)
+    for predecessor_id, successor_id, lag in dependencies:
+        if predecessor_id not in duration or successor_id not in duration:
+            continue
+        successors[predecessor_id].append((successor_id, lag or 0))
+        predecessors[successor_id].append((predecessor_id, lag or 0))
+        indegree[successor_id] += 1
+
+    # Kahn's algorithm; anything left over sits on a cycle
+    queue = deque(task_id for task_id, count in indegree.items() if count == 0)
+    order = []
+    while queue:
+        task_id = queue.popleft()
+        order.append(task_id)
+        for successor_id, _ in successors[task_id]:
+            indegree[successor_id] -= 1
+            if indegree[successor_id] == 0:
+                queue.append(successor_id)
+    if len(order) != len(duration):
+        cycle = sorted(task_id for task_id, count in indegree.items() if count > 0)
+        raise ScheduleError(f"Task dependencies form a cycle through tasks {cycle[:10]}")
+
+    # Forward pass: earliest start/finish
+    early_start = {}
+    early_finish = {}
+    for task_id in order:
+        start = release[task_id]
+        for predecessor_id, lag in predecessors[task_id]:
+            start = max(start, early_finish[predecessor_id] + lag)
+        early_start[task_id] = start
+        early_finish[task_id] = start + duration[task_id]
+    finish = max(early_finish.values())
+    if finish_by:
+        finish = max(finish, (finish_by - project_start).days + 1)
+
+    # Backward pass: latest finish/start
+    late_start = {}
+    late_finish = {}
+    for task_id in reversed(order):
+        end = finish
+        for successor_id, lag in successors[task_id]:
+            end = min(end, late_start[successor_id] - lag)
+        late_finish[task_id] = end
+        late_start[task_id] = end - duration[task_id]
+
+    schedule = {}
+    critical_path = []
+    for task_id in order:
+        slack = late_start[task_id] - early_start[task_id]
+        schedule[task_id] = {
+            'early_start': project_start + timedelta(days=early_start[task_id]),
+            'early_finish': project_start + timedelta(days=early_finish[task_id]),
+            'late_start': project_start + timedelta(days=late_start[task_id]),
+            'late_finish': project_start + timedelta(days=late_finish[task_id]),
+            'slack': slack,
+            'critical': slack == 0
+        }
+        if slack == 0:
+            critical_path.append(task_id)
+
+    return {
+        'start': project_start,
+        'finish': project_start + timedelta(days=finish),
+        'duration': finish,
+        'tasks': schedule,
+        'critical_path': critical_path
+    }
+
+
+def load_dependencies(cur, project_id):
+    cur.execute("""
+        SELECT d.predecessor_id, d.successor_id, d.lag_days
+        FROM task_dependencies d
+        JOIN tasks t ON t.task_id = d.successor_id
+        WHERE t.project_id = %s
+    """, (project_id,))
+    return [(row['predecessor_id'], row['successor_id'], row['lag_days']) for row in cur.fetchall()]
+
+
+def project_schedule(cur, project_id, tasks=None):
+    """Cached schedule for a project; pass tasks if they are already loaded."""
+    version = project_version(cur, project_id)
+    data = report_cache.get('schedule', project_id, version)
+    if data is not None:
+        return pickle.loads(data)
+
+    if tasks is None:
+        cur.execute("""
+            SELECT task_id, planned_start_date, planned_end_date, estimated_days
+            FROM tasks
+            WHERE project_id = %s
+        """, (project_id,))
+        tasks = cur.fetchall()
+    schedule = compute_schedule(tasks, load_dependencies(cur, project_id))
+    report_cache.put('schedule', project_id, version, pickle.dumps(schedule))
+    return schedule
@@ -0,0 +1,219 @@
+# Arbitrary-depth task hierarchies.
+# A task's subtree is loaded with one closure-table join (plus one query for
+# the latest progress per task) and assembled in Python; ancestor/descendant
+# lookups and subtree rollups then run in memory.
+#
+# task_closure holds one (ancestor, descendant, depth) row for every pair in a
+# hierarchy, including a depth-0 row per task, so the subtree below any task is
+# a single indexed join. add_task, edit_task and delete_task keep it in step
+# through add_to_closure(), move_in_closure() and delete_subtree();
+# `python task_tree.py --rebuild` regenerates it from parent_task_id.
+import argparse
+from decimal import Decimal
+
+
+class TaskTree:
+    def __init__(self, tasks):
+        self.tasks = {t['task_id']: t for t in tasks}
+        self.children = {}
+        self.roots = []
+        for task in tasks:
+            parent_id = task['parent_task_id']
+            if parent_id is None or parent_id not in self.tasks:
+                self.roots.append(task['task_id'])
+            else:
+                self.children.setdefault(parent_id, []).append(task['task_id'])
+
+    def ancestors(self, task_id):
+        """Parent first, root last."""
+        result = []
+        parent_id = self.tasks[task_id]['parent_task_id']
+        while parent_id is not None and parent_id in self.tasks and parent_id not in result:
+            result.append(parent_id)
+            parent_id = self.tasks[parent_id]['parent_task_id']
+        return result
+
+    def descendants(self, task_id):
+        """Depth-first (pre-order) list of (task_id, depth) below task_id."""
+        result = []
+        stack = [(child, 1) for child in reversed(self.children.get(task_id, []))]
+        while stack:
+            current, depth = stack.pop()
+            result.append((current, depth))
+            stack.extend((child, depth + 1) for child in reversed(self.children.get(current, [])))
+        return result
+
+    def subtree_ids(self, task_id):
+        return [task_id] + [t for t, _ in self.descendants(task_id)]
+
+    def rollup(self, task_id):
+        """Cost and progress of a task together with all its descendants.
+
+        Progress is weighted by estimated cost (falling back to a plain
+        average when nothing is estimated).
+        """
+        ids = self.subtree_ids(task_id)
+        estimated = Decimal('0')
+        actual = Decimal('0')
+        weighted = Decimal('0')
+        plain = Decimal('0')
+        for tid in ids:
+            task = self.tasks[tid]
+            cost = Decimal(str(task['estimated_cost'] or 0))
+            progress = Decimal(str(task.get('progress') or 0))
+            estimated += cost
+            actual += Decimal(str(task['actual_cost'] or 0))
+            weighted += cost * progress
+            plain += progress
+        progress = weighted / estimated if estimated else plain / len(ids)
+        return {
+            'task_count': len(ids),
+            'estimated_cost': estimated,
+            'actual_cost': actual,
+            'progress': round(float(progress), 2)
+        }
+
+
+def _attach_progress(cur, tasks, latest_sql, params):
+    # Latest recorded percentage per task (completed tasks count as 100)
+    cur.execute(f"""
+        SELECT dp.task_id, dp.percentage_completed
+        FROM daily_progress dp
+        JOIN ({latest_sql}) latest ON latest.progress_id = dp.progress_id
+    """, params)
+    latest = {row['task_id']: row['percentage_completed'] for row in cur.fetchall()}
+    for task in tasks:
+        task['progress'] = 100 if task['status'] == 'completed' else latest.get(task['task_id'], 0)
+
+
+def load_subtree(cur, task_id):
+    """Load only a task and its descendants through the closure table."""
+    cur.execute("""
+        SELECT t.*
+        FROM task_closure c
+        JOIN tasks t ON t.task_id = c.descendant_id
+        WHERE c.ancestor_id = %s
+        ORDER BY t.planned_start_date, t.task_id
+    """, (task_id,))
+    tasks = list(cur.fetchall())
+    _attach_progress(cur, tasks, """
+        SELECT p.task_id, MAX(p.progress_id) as progress_id
+        FROM daily_progress p
+        JOIN task_closure c ON p.task_id = c.descendant_id
+        WHERE c.ancestor_id = %s
+        GROUP BY p.task_id
+    """, (task_id,))
+    return TaskTree(tasks)
+
+
+def subtree_ids(cur, task_id):
+    cur.execute("SELECT descendant_id FROM task_closure WHERE ancestor_id = %s", (task_id,))
+    return [row['descendant_id'] for row in cur.fetchall()]
+
+
+def add_to_closure(cur, task_id, parent_task_id=None):
+    """Link a newly inserted task under its parent's ancestors."""
+    cur.execute("""
+        INSERT INTO task_closure (ancestor_id, descendant_id, depth)
+        SELECT ancestor_id, %s, depth + 1
+        FROM task_closure
+        WHERE descendant_id = %s
+        UNION ALL
+        SELECT %s, %s, 0
+    """, (task_id, parent_task_id, task_id, task_id))
+
+
+def move_in_closure(cur, task_id, parent_task_id=None):
+    """Re-link a task's subtree under a new parent (None makes it a root).
+
+    The caller must make sure the new parent is not inside the subtree.
+    """
+    # Drop the links from ancestors outside the subtree into it
+    cur.execute("""
+        DELETE link
+        FROM task_closure link
+        JOIN task_closure sub
+            ON sub.descendant_id = link.descendant_id AND sub.ancestor_id = %s
+        LEFT JOIN task_closure moved
+            ON moved.ancestor_id = %s AND moved.descendant_id = link.ancestor_id
+        WHERE moved.ancestor_id IS NULL
+    """, (task_id, task_id))
+    if parent_task_id is None:
+        return
+    # Cross join the new parent's ancestors with every node of the subtree
+    cur.execute("""
+        INSERT INTO task_closure (ancestor_id, descendant_id, depth)
+        SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1
+        FROM task_closure above
+        JOIN task_closure below
+        WHERE above.descendant_id = %s
+          AND below.ancestor_id = %s
+    """, (parent_task_id, task_id))
+
+
+def delete_subtree(cur, task_id):
+    """Delete a task, all its descendants and their rows. Caller commits."""
+    ids = subtree_ids(cur, task_id) or [task_id]
+    placeholders = ', '.join(['%s'] * len(ids))
+    for table in ('task_assignments', 'task_materials', 'daily_progress', 'task_cost_ledger',
+                  'resource_allocations', 'task_resource_needs'):
+        cur.execute(f"DELETE FROM {table} WHERE task_id IN ({placeholders})", ids)
+    cur.execute(f"DELETE FROM task_closure WHERE descendant_id IN ({placeholders})", ids)
+    cur.execute(f"""
+        DELETE FROM task_dependencies
+        WHERE predecessor_id IN ({placeholders}) OR successor_id IN ({placeholders})
+    """, ids + ids)
+    # Detach the subtree first so the self-referencing key never blocks the delete
+    cur.execute(f"UPDATE tasks SET parent_task_id = NULL WHERE task_id IN ({placeholders})", ids)
+    cur.execute(f"DELETE FROM tasks WHERE task_id IN ({placeholders})", ids)
+    return ids
+
+
+def rebuild_closure(cur, project_id=None):
+    """Regenerate task_closure from parent_task_id. Returns the row count."""
+    where = "WHERE t.project_id = %s" if project_id else ""
+    params = (project_id,) if project_id else ()
+    cur.execute(f"SELECT t.task_id, t.parent_task_id FROM tasks t {where}", params)
+    tree = TaskTree(list(cur.fetchall()))
+
+    rows = []
+    for task_id in tree.tasks:
+        rows.append((task_id, task_id, 0))
+        for depth, ancestor_id in enumerate(tree.ancestors(task_id), start=1):
+            rows.append((ancestor_id, task_id, depth))
+
+    if project_id:
+        cur.execute("""
+            DELETE c FROM task_closure c
+            JOIN tasks t ON t.task_id = c.descendant_id
+            WHERE t.project_id = %s
+        """, (project_id,))
+    else:
+        cur.execute("DELETE FROM task_closure")
+    for start in range(0, len(rows), 1000):
+        cur.executemany("""
+            INSERT INTO task_closure (ancestor_id, descendant_id, depth)
+            VALUES (%s, %s, %s)
+        """, rows[start:start + 1000])
+    return len(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild the task ancestry (closure) index')
+    parser.add_argument('--rebuild', action='store_true', help='regenerate task_closure')
+    parser.add_argument('--project', type=int, help='only rebuild this project')
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.error('nothing to do; pass --rebuild')
+
+    from app import app, mysql
+
+    with app.app_context():
+        cur = mysql.connection.cursor()
+        try:
+            count = rebuild_closure(cur, args.project)
+            mysql.connection.commit()
+        finally:
+            cur.close()
+    print(f"Rebuilt task_closure with {count} rows")
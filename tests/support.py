@@ -0,0 +1,162 @@
+# In-memory SQLite stand-in for the MySQL connection in tests and benchmarks.
+# Only the columns the code under test reads are created; queries keep their
+# MySQL %s placeholders and rows come back as dicts, like MySQLdb's DictCursor,
+# with REAL values as Decimal the way MySQL returns DECIMAL columns.
+import sqlite3
+from datetime import date
+from decimal import Decimal
+
+SCHEMA = """
+CREATE TABLE projects (
+    project_id INTEGER PRIMARY KEY,
+    project_name TEXT,
+    start_date DATE,
+    end_date DATE,
+    estimated_budget REAL DEFAULT 0,
+    status TEXT DEFAULT 'planned',
+    data_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE tasks (
+    task_id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    task_name TEXT,
+    parent_task_id INTEGER,
+    planned_start_date DATE,
+    planned_end_date DATE,
+    estimated_days INTEGER,
+    estimated_cost REAL,
+    actual_cost REAL DEFAULT 0,
+    status TEXT DEFAULT 'not_started'
+);
+CREATE TABLE workers (
+    worker_id INTEGER PRIMARY KEY,
+    name TEXT,
+    specialization TEXT,
+    daily_wage REAL
+);
+CREATE TABLE task_assignments (
+    assignment_id INTEGER PRIMARY KEY,
+    task_id INTEGER NOT NULL,
+    worker_id INTEGER NOT NULL,
+    assignment_date DATE,
+    hours_worked REAL NOT NULL
+);
+CREATE TABLE task_materials (
+    task_material_id INTEGER PRIMARY KEY,
+    task_id INTEGER NOT NULL,
+    material_id INTEGER,
+    quantity REAL,
+    total_cost REAL,
+    date_used DATE
+);
+CREATE TABLE task_closure (
+    ancestor_id INTEGER NOT NULL,
+    descendant_id INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (ancestor_id, descendant_id)
+);
+CREATE TABLE daily_progress (
+    progress_id INTEGER PRIMARY KEY,
+    task_id INTEGER NOT NULL,
+    progress_date DATE,
+    percentage_completed REAL
+);
+CREATE TABLE task_dependencies (
+    predecessor_id INTEGER NOT NULL,
+    successor_id INTEGER NOT NULL,
+    lag_days INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (predecessor_id, successor_id)
+);
+CREATE TABLE task_cost_ledger (
+    task_id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    labor_cost REAL NOT NULL DEFAULT 0,
+    material_cost REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE equipment (
+    equipment_id INTEGER PRIMARY KEY,
+    equipment_type TEXT,
+    status TEXT DEFAULT 'available',
+    assigned_project INTEGER
+);
+CREATE TABLE task_resource_needs (
+    need_id INTEGER PRIMARY KEY,
+    task_id INTEGER NOT NULL,
+    resource_type TEXT,
+    skill TEXT,
+    quantity INTEGER
+);
+CREATE TABLE resource_allocations (
+    allocation_id INTEGER PRIMARY KEY,
+    project_id INTEGER,
+    task_id INTEGER NOT NULL,
+    need_id INTEGER,
+    resource_type TEXT,
+    resource_id INTEGER,
+    start_date DATE,
+    end_date DATE
+);
+CREATE TABLE leveling_runs (
+    run_id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    window_start DATE,
+    window_end DATE,
+    tasks_leveled INTEGER,
+    allocations INTEGER,
+    unallocated INTEGER,
+    shifted_tasks INTEGER,
+    elapsed_ms REAL
+);
+CREATE INDEX idx_tasks_project ON tasks (project_id);
+CREATE INDEX idx_tasks_project_start ON tasks (project_id, planned_start_date);
+CREATE INDEX idx_task_dependencies_successor ON task_dependencies (successor_id);
+CREATE INDEX idx_needs_task ON task_resource_needs (task_id);
+CREATE INDEX idx_allocations_task ON resource_allocations (task_id);
+CREATE INDEX idx_allocations_resource ON resource_allocations (resource_type, resource_id, end_date);
+CREATE INDEX idx_allocations_project_start ON resource_allocations (project_id, start_date);
+CREATE INDEX idx_tasks_parent_start ON tasks (parent_task_id, planned_start_date);
+CREATE INDEX idx_assignments_task ON task_assignments (task_id);
+CREATE INDEX idx_task_materials_task ON task_materials (task_id);
+CREATE INDEX idx_closure_descendant ON task_closure (descendant_id);
+"""
+
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+
+
+class Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._cursor = conn.cursor()
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace('%s', '?'), tuple(params))
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(sql.replace('%s', '?'), [tuple(row) for row in rows])
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @staticmethod
+    def _row(row):
+        return {key: Decimal(repr(value)) if isinstance(value, float) else value
+                for key, value in dict(row).items()}
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return self._row(row) if row is not None else None
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+def connect():
+    conn = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
@@ -0,0 +1,107 @@
+import random
+
+import pytest
+
+from cost_engine import TASK_COSTS_SQL, project_costs, task_costs
+from tests.support import Cursor, connect
+
+# The query project_details() ran before cost_engine: assignments and
+# materials joined onto tasks together
+CARTESIAN_SQL = """
+    SELECT
+        COALESCE(SUM(ta.hours_worked * (w.daily_wage / 8)), 0) as labor_cost,
+        COALESCE(SUM(tm.total_cost), 0) as material_cost
+    FROM tasks t
+    LEFT JOIN task_assignments ta ON t.task_id = ta.task_id
+    LEFT JOIN workers w ON ta.worker_id = w.worker_id
+    LEFT JOIN task_materials tm ON t.task_id = tm.task_id
+    WHERE t.project_id = %s
+"""
+
+
+def seed(cur, projects=3, tasks_per_project=20, seed_value=7):
+    rng = random.Random(seed_value)
+    for worker_id in range(1, 11):
+        cur.execute("INSERT INTO workers (worker_id, name, daily_wage) VALUES (%s, %s, %s)",
+                    (worker_id, f'Worker {worker_id}', rng.choice([600, 800, 1000, 1200])))
+    for project_id in range(1, projects + 1):
+        cur.execute("INSERT INTO projects (project_id, project_name) VALUES (%s, %s)",
+                    (project_id, f'Project {project_id}'))
+        for _ in range(tasks_per_project):
+            cur.execute("INSERT INTO tasks (project_id, task_name) VALUES (%s, 'task')", (project_id,))
+            task_id = cur.lastrowid
+            # Some tasks get neither side, some only one, most several of both
+            for _ in range(rng.choice([0, 1, 3, 5])):
+                cur.execute("""
+                    INSERT INTO task_assignments (task_id, worker_id, hours_worked)
+                    VALUES (%s, %s, %s)
+                """, (task_id, rng.randint(1, 10), rng.choice([2, 4, 8])))
+            for _ in range(rng.choice([0, 1, 2, 4])):
+                cur.execute("INSERT INTO task_materials (task_id, total_cost) VALUES (%s, %s)",
+                            (task_id, rng.choice([150, 999.5, 2500])))
+
+
+def task_details_costs(cur, task_id):
+    """Labor and material cost the way task_details() computes them."""
+    cur.execute("""
+        SELECT ta.*, w.daily_wage
+        FROM task_assignments ta
+        JOIN workers w ON ta.worker_id = w.worker_id
+        WHERE ta.task_id = %s
+    """, (task_id,))
+    assignments = cur.fetchall()
+    cur.execute("SELECT * FROM task_materials WHERE task_id = %s", (task_id,))
+    materials = cur.fetchall()
+    labor_cost = sum(a['hours_worked'] * (a['daily_wage'] / 8) for a in assignments) if assignments else 0
+    material_cost = sum(m['total_cost'] or 0 for m in materials) if materials else 0
+    return labor_cost, material_cost
+
+
+@pytest.fixture
+def cur():
+    conn = connect()
+    cursor = Cursor(conn)
+    seed(cursor)
+    yield cursor
+    conn.close()
+
+
+def test_task_costs_match_task_details(cur):
+    for project_id in (1, 2, 3):
+        costs = task_costs(cur, project_id)
+        assert len(costs) == 20
+        for task_id, row in costs.items():
+            labor_cost, material_cost = task_details_costs(cur, task_id)
+            assert row['labor_cost'] == pytest.approx(labor_cost)
+            assert row['material_cost'] == pytest.approx(material_cost)
+
+
+def test_project_totals_equal_sum_of_tasks(cur):
+    for project_id in (1, 2, 3):
+        cur.execute("SELECT task_id FROM tasks WHERE project_id = %s", (project_id,))
+        per_task = [task_details_costs(cur, row['task_id']) for row in cur.fetchall()]
+        labor_cost, material_cost = project_costs(cur, project_id)
+        assert labor_cost == pytest.approx(sum(labor for labor, _ in per_task))
+        assert material_cost == pytest.approx(sum(material for _, material in per_task))
+
+
+def test_cartesian_join_inflated_totals(cur):
+    # Guards the seed: with several assignments and materials per task the
+    # old query over-counts, so the tests above would catch a regression
+    cur.execute(CARTESIAN_SQL, (1,))
+    inflated = cur.fetchone()
+    labor_cost, material_cost = project_costs(cur, 1)
+    assert inflated['labor_cost'] > labor_cost
+    assert inflated['material_cost'] > material_cost
+
+
+def test_projects_do_not_leak(cur):
+    cur.execute("INSERT INTO projects (project_id, project_name) VALUES (4, 'Empty')")
+    assert task_costs(cur, 4) == {}
+    assert project_costs(cur, 4) == (0, 0)
+
+
+def test_one_row_per_task(cur):
+    cur.execute(TASK_COSTS_SQL, (2, 2, 2))
+    task_ids = [row['task_id'] for row in cur.fetchall()]
+    assert len(task_ids) == len(set(task_ids)) == 20
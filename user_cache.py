@@ -0,0 +1,70 @@
+# User identity cache.
+# Lookups are memoized per request on flask.g and process-wide in a small
+# TTL/LRU cache, so authenticated page loads normally run no users query.
+# Call invalidate_user() whenever a user row changes.
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g
+
+USER_CACHE_TTL = 300
+USER_CACHE_SIZE = 1024
+
+
+class TTLCache:
+    def __init__(self, ttl=USER_CACHE_TTL, maxsize=USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+_users = TTLCache()
+
+
+def get_cached_user(user_id, loader):
+    """Return the user dict for user_id, calling loader(user_id) on a miss."""
+    user_id = int(user_id)
+    memo = g.setdefault('_user_memo', {})
+    if user_id in memo:
+        return memo[user_id]
+
+    user = _users.get(user_id)
+    if user is None:
+        user = loader(user_id)
+        if user is not None:
+            _users.set(user_id, user)
+
+    memo[user_id] = user
+    return user
+
+
+def invalidate_user(user_id):
+    _users.invalidate(int(user_id))
+    memo = g.get('_user_memo')
+    if memo:
+        memo.pop(int(user_id), None)
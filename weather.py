@@ -0,0 +1,272 @@
+# Weather data for project sites.
+# Geocodes are cached permanently per projects.location and forecasts until
+# the next 3-hour forecast step, both in MySQL (shared by every process) with
+# an in-process layer in front. Concurrent requests for the same key are
+# coalesced into one upstream call, and all calls share one pooled HTTP
+# session with strict timeouts. Cache rows are written on the caller's
+# connection and committed with the caller's transaction.
+#
+# Warm the cache for every active project, e.g. from cron each morning:
+#     python weather.py --prefetch --workers 4 --rate 1
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+GEO_URL = 'http://api.openweathermap.org/geo/1.0/direct'
+FORECAST_URL = 'https://api.openweathermap.org/data/2.5/forecast'
+FORECAST_STEP = 3 * 60 * 60
+TIMEOUT = (3.05, 10)
+MAX_FORECASTS = 1000
+
+
+class WeatherError(Exception):
+    pass
+
+
+def next_forecast_step(now=None):
+    """Epoch seconds of the next 3-hour forecast boundary."""
+    now = time.time() if now is None else now
+    return (int(now) // FORECAST_STEP + 1) * FORECAST_STEP
+
+
+def coord_key(lat, lon):
+    return f"{float(lat):.4f},{float(lon):.4f}"
+
+
+class RateLimiter:
+    # Spaces upstream calls at least 1/rate seconds apart across threads
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class _SingleFlight:
+    # At most one call per key runs at a time; others wait for its result
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'event': threading.Event()}
+        if not leader:
+            call['event'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+
+class WeatherClient:
+    def __init__(self, api_key, geo_url=GEO_URL, forecast_url=FORECAST_URL,
+                 timeout=TIMEOUT, pool_size=10, rate_limiter=None,
+                 max_forecasts=MAX_FORECASTS):
+        self.api_key = api_key
+        self.max_forecasts = max_forecasts
+        self.rate_limiter = rate_limiter
+        self.geo_url = geo_url
+        self.forecast_url = forecast_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._geocodes = {}
+        self._forecasts = {}
+        self._forecasts_lock = threading.Lock()
+        self._flights = _SingleFlight()
+        self.stats = {'geocode_hits': 0, 'geocode_fetches': 0,
+                      'forecast_hits': 0, 'forecast_fetches': 0}
+
+    def _get(self, url, params):
+        if self.rate_limiter:
+            self.rate_limiter.wait()
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise WeatherError(f'Weather service unavailable: {e}')
+
+    def geocode(self, conn, location):
+        """Return (lat, lon) for a project location.
+
+        A new geocode is written to conn but not committed.
+        """
+        cached = self._geocodes.get(location)
+        if cached:
+            self.stats['geocode_hits'] += 1
+            return cached
+
+        def load():
+            cur = conn.cursor()
+            try:
+                cur.execute("""
+                    SELECT lat, lon FROM weather_geocode_cache WHERE location = %s
+                """, (location,))
+                row = cur.fetchone()
+                if row:
+                    self.stats['geocode_hits'] += 1
+                    return float(row['lat']), float(row['lon'])
+
+                self.stats['geocode_fetches'] += 1
+                geo_data = self._get(self.geo_url, {'q': location, 'limit': 1, 'appid': self.api_key})
+                if not geo_data:
+                    raise WeatherError('Location not found in weather service')
+                coords = (geo_data[0]['lat'], geo_data[0]['lon'])
+                cur.execute("""
+                    INSERT INTO weather_geocode_cache (location, lat, lon) VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE lat = VALUES(lat), lon = VALUES(lon)
+                """, (location, coords[0], coords[1]))
+                return coords
+            finally:
+                cur.close()
+
+        coords = self._flights.do(('geo', location), load)
+        self._geocodes[location] = coords
+        return coords
+
+    def forecast(self, conn, lat, lon):
+        """Return the raw 5-day/3-hour forecast payload for a coordinate.
+
+        A new forecast is written to conn but not committed.
+        """
+        key = coord_key(lat, lon)
+        with self._forecasts_lock:
+            cached = self._forecasts.get(key)
+        if cached and cached[0] > time.time():
+            self.stats['forecast_hits'] += 1
+            return cached[1]
+
+        def load():
+            cur = conn.cursor()
+            try:
+                cur.execute("""
+                    SELECT payload, expires_at FROM weather_forecast_cache
+                    WHERE coord_key = %s AND expires_at > %s
+                """, (key, int(time.time())))
+                row = cur.fetchone()
+                if row:
+                    self.stats['forecast_hits'] += 1
+                    return row['expires_at'], json.loads(row['payload'])
+
+                self.stats['forecast_fetches'] += 1
+                weather_data = self._get(self.forecast_url, {
+                    'lat': lat, 'lon': lon, 'appid': self.api_key, 'units': 'metric'
+                })
+                if 'list' not in weather_data:
+                    raise WeatherError('Weather forecast not available')
+                expires_at = next_forecast_step()
+                cur.execute("""
+                    INSERT INTO weather_forecast_cache (coord_key, payload, expires_at)
+                    VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE payload = VALUES(payload), expires_at = VALUES(expires_at)
+                """, (key, json.dumps(weather_data), expires_at))
+                return expires_at, weather_data
+            finally:
+                cur.close()
+
+        entry = self._flights.do(('forecast', key), load)
+        self._remember_forecast(key, entry)
+        return entry[1]
+
+    def _remember_forecast(self, key, entry):
+        # Drop expired entries once the cache is full, then the ones expiring soonest
+        with self._forecasts_lock:
+            forecasts = self._forecasts
+            if key not in forecasts and len(forecasts) >= self.max_forecasts:
+                now = time.time()
+                for stale in [k for k, (expires_at, _) in forecasts.items() if expires_at <= now]:
+                    del forecasts[stale]
+                while len(forecasts) >= self.max_forecasts:
+                    del forecasts[min(forecasts, key=lambda k: forecasts[k][0])]
+            forecasts[key] = entry
+
+    def location_forecast(self, conn, location):
+        lat, lon = self.geocode(conn, location)
+        return self.forecast(conn, lat, lon)
+
+
+def active_locations(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT DISTINCT location FROM projects
+        WHERE status = 'in_progress' AND location IS NOT NULL AND location <> ''
+    """)
+    locations = [row['location'] for row in cur.fetchall()]
+    cur.close()
+    return locations
+
+
+def prefetch_forecasts(client, locations, checkout, checkin, workers=4):
+    """Geocode and fetch forecasts for locations on a bounded thread pool.
+
+    checkout/checkin lend each worker its own database connection, which
+    commits its own cache rows. Returns {location: error message or None}.
+    """
+    def fetch(location):
+        conn = checkout()
+        try:
+            client.location_forecast(conn, location)
+            conn.commit()
+        finally:
+            checkin(conn)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch, location): location for location in locations}
+        for future in as_completed(futures):
+            error = future.exception()
+            results[futures[future]] = str(error) if error else None
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Weather cache maintenance')
+    parser.add_argument('--prefetch', action='store_true',
+                        help='warm the forecast cache for all in-progress projects')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent fetches')
+    parser.add_argument('--rate', type=float, default=1.0, help='max upstream calls per second')
+    args = parser.parse_args()
+
+    if args.prefetch:
+        from app import app, mysql, weather_client
+
+        weather_client.rate_limiter = RateLimiter(args.rate)
+        with app.app_context():
+            locations = active_locations(mysql.connection)
+            pool = mysql.get_pool()
+            started = time.monotonic()
+            results = prefetch_forecasts(weather_client, locations, pool.checkout, pool.checkin,
+                                         workers=args.workers)
+        for location, error in sorted(results.items()):
+            print(f"{location}: {error or 'ok'}")
+        print(f"Prefetched {len(results)} locations in {time.monotonic() - started:.1f}s "
+              f"({weather_client.stats['forecast_fetches']} forecast and "
+              f"{weather_client.stats['geocode_fetches']} geocode calls)")
@@ -0,0 +1,148 @@
+# Weather risk for upcoming outdoor tasks.
+# Cached forecasts are turned into NumPy arrays (rain, wind, temperature per
+# 3-hour slot) and joined against the planned windows of every task of a
+# location in one broadcast, so hundreds of projects cost a couple of cache
+# reads and no weather API calls.
+import json
+from datetime import date, datetime, time as dt_time, timedelta
+
+import numpy as np
+
+from weather import coord_key
+
+RAIN_MM = 2.5         # rain per 3-hour slot that stops outdoor work
+WIND_MS = 12.0        # sustained wind speed (m/s) unsafe for cranes/scaffolding
+HOT_C = 40.0
+COLD_C = 2.0
+
+
+def forecast_arrays(payload):
+    """Slot timestamps (epoch s) and rain/wind/temp arrays for a forecast."""
+    items = payload.get('list', [])
+    ts = np.fromiter((item['dt'] for item in items), dtype=np.int64, count=len(items))
+    rain = np.fromiter((item.get('rain', {}).get('3h', 0) for item in items), dtype=float, count=len(items))
+    wind = np.fromiter((item['wind']['speed'] for item in items), dtype=float, count=len(items))
+    temp = np.fromiter((item['main']['temp'] for item in items), dtype=float, count=len(items))
+    return ts, rain, wind, temp
+
+
+def _epoch(day):
+    if isinstance(day, str):
+        day = datetime.strptime(day, '%Y-%m-%d').date()
+    return int(datetime.combine(day, dt_time.min).timestamp())
+
+
+def assess_tasks(tasks, arrays):
+    """Return {task_id: risk dict} for tasks sharing one forecast.
+
+    tasks need task_id, planned_start_date and planned_end_date; only tasks
+    whose window overlaps the forecast get an entry.
+    """
+    ts, rain, wind, temp = arrays
+    if not tasks or not len(ts):
+        return {}
+
+    starts = np.array([_epoch(t['planned_start_date']) for t in tasks], dtype=np.int64)
+    ends = np.array([_epoch(t['planned_end_date']) + 86400 for t in tasks], dtype=np.int64)
+
+    # tasks x slots: which forecast slots fall inside each task's window
+    in_window = (ts[None, :] >= starts[:, None]) & (ts[None, :] < ends[:, None])
+    wet = rain >= RAIN_MM
+    windy = wind >= WIND_MS
+    extreme = (temp >= HOT_C) | (temp <= COLD_C)
+    hazard = wet | windy | extreme
+
+    covered = in_window.sum(axis=1)
+    risky = (in_window & hazard).sum(axis=1)
+    wet_slots = (in_window & wet).sum(axis=1)
+    windy_slots = (in_window & windy).sum(axis=1)
+    extreme_slots = (in_window & extreme).sum(axis=1)
+    max_rain = np.where(in_window, rain[None, :], 0).max(axis=1)
+    max_wind = np.where(in_window, wind[None, :], 0).max(axis=1)
+
+    risks = {}
+    for i in np.nonzero(covered)[0]:
+        reasons = []
+        if wet_slots[i]:
+            reasons.append(f"rain up to {max_rain[i]:.1f} mm/3h")
+        if windy_slots[i]:
+            reasons.append(f"wind up to {max_wind[i]:.1f} m/s")
+        if extreme_slots[i]:
+            reasons.append('extreme temperature')
+        share = risky[i] / covered[i]
+        risks[tasks[i]['task_id']] = {
+            'at_risk': bool(risky[i]),
+            'risk_level': 'high' if share >= 0.25 else 'medium' if risky[i] else 'none',
+            'risky_slots': int(risky[i]),
+            'forecast_slots': int(covered[i]),
+            'reason': ', '.join(reasons)
+        }
+    return risks
+
+
+def cached_forecasts(conn, locations):
+    """Map location -> unexpired forecast payload using only the weather caches."""
+    locations = list(set(locations))
+    if not locations:
+        return {}
+    cur = conn.cursor()
+    placeholders = ', '.join(['%s'] * len(locations))
+    cur.execute(f"""
+        SELECT location, lat, lon FROM weather_geocode_cache WHERE location IN ({placeholders})
+    """, locations)
+    keys = {row['location']: coord_key(row['lat'], row['lon']) for row in cur.fetchall()}
+    if not keys:
+        cur.close()
+        return {}
+
+    unique_keys = list(set(keys.values()))
+    placeholders = ', '.join(['%s'] * len(unique_keys))
+    # Expired forecasts are kept until overwritten; only read current ones
+    cur.execute(f"""
+        SELECT coord_key, payload FROM weather_forecast_cache
+        WHERE coord_key IN ({placeholders}) AND expires_at > %s
+    """, unique_keys + [int(datetime.now().timestamp())])
+    payloads = {row['coord_key']: row['payload'] for row in cur.fetchall()}
+    cur.close()
+
+    parsed = {key: json.loads(payload) for key, payload in payloads.items()}
+    return {location: parsed[key] for location, key in keys.items() if key in parsed}
+
+
+def upcoming_outdoor_tasks(conn, project_id=None, horizon_days=5):
+    cur = conn.cursor()
+    today = date.today()
+    sql = """
+        SELECT t.task_id, t.task_name, t.project_id, p.project_name, p.location,
+               t.planned_start_date, t.planned_end_date, t.status
+        FROM tasks t
+        JOIN projects p ON t.project_id = p.project_id
+        WHERE t.is_outdoor = 1
+          AND t.status <> 'completed'
+          AND t.planned_end_date >= %s
+          AND t.planned_start_date <= %s
+          AND p.location IS NOT NULL AND p.location <> ''
+    """
+    params = [today, today + timedelta(days=horizon_days)]
+    if project_id is not None:
+        sql += " AND t.project_id = %s"
+        params.append(project_id)
+    cur.execute(sql + " ORDER BY t.planned_start_date", params)
+    tasks = cur.fetchall()
+    cur.close()
+    return tasks
+
+
+def weather_risks(conn, tasks):
+    """Assess tasks (with a 'location' key) grouped by location."""
+    by_location = {}
+    for task in tasks:
+        by_location.setdefault(task['location'], []).append(task)
+
+    forecasts = cached_forecasts(conn, by_location.keys())
+    risks = {}
+    for location, location_tasks in by_location.items():
+        payload = forecasts.get(location)
+        if payload:
+            risks.update(assess_tasks(location_tasks, forecast_arrays(payload)))
+    return risks
@@ -0,0 +1,145 @@
+# Worker calendar: booked hours per worker per day and week, across projects.
+# Everything reads task_assignments through idx_assignments_worker_date
+# (worker_id, assignment_date, hours_worked), so an overbooking check is a
+# handful of index point lookups and the heatmap is one range scan per worker
+# over the window shown, however many assignment rows the table holds.
+# Writers check with lock=True: the workers' rows stay locked until the
+# booking commits, so two requests booking the same worker run one after the
+# other instead of both passing the check.
+from datetime import date, timedelta
+from decimal import Decimal
+
+STANDARD_DAY_HOURS = 8
+WORK_DAYS_PER_WEEK = 6
+STANDARD_WEEK_HOURS = STANDARD_DAY_HOURS * WORK_DAYS_PER_WEEK
+MAX_DAY_HOURS = 12
+MAX_WEEK_HOURS = 60
+
+
+def _date(value):
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value).strip())
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def lock_workers(cur, worker_ids):
+    """Lock the workers' rows (in id order) until the transaction ends."""
+    worker_ids = sorted({int(worker_id) for worker_id in worker_ids})
+    for start in range(0, len(worker_ids), 1000):
+        batch = worker_ids[start:start + 1000]
+        cur.execute(f"""
+            SELECT worker_id FROM workers
+            WHERE worker_id IN ({', '.join(['%s'] * len(batch))})
+            ORDER BY worker_id
+            FOR UPDATE
+        """, batch)
+        cur.fetchall()
+
+
+def booked_hours(cur, pairs, lock=False):
+    """{(worker_id, date): hours} already booked for (worker_id, date) pairs.
+
+    lock=True locks the workers first and reads the latest committed hours
+    rather than the transaction's snapshot.
+    """
+    pairs = sorted({(int(worker_id), _date(day)) for worker_id, day in pairs})
+    if lock:
+        lock_workers(cur, [worker_id for worker_id, _ in pairs])
+    booked = {}
+    for start in range(0, len(pairs), 500):
+        batch = pairs[start:start + 500]
+        placeholders = ', '.join(['(%s, %s)'] * len(batch))
+        cur.execute(f"""
+            SELECT worker_id, assignment_date, SUM(hours_worked) AS hours
+            FROM task_assignments
+            WHERE (worker_id, assignment_date) IN ({placeholders})
+            GROUP BY worker_id, assignment_date
+            {'LOCK IN SHARE MODE' if lock else ''}
+        """, [value for pair in batch for value in pair])
+        for row in cur.fetchall():
+            booked[(row['worker_id'], row['assignment_date'])] = Decimal(str(row['hours']))
+    return booked
+
+
+def overbookings(cur, entries, limit=MAX_DAY_HOURS, lock=False):
+    """Worker-days that would go over limit once entries are booked.
+
+    entries: (worker_id, date, hours) about to be inserted; returns
+    [(worker_id, date, total_hours)]. Pass lock=True when the entries are
+    inserted in the same transaction (see booked_hours).
+    """
+    new = {}
+    for worker_id, day, hours in entries:
+        key = (int(worker_id), _date(day))
+        new[key] = new.get(key, Decimal('0')) + Decimal(str(hours))
+    booked = booked_hours(cur, new, lock)
+    flagged = []
+    for key, hours in sorted(new.items()):
+        total = booked.get(key, Decimal('0')) + hours
+        if total > limit:
+            flagged.append((key[0], key[1], total))
+    return flagged
+
+
+def utilization(cur, start, end, workers):
+    """Daily and weekly hours of each worker between two dates (inclusive).
+
+    workers: rows with worker_id. Returns the day and week axes and, per
+    worker_id, the hour series, utilization against a standard week and the
+    number of days and weeks over the limits.
+    """
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    weeks = sorted({week_start(d) for d in days})
+    day_index = {d: i for i, d in enumerate(days)}
+    week_index = {w: i for i, w in enumerate(weeks)}
+
+    result = {}
+    for worker in workers:
+        result[worker['worker_id']] = {
+            'daily': [0.0] * len(days),
+            'weekly': [0.0] * len(weeks)
+        }
+
+    worker_ids = sorted(result)
+    for offset in range(0, len(worker_ids), 1000):
+        batch = worker_ids[offset:offset + 1000]
+        placeholders = ', '.join(['%s'] * len(batch))
+        cur.execute(f"""
+            SELECT worker_id, assignment_date, SUM(hours_worked) AS hours
+            FROM task_assignments
+            WHERE worker_id IN ({placeholders}) AND assignment_date BETWEEN %s AND %s
+            GROUP BY worker_id, assignment_date
+        """, batch + [start, end])
+        for row in cur.fetchall():
+            series = result[row['worker_id']]
+            hours = float(row['hours'] or 0)
+            series['daily'][day_index[row['assignment_date']]] += hours
+            series['weekly'][week_index[week_start(row['assignment_date'])]] += hours
+
+    # Partial weeks at either end of the window count pro rata
+    capacity = len(days) / 7 * STANDARD_WEEK_HOURS
+    for series in result.values():
+        total = sum(series['daily'])
+        series['total'] = round(total, 2)
+        series['utilization'] = round(total / capacity * 100, 1) if capacity else 0.0
+        series['overbooked_days'] = sum(1 for h in series['daily'] if h > MAX_DAY_HOURS)
+        series['overbooked_weeks'] = sum(1 for h in series['weekly'] if h > MAX_WEEK_HOURS)
+
+    return {'days': days, 'weeks': weeks, 'workers': result}
+
+
+def heat_level(hours, standard=STANDARD_WEEK_HOURS, limit=MAX_WEEK_HOURS):
+    """Heatmap bucket for a cell: idle, low, normal, full or over."""
+    if hours > limit:
+        return 'over'
+    if not hours:
+        return 'idle'
+    if hours < standard * 0.5:
+        return 'low'
+    if hours < standard:
+        return 'normal'
+    return 'full'